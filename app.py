@@ -9,27 +9,51 @@ from renderer import load_renderer
 from routes.upload import register_upload_routes
 from routes.download import register_download_routes
 from routes.session_clean import register_session_clean_routes
+from routes.metrics import register_metrics_routes
+from routes.events import register_events_routes
+from routes.resumable import register_resumable_routes
 from rmeta_core.utils.chunking import audit_files, chunk_files_by_size, process_chunks
 from rmeta_core.utils.system import get_available_memory_mb
-from rmeta_core.utils.cleanup import purge_uploads, check_uploads_dir, start_auto_cleanup, stop_all_cleanup
+from rmeta_core.utils.cleanup import purge_uploads
+from utils.scheduler import scheduler, stop_all_cleanup
+from flask import session as flask_session
+from utils.sessions import session_path, purge_stale_sessions
+from utils.usage import usage_index
+from utils.jobs import job_queue
+from routes import handler_registry
+from utils.admission import admission
+from utils.dedup_cache import scrub_cache
+from utils.metrics import metrics
+from utils.storage import spool, storage_backend
+from utils.textstream import text_streamer
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
 
 def handle_shutdown(signum, frame):
-    """Handle shutdown signals gracefully"""
+    """Handle shutdown signals gracefully.
+
+    Only this process's timers and cache are dropped. The upload folder is
+    shared with other workers (and, in tmpfs mode, holds the quota and
+    admission ledgers), so it is purged by the gunicorn master's on_exit
+    or, for a single-process server, by the atexit hook in main().
+    """
     print(f"Received shutdown signal ({signum}). Cleaning up...")
     stop_all_cleanup()
-    purge_uploads("uploads")
+    scrub_cache.clear()
     sys.exit(0)
 
 # Register signal handlers for graceful shutdown
 signal.signal(signal.SIGINT, handle_shutdown)   # Ctrl+C
 signal.signal(signal.SIGTERM, handle_shutdown)  # Docker/Gunicorn
 
-# Also register atexit for other shutdown scenarios
-atexit.register(lambda: (stop_all_cleanup(), purge_uploads("uploads")))
+# Also register atexit for other shutdown scenarios. Only stop our own timers
+# here: under gunicorn this runs whenever a worker is recycled, and the other
+# workers' sessions are still live.
+atexit.register(stop_all_cleanup)
 
 def create_app():
-    """Build and configure the Flask app: load config, purge stale uploads,
-    start the cleanup timer, then wire up routes."""
+    """Build and configure the Flask app: load config, purge stale sessions,
+    configure the cleanup scheduler, then wire up routes."""
     config = load_config()
     if config is None:
         raise RuntimeError("Configuration could not be loaded!")
@@ -37,16 +61,40 @@ def create_app():
     upload_folder = config.get("UPLOAD_FOLDER", "uploads")
     session_timeout = config.get("SESSION_TIMEOUT", 600)
 
-    startup_cleanup = purge_uploads(upload_folder)
-    if startup_cleanup:
-        print("Startup cleanup completed")
+    stale_sessions = purge_stale_sessions(upload_folder, session_timeout)
+    if stale_sessions:
+        print(f"Startup cleanup removed {stale_sessions} stale sessions")
+
+    spool.configure(
+        storage_backend(config),
+        session_quota_mb=config.get("SESSION_QUOTA_MB", 0),
+        total_quota_mb=config.get("STORAGE_QUOTA_MB", 0),
+    )
+    scheduler.configure(session_timeout, root=upload_folder)
+    job_queue.configure(config.get("JOB_WORKERS", 1))
+    text_streamer.configure(config.get("TEXT_STREAM_MIN_MB", 256), workers=config.get("TEXT_STREAM_WORKERS", 0))
+    scrub_cache.configure(
+        config.get("SCRUB_CACHE_MB", 0),
+        ttl=session_timeout,
+        shared=config.get("SCRUB_CACHE_SHARED", False),
+    )
+    metrics.configure(config.get("METRICS_ENABLED", False), upload_folder)
+    admission.configure(
+        upload_folder,
+        min_mem_mb=config.get("MIN_MEM_MB", 512),
+        budget_mb=config.get("ADMISSION_BUDGET_MB", 0),
+    )
 
-    start_auto_cleanup(upload_folder, session_timeout)
+    preload = config.get("HANDLER_PRELOAD", "").strip()
+    if preload:
+        handler_registry.preload("all" if preload.lower() == "all" else preload.split(","))
 
     renderer = load_renderer(config)
     app = renderer.app
+    if app is None:
+        raise RuntimeError(f"RENDERER_TYPE={config.get('RENDERER_TYPE')} has no web app; run it with `python app.py`")
 
-    has_dirty_data = check_uploads_dir(upload_folder)
+    has_dirty_data = usage_index.reconcile(upload_folder)["sessions"] > 0
     app.config["HAS_DIRTY_DATA"] = has_dirty_data
 
     secret_key = config.get("SECRET_KEY")
@@ -55,17 +103,24 @@ def create_app():
 
     for key, value in config.items():
         app.config[key] = value
+    if spool.session_quota:
+        app.config["MAX_CONTENT_LENGTH"] = spool.session_quota  # Oversized form posts get a 413 before they are read
 
     @app.context_processor
     def inject_dirty_state():
-        """Inject current dirty state into all templates"""
-        has_dirty = check_uploads_dir(app.config.get("UPLOAD_FOLDER", "uploads"))
-        app.config["HAS_DIRTY_DATA"] = has_dirty
-        return {"has_dirty_data": has_dirty}
+        """Inject the current user's session dirty state into all templates"""
+        session_id = flask_session.get("session_id")
+        if not session_id:
+            return {"has_dirty_data": False}
+        session_dir = session_path(app.config.get("UPLOAD_FOLDER", "uploads"), session_id)
+        return {"has_dirty_data": usage_index.session_has_data(session_dir)}
 
     register_upload_routes(app)
     register_download_routes(app, config)
     register_session_clean_routes(app)
+    register_metrics_routes(app)
+    register_events_routes(app)
+    register_resumable_routes(app)
 
     setattr(app, "renderer", renderer)
     setattr(app, "custom_config", config)
@@ -73,13 +128,26 @@ def create_app():
     return app
 
 def main():
-    """Entry point: build the app, configure logging, and run it."""
+    """Entry point: build the app (or the headless CLI runner), configure logging, and run it."""
+    config = load_config()
+    if config.get("RENDERER_TYPE") == "cli":
+        # No Flask app, scheduler or job queue: just walk and scrub a tree
+        logging.basicConfig(level=config.get("LOG_LEVEL", "INFO"), format=LOG_FORMAT)
+        load_renderer(config).run()
+        return
+
     app = create_app()
 
+    # Only a single-process server may wipe the whole upload folder at exit;
+    # forked gunicorn workers would inherit the hook, so the gunicorn
+    # renderer purges from its master instead.
+    if app.renderer.single_process:  # type: ignore
+        atexit.register(purge_uploads, app.config.get("UPLOAD_FOLDER", "uploads"))
+
     log_level = app.config.get("LOG_LEVEL", "INFO")
     logging.basicConfig(
         level=log_level,
-        format="%(asctime)s [%(levelname)s] %(message)s"
+        format=LOG_FORMAT
     )
 
     print("Registered routes:")
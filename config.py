@@ -4,6 +4,7 @@ import os
 import logging
 import secrets
 from dotenv import load_dotenv
+from utils.storage import StorageError, storage_backend
 
 logger = logging.getLogger(__name__)
 
@@ -23,22 +24,54 @@ def load_config():
         "LOG_LEVEL": os.getenv("LOG_LEVEL", "INFO"),
         "UPLOAD_FOLDER": os.getenv("UPLOAD_FOLDER", "uploads"),
         "SESSIONS_ROOT": os.getenv("SESSIONS_ROOT", "uploads"),
+        "STORAGE_BACKEND": os.getenv("STORAGE_BACKEND", "disk").lower(),  # disk (UPLOAD_FOLDER) or tmpfs (RAM only)
+        "STORAGE_TMPFS_PATH": os.getenv("STORAGE_TMPFS_PATH", "/dev/shm/rmeta"),  # Spool root for the tmpfs backend
+        "SESSION_QUOTA_MB": int(os.getenv("SESSION_QUOTA_MB", 0)),  # Bytes one session may upload; 0 = unlimited
+        "STORAGE_QUOTA_MB": int(os.getenv("STORAGE_QUOTA_MB", 0)),  # All sessions together; 0 = tmpfs size / unlimited on disk
         "ALLOW_HASH": os.getenv("ALLOW_HASH", "true").lower() == "true",
         "ALLOW_GPG": os.getenv("ALLOW_GPG", "true").lower() == "true",
         "MAX_HANDLER_TIMEOUT": int(os.getenv("MAX_HANDLER_TIMEOUT", 30)),
         "MIN_MEM_MB": int(os.getenv("MIN_MEM_MB", 512)),
+        "ADMISSION_BUDGET_MB": int(os.getenv("ADMISSION_BUDGET_MB", 0)),  # 0 = free memory at startup minus MIN_MEM_MB
+        "SCRUB_EXECUTOR": os.getenv("SCRUB_EXECUTOR", "thread").lower(),  # thread, process, async or serial
+        "SCRUB_WORKERS": int(os.getenv("SCRUB_WORKERS", 0)),  # 0 = size from CPUs and free memory
+        "HANDLER_PRELOAD": os.getenv("HANDLER_PRELOAD", ""),  # "all" or e.g. "jpg,pdf,xlsx"
+        "GPG_WORKERS": int(os.getenv("GPG_WORKERS", 2)),  # Concurrent gpg processes per batch
+        "SCRUB_CACHE_MB": int(os.getenv("SCRUB_CACHE_MB", 0)),  # In-memory dedup cache; 0 = off
+        "SCRUB_CACHE_SHARED": os.getenv("SCRUB_CACHE_SHARED", "false").lower() == "true",  # Keep cache entries after their session is removed (opt-in)
+        "PROBE_SKIP_CLEAN": os.getenv("PROBE_SKIP_CLEAN", "false").lower() == "true",  # Don't rewrite files the probe finds clean (opt-in)
+        "TEXT_STREAM_MIN_MB": int(os.getenv("TEXT_STREAM_MIN_MB", 256)),  # TXT/CSV this big are checked in parallel line ranges; 0 = off
+        "TEXT_STREAM_WORKERS": int(os.getenv("TEXT_STREAM_WORKERS", 0)),  # Processes for streamed text; 0 = CPU count
+        "RESUMABLE_CHUNK_MB": int(os.getenv("RESUMABLE_CHUNK_MB", 8)),  # Chunk size for the resumable upload API
+        "RESUMABLE_MAX_MB": int(os.getenv("RESUMABLE_MAX_MB", 16384)),  # Largest chunked upload (all files together)
+        "ARCHIVE_MAX_MEMBERS": int(os.getenv("ARCHIVE_MAX_MEMBERS", 10000)),  # Uploaded ZIPs with more members are rejected
+        "ARCHIVE_MAX_TOTAL_MB": int(os.getenv("ARCHIVE_MAX_TOTAL_MB", 2048)),  # Uncompressed size limit per uploaded ZIP
+        "ARCHIVE_MAX_RATIO": int(os.getenv("ARCHIVE_MAX_RATIO", 100)),  # Decompression-ratio limit (zip bomb guard)
+        "METRICS_ENABLED": os.getenv("METRICS_ENABLED", "false").lower() == "true",  # Serve /metrics for Prometheus
+        "JOB_WORKERS": int(os.getenv("JOB_WORKERS", 1)),  # Background upload jobs run at once, per process
+        "RENDERER_TYPE": os.getenv("RENDERER_TYPE", "flask").lower(),  # flask (dev server), gunicorn or cli
+        "CLI_SOURCE": os.getenv("CLI_SOURCE", ""),  # cli renderer: tree to scrub (or pass it as an argument)
+        "CLI_OUTPUT": os.getenv("CLI_OUTPUT", ""),  # cli renderer: where the scrubbed mirror tree goes
+        "CLI_BATCH": int(os.getenv("CLI_BATCH", 256)),  # cli renderer: files per scrub batch
+        "GUNICORN_WORKERS": int(os.getenv("GUNICORN_WORKERS", 0)),  # 0 = CPUs, capped by free memory / MIN_MEM_MB
+        "GUNICORN_THREADS": int(os.getenv("GUNICORN_THREADS", 0)),  # 0 = ~4 per CPU across workers
+        "GUNICORN_WORKER_CLASS": os.getenv("GUNICORN_WORKER_CLASS", "gthread").lower(),  # gthread or sync
+        "GUNICORN_TIMEOUT": int(os.getenv("GUNICORN_TIMEOUT", 120)),
+        "GUNICORN_MAX_REQUESTS": int(os.getenv("GUNICORN_MAX_REQUESTS", 0)),  # Recycle workers after this many requests; 0 = never (jobs run in workers)
+        "GUNICORN_MAX_REQUESTS_JITTER": int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 50)),
         "SECRET_KEY": os.getenv("SECRET_KEY") or secrets.token_hex(32),  # Secure default
     }
     
-    # Create upload directory if it doesn't exist
-    upload_dir = config["UPLOAD_FOLDER"]
-    if not os.path.exists(upload_dir):
-        try:
-            os.makedirs(upload_dir, exist_ok=True)
-            logger.info(f"Created upload directory: {upload_dir}")
-        except Exception as e:
-            logger.error(f"Failed to create upload directory {upload_dir}: {e}")
-            raise RuntimeError(f"Cannot create upload directory: {e}")
+    # Create the spool (upload directory) if it doesn't exist. A RAM-backed
+    # spool replaces UPLOAD_FOLDER/SESSIONS_ROOT for every route.
+    try:
+        backend = storage_backend(config)
+        backend.prepare()
+    except (StorageError, OSError) as e:
+        logger.error(f"Failed to prepare {config['STORAGE_BACKEND']} upload storage: {e}")
+        raise RuntimeError(f"Cannot create upload directory: {e}")
+    if not backend.persistent:
+        config["UPLOAD_FOLDER"] = config["SESSIONS_ROOT"] = backend.root
     
     logger.info(f"Configuration loaded: {len(config)} settings")
     return config
\ No newline at end of file
@@ -0,0 +1,378 @@
+# dev/bench.py
+"""
+Throughput benchmark for the upload pipeline.
+
+Builds a corpus from the burndown generators (N files of roughly M MB each,
+cycling through the requested types), then drives create_app() end to end
+through the Flask test client: upload, poll the job until it finishes,
+render the index and download the ZIP bundle. Reports files/s, MB/s,
+per-request latency percentiles and per-stage timings and peak RSS, and
+writes everything as JSON so runs can be compared between releases.
+
+Usage:
+    python dev/bench.py --files 40 --size-mb 2 --types jpg,pdf,docx --uploads 5
+    python dev/bench.py --encrypt --out bench_0.6.json --compare bench_0.5.json
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+
+DEV_DIR = Path(__file__).resolve().parent
+REPO_ROOT = DEV_DIR.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(DEV_DIR))
+
+import burndown_test
+from utils.stages import stage_recorder, percentile
+
+GENERATORS = {
+    "txt": burndown_test.create_txt,
+    "csv": burndown_test.create_csv,
+    "docx": burndown_test.create_docx,
+    "pdf": burndown_test.create_pdf,
+    "xlsx": burndown_test.create_xlsx,
+    "jpg": burndown_test.create_jpg,
+}
+POLL_INTERVAL = 0.05
+JOB_TIMEOUT = 600
+
+
+# --- Corpus -----------------------------------------------------------------
+
+def _noise_image(rng, target_bytes, bytes_per_pixel):
+    from PIL import Image
+    side = max(16, int((target_bytes / bytes_per_pixel) ** 0.5))
+    return Image.frombytes("RGB", (side, side), rng.randbytes(side * side * 3))
+
+
+def _grow_text(base, dest, target_bytes, rng, line):
+    with open(base, "rb") as src, open(dest, "wb") as out:
+        shutil.copyfileobj(src, out)
+        written, i = out.tell(), 0
+        while written < target_bytes:
+            block = "".join(line(i + n, rng) for n in range(1000)).encode()
+            out.write(block)
+            written += len(block)
+            i += 1000
+
+
+def _grow_jpg(base, dest, target_bytes, rng):
+    from PIL import Image
+    exif = Image.open(base).info.get("exif", b"")
+    img = _noise_image(rng, target_bytes, 2.5)
+    img.save(dest, format="JPEG", quality=90, exif=exif)
+
+
+def _grow_pdf(base, dest, target_bytes, rng):
+    from pypdf import PdfWriter
+    writer = PdfWriter(clone_from=str(base))
+    writer.add_attachment("padding.bin", rng.randbytes(max(0, target_bytes - os.path.getsize(base))))
+    with open(dest, "wb") as f:
+        writer.write(f)
+
+
+def _grow_docx(base, dest, target_bytes, rng):
+    from docx import Document
+    doc = Document(str(base))
+    picture = io.BytesIO()
+    _noise_image(rng, target_bytes, 3).save(picture, format="PNG", compress_level=1)
+    picture.seek(0)
+    doc.add_picture(picture)
+    doc.save(str(dest))
+
+
+def _grow_xlsx(base, dest, target_bytes, rng):
+    from openpyxl import load_workbook
+    wb = load_workbook(base)
+    ws = wb.active
+    for i in range(target_bytes // 45):  # ~45 bytes per zipped row
+        ws.append([f"Person {i}", f"user{i}@example.com", rng.randbytes(12).hex()])
+    wb.save(dest)
+
+
+GROWERS = {
+    "txt": lambda b, d, t, r: _grow_text(b, d, t, r, lambda i, r: f"Note {i}: {r.randbytes(16).hex()}\n"),
+    "csv": lambda b, d, t, r: _grow_text(b, d, t, r, lambda i, r: f"Person {i},user{i}@example.com,{r.randint(100, 999)}-{r.randint(10, 99)}-{r.randint(1000, 9999)}\n"),
+    "jpg": _grow_jpg,
+    "pdf": _grow_pdf,
+    "docx": _grow_docx,
+    "xlsx": _grow_xlsx,
+}
+
+
+def build_corpus(out_dir, count, size_mb, types, seed):
+    """
+    Generate count files cycling through types, each grown to about size_mb.
+
+    Every file gets random padding so none are byte-identical (the scrub
+    cache would otherwise turn the run into a cache benchmark). size_mb=0
+    keeps the generators' tiny originals.
+
+    Returns:
+        list[Path]: The corpus files.
+    """
+    rng = random.Random(seed)
+    base_dir = Path(out_dir) / "base"
+    base_dir.mkdir(parents=True, exist_ok=True)
+    bases = {ext: GENERATORS[ext](base_dir) for ext in types}
+
+    corpus_dir = Path(out_dir) / "corpus"
+    corpus_dir.mkdir(exist_ok=True)
+    target_bytes = int(size_mb * 1024 * 1024)
+    paths = []
+    for i in range(count):
+        ext = types[i % len(types)]
+        dest = corpus_dir / f"{i:05d}_dirty.{ext}"
+        if target_bytes:
+            GROWERS[ext](bases[ext], dest, target_bytes, rng)
+        else:
+            shutil.copyfile(bases[ext], dest)
+        paths.append(dest)
+    return paths
+
+
+def make_gpg_key(workdir):
+    """Generate a throwaway public key for the encrypt stage. Returns its path."""
+    homedir = Path(workdir) / "gnupg"
+    homedir.mkdir(mode=0o700)
+    gpg = ["gpg", "--homedir", str(homedir), "--batch", "--yes", "--pinentry-mode", "loopback", "--passphrase", ""]
+    subprocess.run(gpg + ["--quick-gen-key", "bench@example.invalid", "default", "default", "never"],
+                   check=True, capture_output=True)
+    key_path = Path(workdir) / "bench_key.asc"
+    key = subprocess.run(gpg + ["--armor", "--export", "bench@example.invalid"], check=True, capture_output=True)
+    key_path.write_bytes(key.stdout)
+    return key_path
+
+
+# --- Driving the app ---------------------------------------------------------
+
+def tmpfs_spool(workdir):
+    return f"/dev/shm/{Path(workdir).name}"
+
+
+def build_app(workdir, args):
+    uploads = str(Path(workdir) / "uploads")
+    os.environ.update({
+        "UPLOAD_FOLDER": uploads,
+        "SESSIONS_ROOT": uploads,
+        "STORAGE_BACKEND": args.storage,
+        "STORAGE_TMPFS_PATH": tmpfs_spool(workdir),
+        "SCRUB_EXECUTOR": args.executor,
+        "SCRUB_WORKERS": str(args.workers),
+        "SCRUB_CACHE_MB": "0",
+        "HANDLER_PRELOAD": "all",
+        "LOG_LEVEL": "WARNING",
+    })
+    from app import create_app
+    app = create_app()
+    app.config["TESTING"] = True
+    return app
+
+
+def upload_once(client, paths, args, key_path, latencies):
+    """Upload one batch and wait for its job. Returns (job seconds, final status)."""
+    handles = [open(p, "rb") for p in paths]
+    data = {"file": [(h, p.name) for h, p in zip(handles, paths)]}
+    if args.hash:
+        data["generate_hash"] = "on"
+    if args.fast_scrub:
+        data["fast_scrub"] = "on"
+    if key_path:
+        data["encrypt_file"] = "on"
+        handles.append(open(key_path, "rb"))
+        data["gpg_key"] = (handles[-1], "bench_key.asc")
+
+    try:
+        start = time.perf_counter()
+        resp = client.post("/", data=data, content_type="multipart/form-data",
+                           headers={"Accept": "application/json"})
+        latencies["upload"].append(time.perf_counter() - start)
+    finally:
+        for h in handles:
+            h.close()
+    if resp.status_code != 202:
+        raise RuntimeError(f"Upload returned {resp.status_code}: {resp.get_data(as_text=True)[:200]}")
+    body = resp.get_json()
+
+    status = None
+    while time.perf_counter() - start < JOB_TIMEOUT:
+        t = time.perf_counter()
+        status = client.get(body["status_url"]).get_json()
+        latencies["status"].append(time.perf_counter() - t)
+        if status and status.get("status") in ("done", "failed"):
+            break
+        time.sleep(POLL_INTERVAL)
+    job_s = time.perf_counter() - start
+
+    t = time.perf_counter()
+    client.get("/")
+    latencies["index"].append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    resp = client.get(f"/download/{body['job_id']}/bundle")
+    for _ in resp.response:
+        pass
+    latencies["bundle"].append(time.perf_counter() - t)
+    return job_s, status
+
+
+def _latency_summary(samples):
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "-C", str(REPO_ROOT), "rev-parse", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(args):
+    workdir = tempfile.mkdtemp(prefix="rmeta-bench-")
+    try:
+        types = [t.strip().lower() for t in args.types.split(",") if t.strip()]
+        unknown = [t for t in types if t not in GENERATORS]
+        if unknown:
+            raise SystemExit(f"No generator for: {', '.join(unknown)} (have {', '.join(GENERATORS)})")
+
+        corpus = build_corpus(workdir, args.files, args.size_mb, types, args.seed)
+        corpus_bytes = sum(p.stat().st_size for p in corpus)
+        key_path = make_gpg_key(workdir) if args.encrypt else None
+
+        app = build_app(workdir, args)
+        client = app.test_client()
+        latencies = {"upload": [], "status": [], "index": [], "bundle": []}
+
+        for _ in range(args.warmup):
+            upload_once(client, corpus, args, key_path, {k: [] for k in latencies})
+
+        stage_recorder.enable()
+        job_seconds, failed_jobs, failed_files = [], 0, 0
+        for n in range(args.uploads):
+            job_s, status = upload_once(client, corpus, args, key_path, latencies)
+            job_seconds.append(job_s)
+            if not status or status.get("status") != "done":
+                failed_jobs += 1
+            failed_files += sum(1 for f in (status or {}).get("files", []) if f.get("state") not in ("done", "skipped"))
+            print(f"upload {n + 1}/{args.uploads}: {len(corpus)} files in {job_s:.2f}s")
+        stage_recorder.disable()
+
+        wall_s = sum(job_seconds)
+        return {
+            "version": 1,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+            "corpus": {
+                "files": len(corpus),
+                "bytes": corpus_bytes,
+                "by_type": {t: sum(1 for p in corpus if p.suffix == f".{t}") for t in types},
+            },
+            "throughput": {
+                "uploads": len(job_seconds),
+                "wall_s": round(wall_s, 3),
+                "files_per_s": round(len(corpus) * len(job_seconds) / wall_s, 2) if wall_s else 0,
+                "mb_per_s": round(corpus_bytes * len(job_seconds) / (1024 * 1024) / wall_s, 2) if wall_s else 0,
+                "job_s": _latency_summary(job_seconds),
+            },
+            "latency_ms": {kind: _latency_summary(samples) for kind, samples in latencies.items()},
+            "stages": stage_recorder.snapshot(),
+            "peak_rss_mb": round(stage_recorder.run_peak_rss_mb(), 1),
+            "failed_jobs": failed_jobs,
+            "failed_files": failed_files,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        shutil.rmtree(tmpfs_spool(workdir), ignore_errors=True)
+
+
+def compare(report, baseline, tolerance):
+    """
+    Print throughput and p95 changes against a baseline report.
+
+    Returns:
+        list[str]: Metrics that regressed by more than tolerance.
+    """
+    regressions = []
+    checks = [("files_per_s", report["throughput"]["files_per_s"], baseline["throughput"]["files_per_s"], True)]
+    for kind, summary in report["latency_ms"].items():
+        if kind in baseline.get("latency_ms", {}):
+            checks.append((f"{kind} p95_ms", summary["p95_ms"], baseline["latency_ms"][kind]["p95_ms"], False))
+    for name, stats in report["stages"].items():
+        if name in baseline.get("stages", {}):
+            checks.append((f"{name} p95_ms", stats["p95_ms"], baseline["stages"][name]["p95_ms"], False))
+            checks.append((f"{name} peak_rss_mb", stats["peak_rss_mb"], baseline["stages"][name]["peak_rss_mb"], False))
+
+    for metric, now, then, higher_is_better in checks:
+        if not then:
+            continue
+        change = (now - then) / then
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        print(f"{metric:>24}: {then:>10} -> {now:>10} ({change:+.1%}){flag}")
+        if flag:
+            regressions.append(metric)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the rMeta upload pipeline end to end.")
+    parser.add_argument("--files", type=int, default=20, help="Files per upload")
+    parser.add_argument("--size-mb", type=float, default=1.0, help="Approximate size of each file (0 = generator default)")
+    parser.add_argument("--types", default=",".join(GENERATORS), help="Comma-separated file types to cycle through")
+    parser.add_argument("--uploads", type=int, default=5, help="Measured uploads of the whole corpus")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured uploads first")
+    parser.add_argument("--executor", default="thread", choices=("thread", "async", "serial"),
+                        help="SCRUB_EXECUTOR (process pools hide stage timings from this process)")
+    parser.add_argument("--workers", type=int, default=0, help="SCRUB_WORKERS (0 = auto)")
+    parser.add_argument("--no-hash", dest="hash", action="store_false", help="Skip the hash stage")
+    parser.add_argument("--encrypt", action="store_true", help="Run the GPG stage with a throwaway key")
+    parser.add_argument("--fast-scrub", action="store_true", help="Use the zero-decode JPEG/PNG scrub")
+    parser.add_argument("--storage", default="disk", choices=("disk", "tmpfs"),
+                        help="STORAGE_BACKEND for the upload spool (tmpfs uses /dev/shm)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--out", default="bench_results.json", help="Where to write the JSON report")
+    parser.add_argument("--compare", help="Baseline JSON report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed regression before failing (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    t = report["throughput"]
+    print(f"\n{t['files_per_s']} files/s, {t['mb_per_s']} MB/s over {t['uploads']} uploads; report in {args.out}")
+    for name, stats in report["stages"].items():
+        print(f"{name:>8}: p50 {stats['p50_ms']}ms  p95 {stats['p95_ms']}ms  peak RSS {stats['peak_rss_mb']}MB")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# dev/bench_fastscrub.py
+"""
+Head-to-head benchmark of the fast JPEG scrub against the image handler.
+
+Builds N JPEGs of roughly M MB each (the burndown JPEG, with its EXIF,
+grown by bench.py's generator), then scrubs a fresh copy of the corpus with
+each method in turn: rmeta-core's image_handler (decode + re-encode) and
+utils/fastscrub.py (segment walk, no decode). Reports files/s, MB/s,
+per-file p50/p95/p99 and peak RSS for each, output sizes, and how many
+outputs still decode to exactly the original pixels.
+
+Usage:
+    python dev/bench_fastscrub.py --files 10 --size-mb 8 --repeat 3
+    python dev/bench_fastscrub.py --out fastscrub.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+DEV_DIR = Path(__file__).resolve().parent
+REPO_ROOT = DEV_DIR.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(DEV_DIR))
+
+from bench import build_corpus, _git_commit
+from utils.stages import stage, stage_recorder
+from utils.fastscrub import fast_scrub
+
+
+def _pixels(path):
+    from PIL import Image
+    with Image.open(path) as img:
+        return img.tobytes()
+
+
+def _methods():
+    from routes import get_handler_for_extension
+    handler = get_handler_for_extension("jpg")
+    if not handler or not handler.get("scrub"):
+        raise SystemExit("No rmeta-core image handler available to compare against")
+    if handler.get("is_async"):
+        from utils.loop import run_async
+        return {"handler": lambda p: run_async(handler["scrub"](p)), "fast": fast_scrub}
+    return {"handler": handler["scrub"], "fast": fast_scrub}
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="rmeta-fastscrub-")
+    try:
+        corpus = build_corpus(workdir, args.files, args.size_mb, ["jpg"], args.seed)
+        corpus_bytes = sum(p.stat().st_size for p in corpus)
+        originals = {p.name: _pixels(p) for p in corpus} if args.check_pixels else {}
+
+        results = {}
+        stage_recorder.enable()
+        for name, scrub in _methods().items():
+            wall_s, out_bytes, identical = 0.0, 0, 0
+            for n in range(args.repeat):
+                run_dir = Path(workdir) / f"{name}-{n}"
+                run_dir.mkdir()
+                copies = [Path(shutil.copy(p, run_dir / p.name)) for p in corpus]
+                start = time.perf_counter()
+                for path in copies:
+                    with stage(name):
+                        scrub(str(path))
+                wall_s += time.perf_counter() - start
+                if n == 0:
+                    out_bytes = sum(p.stat().st_size for p in copies)
+                    if args.check_pixels:
+                        identical = sum(1 for p in copies if _pixels(p) == originals[p.name])
+                shutil.rmtree(run_dir)
+            print(f"{name:>8}: {len(corpus) * args.repeat} files in {wall_s:.2f}s")
+
+            scrubbed = len(corpus) * args.repeat
+            results[name] = {
+                "wall_s": round(wall_s, 3),
+                "files_per_s": round(scrubbed / wall_s, 2) if wall_s else 0,
+                "mb_per_s": round(corpus_bytes * args.repeat / (1024 * 1024) / wall_s, 2) if wall_s else 0,
+                "output_bytes": out_bytes,
+                "pixel_identical": identical if args.check_pixels else None,
+            }
+        stage_recorder.disable()
+
+        for name, stats in stage_recorder.snapshot().items():
+            results[name]["per_file"] = stats
+
+        handler_s, fast_s = results["handler"]["wall_s"], results["fast"]["wall_s"]
+        return {
+            "version": 1,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "cpu_count": os.cpu_count(),
+            "params": {k: v for k, v in vars(args).items() if k != "out"},
+            "corpus": {"files": len(corpus), "bytes": corpus_bytes},
+            "methods": results,
+            "speedup": round(handler_s / fast_s, 2) if fast_s else None,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the fast JPEG scrub with the image handler.")
+    parser.add_argument("--files", type=int, default=10, help="JPEGs in the corpus")
+    parser.add_argument("--size-mb", type=float, default=8.0, help="Approximate size of each JPEG")
+    parser.add_argument("--repeat", type=int, default=3, help="Scrubs of the whole corpus per method")
+    parser.add_argument("--no-pixel-check", dest="check_pixels", action="store_false",
+                        help="Skip decoding outputs to compare them with the originals")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--out", default="fastscrub_results.json", help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    report = run(args)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print()
+    for name, stats in report["methods"].items():
+        per_file = stats.get("per_file", {})
+        pixels = "" if stats["pixel_identical"] is None else f", {stats['pixel_identical']}/{report['corpus']['files']} pixel-identical"
+        print(f"{name:>8}: {stats['files_per_s']} files/s, {stats['mb_per_s']} MB/s, "
+              f"p95 {per_file.get('p95_ms')}ms, peak RSS {per_file.get('peak_rss_mb')}MB{pixels}")
+    print(f"\nfast scrub is {report['speedup']}x the handler; report in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
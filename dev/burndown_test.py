@@ -6,31 +6,33 @@ from docx import Document
 from pypdf import PdfWriter
 import csv
 
-# Destination folder
+# Destination folder (created when run as a script; dev/bench.py passes its own)
 OUT_DIR = Path("meta_dirty_bundle")
-OUT_DIR.mkdir(exist_ok=True)
 
-def create_txt():
-    path = OUT_DIR / "dirty.txt"
+def create_txt(out_dir=OUT_DIR):
+    path = Path(out_dir) / "dirty.txt"
     with open(path, "w") as f:
         f.write("Name: John Doe\nEmail: john@example.com\nPhone: 123-456-7890\n")
     os.utime(path, (1609459200, 1609459200))  # Jan 1, 2021
+    return path
 
-def create_csv():
-    path = OUT_DIR / "dirty.csv"
+def create_csv(out_dir=OUT_DIR):
+    path = Path(out_dir) / "dirty.csv"
     with open(path, "w", newline="") as f:
         writer = csv.writer(f)
         writer.writerow(["name", "email", "ssn"])
         writer.writerow(["Jane Roe", "jane@example.com", "123-45-6789"])
+    return path
 
-def create_docx():
-    path = OUT_DIR / "dirty.docx"
+def create_docx(out_dir=OUT_DIR):
+    path = Path(out_dir) / "dirty.docx"
     doc = Document()
     doc.add_paragraph("Author: MetaWriter\nSSN: 000-00-0000")
     doc.save(path) # type: ignore
+    return path
 
-def create_pdf():
-    path = OUT_DIR / "dirty.pdf"
+def create_pdf(out_dir=OUT_DIR):
+    path = Path(out_dir) / "dirty.pdf"
     writer = PdfWriter()
     writer.add_blank_page(width=72, height=72)
     writer.add_metadata({
@@ -40,10 +42,11 @@ def create_pdf():
     })
     with open(path, "wb") as f:
         writer.write(f)
+    return path
 
-def create_xlsx():
+def create_xlsx(out_dir=OUT_DIR):
     from openpyxl import Workbook
-    path = OUT_DIR / "dirty.xlsx"
+    path = Path(out_dir) / "dirty.xlsx"
     wb = Workbook()
     ws = wb.active
     ws.title = "MetaSheet" # type: ignore
@@ -52,16 +55,18 @@ def create_xlsx():
     ws['A2'] = "Rick" # type: ignore
     ws['B2'] = "rick@example.com" # type: ignore
     wb.save(path)
+    return path
 
-def create_jpg():
-    path = OUT_DIR / "dirty.jpg"
+def create_jpg(out_dir=OUT_DIR):
+    path = Path(out_dir) / "dirty.jpg"
     img = Image.new("RGB", (100, 100), color="red")
     draw = ImageDraw.Draw(img)
     draw.text((10, 40), "Meta", fill="white")
     exif_bytes = b"Exif\x00\x00" + b"\xff\xd8" * 10  # dummy EXIF
     img.save(path, exif=exif_bytes)
+    return path
 
-def create_heic():
+def create_heic(out_dir=OUT_DIR):
     pass
 
 def zip_payload():
@@ -72,6 +77,7 @@ def zip_payload():
     print(f"ZIP bundle created: {zip_path}")
 
 if __name__ == "__main__":
+    OUT_DIR.mkdir(exist_ok=True)
     create_txt()
     create_csv()
     create_docx()
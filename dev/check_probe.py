@@ -0,0 +1,87 @@
+# dev/check_probe.py
+"""
+Checks of the metadata probe and the fast PNG scrub on hand-built PNGs.
+
+PROBE_SKIP_CLEAN leaves a file alone when the probe returns [], so the
+probe must never call a PNG clean while it carries a chunk the fast scrub
+would have to drop. Each case below is a minimal 1x1 PNG built with struct
+and zlib (no imaging library needed) with one extra chunk spliced in; the
+script checks what probe_metadata reports for it and that fast_scrub
+leaves none of the chunk's payload behind.
+
+Exits non-zero if any case fails.
+
+Usage:
+    python dev/check_probe.py
+"""
+
+import sys
+import zlib
+import struct
+import tempfile
+from pathlib import Path
+
+DEV_DIR = Path(__file__).resolve().parent
+REPO_ROOT = DEV_DIR.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from utils.probe import probe_metadata
+from utils.fastscrub import fast_scrub, ICC_LABEL
+
+PAYLOAD = b"author=Jane Doe GPS=1,2"
+
+# (name, extra chunk type, expected probe result; None = "can't tell")
+CASES = [
+    ("plain", None, []),
+    ("rendering chunk", b"gAMA", []),
+    ("text chunk", b"tEXt", ["tEXt"]),
+    ("exif chunk", b"eXIf", ["eXIf"]),
+    ("colour profile", b"iCCP", [ICC_LABEL]),
+    ("private C2PA chunk", b"caBX", None),
+    ("unknown ancillary chunk", b"prVt", None),
+]
+
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def build_png(path, extra=None):
+    """A 1x1 greyscale PNG, with an extra chunk (carrying PAYLOAD) ahead of IDAT."""
+    chunks = [_chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0))]
+    if extra == b"gAMA":
+        chunks.append(_chunk(extra, struct.pack(">I", 45455)))
+    elif extra == b"iCCP":
+        chunks.append(_chunk(extra, b"sRGB\x00\x00" + zlib.compress(PAYLOAD)))
+    elif extra:
+        chunks.append(_chunk(extra, PAYLOAD))
+    chunks.append(_chunk(b"IDAT", zlib.compress(b"\x00\x00")))
+    chunks.append(_chunk(b"IEND", b""))
+    Path(path).write_bytes(b"\x89PNG\r\n\x1a\n" + b"".join(chunks))
+
+
+def check(name, extra, expected, workdir):
+    path = Path(workdir) / f"{name.replace(' ', '_')}.png"
+    build_png(path, extra)
+    found = probe_metadata(str(path))
+    ok = found == expected
+    if extra not in (None, b"gAMA", b"iCCP"):  # Chunks the fast scrub must drop
+        fast_scrub(str(path))
+        if PAYLOAD in path.read_bytes():
+            print(f"  FAIL {name}: payload still present after fast_scrub")
+            ok = False
+    print(f"  {'ok  ' if ok else 'FAIL'} {name}: probe returned {found!r}, expected {expected!r}")
+    return ok
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix="rmeta-probe-") as workdir:
+        failures = sum(not check(name, extra, expected, workdir) for name, extra, expected in CASES)
+    if failures:
+        print(f"\n{failures} of {len(CASES)} cases failed")
+        sys.exit(1)
+    print(f"\nAll {len(CASES)} cases passed")
+
+
+if __name__ == "__main__":
+    main()
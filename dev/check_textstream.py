@@ -0,0 +1,175 @@
+# dev/check_textstream.py
+"""
+Equivalence check between the streamed TXT/CSV path and the text handler.
+
+Files of TEXT_STREAM_MIN_MB or more never reach the handler's scrub; their
+bytes are left as uploaded and only the handler's message scan runs, range
+by range, in utils/textstream.py. This script makes sure the two size
+classes of the same file type come out byte for byte the same, i.e. that
+the handler's scrub still leaves plain text alone.
+
+It grows the burndown TXT and CSV fixtures with bench.py's generator, salts
+them with byte-order marks, zero-width and bidi characters, control
+characters (not NUL, which sends a file back to the handler), multi-byte
+UTF-8, tabs, CRLF line ends and an over-long line, then runs the handler's
+scrub on one copy and the streamer on another, using small ranges so every
+file is cut many times. It also compares the handler's message scan with
+the streamer's merged, rebased messages.
+
+Exits non-zero if any output differs, reporting the first differing offset.
+
+Usage:
+    python dev/check_textstream.py
+    python dev/check_textstream.py --size-mb 4 --range-kb 32 --seed 7
+    python dev/check_textstream.py --strict-messages
+"""
+
+import sys
+import random
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+DEV_DIR = Path(__file__).resolve().parent
+REPO_ROOT = DEV_DIR.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(DEV_DIR))
+
+from bench import build_corpus
+import utils.textstream as textstream
+
+# Spliced into the grown fixtures; both paths must leave every one of them in place
+SALT = [
+    b"\xef\xbb\xbf",             # U+FEFF
+    b"\xe2\x80\x8b",             # U+200B zero-width space
+    b"\xe2\x80\x8f",             # U+200F right-to-left mark
+    b"\xe2\x80\xae",             # U+202E right-to-left override
+    b"\xe2\x81\xa0",             # U+2060 word joiner
+    b"\xe2\x81\xa6",             # U+2066 left-to-right isolate
+    b"\x07",
+    b"\x1b",
+    b"\x7f",
+    b"\t",
+    b"\r\n",
+    "café 日本 \U0001f600".encode(),
+    b"\xe2\x80\x94",             # U+2014 em dash
+    b"\xe2\x81\xa5",             # U+2065 (unassigned)
+]
+
+
+def _salt(path, rng, every):
+    """Splice a SALT entry into every nth line at a random offset, and add one over-long line."""
+    lines = Path(path).read_bytes().split(b"\n")
+    for i in range(0, len(lines), every):
+        chunk = rng.choice(SALT)
+        line = lines[i]
+        cut = rng.randint(0, len(line))
+        while cut < len(line) and 0x80 <= line[cut] < 0xC0:
+            cut += 1  # Never split a UTF-8 character of the fixture itself
+        lines[i] = line[:cut] + chunk + line[cut:]
+    long_at = len(lines) // 2
+    lines[long_at] += b"".join(rng.choice(SALT) + b"x" * 50 for _ in range(8192))
+    Path(path).write_bytes(b"\n".join(lines))
+
+
+def _handler(ext):
+    from routes import get_handler_for_extension
+    handler = get_handler_for_extension(ext)
+    if not handler or not handler.get("scrub"):
+        raise SystemExit(f"No rmeta-core {ext} handler available to compare against")
+    return handler
+
+
+def _call(fn, is_async, path):
+    if is_async:
+        from utils.loop import run_async
+        return run_async(fn(path))
+    return fn(path)
+
+
+def _first_difference(a, b):
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return i
+    return min(len(a), len(b))
+
+
+def check(path, workdir, workers, strict_messages):
+    """Process path both ways. Returns True if the outputs match."""
+    ext = path.suffix.lstrip(".")
+    handler = _handler(ext)
+    whole = Path(shutil.copy(path, Path(workdir) / f"handler_{path.name}"))
+    streamed = Path(shutil.copy(path, Path(workdir) / f"stream_{path.name}"))
+
+    _call(handler["scrub"], handler.get("is_async"), str(whole))
+    expected_messages = []
+    if handler.get("get_additional_messages"):
+        expected_messages = list(_call(handler["get_additional_messages"], handler.get("msgs_is_async"), str(whole)))
+
+    streamer = textstream.TextStreamer()
+    streamer.configure(min_mb=0, workers=workers)
+    stats = streamer.scan(str(streamed))
+
+    expected, actual = whole.read_bytes(), streamed.read_bytes()
+    ok = expected == actual
+    if ok:
+        print(f"  ok   {path.name}: {len(actual)} bytes, {stats['ranges']} ranges")
+    else:
+        offset = _first_difference(expected, actual)
+        print(f"  FAIL {path.name}: handler {len(expected)} bytes, streamer {len(actual)} bytes, "
+              f"first difference at byte {offset}")
+        print(f"       handler:  {expected[max(0, offset - 16):offset + 16]!r}")
+        print(f"       streamer: {actual[max(0, offset - 16):offset + 16]!r}")
+
+    missing = [m for m in expected_messages if m not in stats["messages"]]
+    extra = [m for m in stats["messages"] if m not in expected_messages]
+    if missing or extra:
+        label = "FAIL" if strict_messages else "note"
+        print(f"  {label} {path.name}: messages differ ({len(missing)} only from the handler, "
+              f"{len(extra)} only from the streamer)")
+        for m in missing[:5]:
+            print(f"       handler only:  {m}")
+        for m in extra[:5]:
+            print(f"       streamer only: {m}")
+        ok = ok and not strict_messages
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the streamed TXT/CSV path against the text handler.")
+    parser.add_argument("--files", type=int, default=4, help="Files per type")
+    parser.add_argument("--size-mb", type=float, default=2.0, help="Approximate size of each file")
+    parser.add_argument("--types", default="txt,csv", help="Comma-separated types (txt, csv)")
+    parser.add_argument("--range-kb", type=int, default=64, help="Streamer range size, small to force many ranges")
+    parser.add_argument("--workers", type=int, default=2, help="Streamer worker processes")
+    parser.add_argument("--salt-every", type=int, default=7, help="Salt one line in this many")
+    parser.add_argument("--strict-messages", action="store_true", help="Also fail if the message scans differ")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    types = [t for t in args.types.split(",") if t in textstream.STREAM_EXTENSIONS]
+    textstream.RANGE_BYTES = args.range_kb * 1024
+    textstream.MAX_RANGE_BYTES = textstream.RANGE_BYTES * textstream.MAX_RANGE_FACTOR + 4
+    line_ranges = textstream.line_ranges
+    textstream.line_ranges = lambda mm, range_bytes=textstream.RANGE_BYTES: line_ranges(mm, range_bytes)
+
+    workdir = tempfile.mkdtemp(prefix="rmeta-textstream-")
+    try:
+        rng = random.Random(args.seed)
+        corpus = build_corpus(workdir, args.files * len(types), args.size_mb, types, args.seed)
+        for path in corpus:
+            _salt(path, rng, args.salt_every)
+        print(f"Comparing {len(corpus)} files, {args.range_kb} KiB ranges:")
+        failures = sum(not check(path, workdir, args.workers, args.strict_messages) for path in corpus)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print(f"\n{failures} of {len(corpus)} files differ between the handler and the streamer")
+        sys.exit(1)
+    print(f"\nAll {len(corpus)} files match")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,20 @@ from .flask_renderer import FlaskRenderer
 def load_renderer(config):
     """
     Load and return the appropriate renderer based on config.
-    Currently only supports Flask, but could be extended for CLI/headless modes.
+    "flask" runs the Werkzeug dev server; "gunicorn" serves the same app
+    from preforked gunicorn workers for production; "cli" has no web app
+    and scrubs a directory tree instead (its renderer.app is None).
     """
     renderer_type = config.get("RENDERER_TYPE", "flask").lower()
     
     if renderer_type == "flask":
         return FlaskRenderer(config)
+    elif renderer_type == "gunicorn":
+        from .gunicorn_renderer import GunicornRenderer
+        return GunicornRenderer(config)
+    elif renderer_type == "cli":
+        from .cli_renderer import CliRenderer
+        return CliRenderer(config)
     else:
         raise ValueError(f"Unsupported renderer type: {renderer_type}")
 
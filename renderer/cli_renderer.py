@@ -0,0 +1,329 @@
+# renderer/cli_renderer.py
+
+import os
+import json
+import time
+import shutil
+import signal
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from routes import EXTENSION_MAP
+from utils.pipeline import run_batch, succeeded
+from utils.admission import admission
+from utils.textstream import text_streamer
+from utils.gpg import SessionKeyring, GPGError, encrypt_outputs
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".rmeta-manifest.jsonl"
+# Files are scrubbed here and only moved into the mirror tree once clean
+STAGING_DIRNAME = ".rmeta-staging"
+REPORT_SECONDS = 10
+COPY_WORKERS = 4
+
+
+def walk_files(root, skip_dirs=()):
+    """
+    Yield (path, relpath, size) for every regular file under root, lazily.
+
+    Directories are read one at a time with os.scandir, so memory stays
+    flat however big the tree is. Symlinks are not followed; directories
+    in skip_dirs (e.g. the output tree) are not entered.
+    """
+    root = os.path.abspath(root)
+    skip = {os.path.abspath(d) for d in skip_dirs}
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.path not in skip:
+                                stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry.path, os.path.relpath(entry.path, root), entry.stat(follow_symlinks=False).st_size
+                    except OSError as e:
+                        logger.warning(f"Skipping {entry.path}: {e}")
+        except OSError as e:
+            logger.warning(f"Could not read directory {current}: {e}")
+
+
+class Manifest:
+    """
+    Append-only JSONL checkpoint of finished files, one line per file.
+
+    Loading tolerates a torn last line from an interrupted run. Files
+    recorded as done (and, unless retrying, failed) are skipped on resume.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.finished = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn write from an interrupted run
+                    self.finished[record["path"]] = record["status"]
+        self._file = open(path, "a")
+
+    def should_skip(self, relpath, retry_failed=False):
+        status = self.finished.get(relpath)
+        return status == "done" or (status == "failed" and not retry_failed)
+
+    def record(self, records):
+        for record in records:
+            self._file.write(json.dumps(record) + "\n")
+            self.finished[record["path"]] = record["status"]
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class _Throughput:
+    """Counters for the run, logged every REPORT_SECONDS by a daemon thread."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.done = self.failed = self.resumed = self.unsupported = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._last = (self.started, 0, 0)
+        self._thread = threading.Thread(target=self._run, name="rmeta-cli-progress", daemon=True)
+        self._thread.start()
+
+    def add(self, done=0, failed=0, nbytes=0, resumed=0, unsupported=0):
+        with self._lock:
+            self.done += done
+            self.failed += failed
+            self.bytes += nbytes
+            self.resumed += resumed
+            self.unsupported += unsupported
+
+    def line(self, final=False):
+        now = time.monotonic()
+        with self._lock:
+            files, nbytes = self.done + self.failed, self.bytes
+            failed, resumed, unsupported = self.failed, self.resumed, self.unsupported
+            last_t, last_files, last_bytes = self._last
+            self._last = (now, files, nbytes)
+        elapsed = max(now - self.started, 1e-9)
+        window = max(now - last_t, 1e-9)
+        rates = (f"{files / elapsed:.1f} files/s, {nbytes / elapsed / 1048576:.1f} MB/s overall" if final else
+                 f"{(files - last_files) / window:.1f} files/s, {(nbytes - last_bytes) / window / 1048576:.1f} MB/s "
+                 f"(overall {files / elapsed:.1f} files/s)")
+        return (f"{files} files scrubbed ({failed} failed), {resumed} already done, "
+                f"{unsupported} unsupported; {rates}")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(REPORT_SECONDS):
+            logger.info(self.line())
+
+
+class CliRenderer:
+    """
+    Headless renderer (RENDERER_TYPE=cli) for scrubbing whole directory trees.
+
+    There is no Flask app: run() walks the source tree lazily, copies
+    supported files (by EXTENSION_MAP) into a mirror tree under the output
+    directory and scrubs them there in parallel batches through the same
+    run_batch pipeline, hash postprocessor and GPG stage as web uploads.
+    Every finished file is appended to a checkpoint manifest, so an
+    interrupted run picks up where it left off.
+
+    Copies are scrubbed in a hidden staging tree and moved to their place
+    in the mirror only once they scrubbed (and encrypted) cleanly, so a
+    failed, timed-out or unsupported file never leaves an unscrubbed copy
+    in the output, even if a timed-out handler is still writing.
+
+    Usage:
+        RENDERER_TYPE=cli python app.py /mnt/share /mnt/share-clean --hash
+    """
+
+    app = None
+    single_process = True
+
+    def __init__(self, config):
+        if not config:
+            raise ValueError("Configuration must be provided for CliRenderer")
+        self.config = config
+        self._stopping = False
+
+    def parse_args(self, argv=None):
+        config = self.config
+        parser = argparse.ArgumentParser(prog="RENDERER_TYPE=cli python app.py",
+                                         description="Scrub metadata from every supported file under a directory tree.")
+        parser.add_argument("source", nargs="?", default=config.get("CLI_SOURCE") or None, help="Tree to scrub (read-only)")
+        parser.add_argument("output", nargs="?", default=config.get("CLI_OUTPUT") or None, help="Where to write the mirror tree")
+        parser.add_argument("--hash", action="store_true", help="Write a .sha256.txt next to each output")
+        parser.add_argument("--fast-scrub", action="store_true", help="Strip JPEG/PNG metadata blocks without re-encoding")
+        parser.add_argument("--gpg-key", help="Public key to encrypt every output to")
+        parser.add_argument("--batch", type=int, default=config.get("CLI_BATCH", 256), help="Files per scrub batch")
+        parser.add_argument("--manifest", help=f"Checkpoint file (default <output>/{MANIFEST_NAME})")
+        parser.add_argument("--retry-failed", action="store_true", help="Retry files a previous run recorded as failed")
+        args = parser.parse_args(argv)
+        if not args.source or not args.output:
+            parser.error("source and output are required (or set CLI_SOURCE and CLI_OUTPUT)")
+        return args
+
+    def _handle_stop(self, signum, frame):
+        if self._stopping:
+            raise KeyboardInterrupt
+        logger.warning("Stopping after the current batch; press Ctrl+C again to abort")
+        self._stopping = True
+
+    def run(self, argv=None):
+        args = self.parse_args(argv)
+        source, output = os.path.abspath(args.source), os.path.abspath(args.output)
+        if not os.path.isdir(source):
+            raise SystemExit(f"Source {source} is not a directory")
+        os.makedirs(output, exist_ok=True)
+        staging = os.path.join(output, STAGING_DIRNAME)
+        shutil.rmtree(staging, ignore_errors=True)  # Leftovers of an interrupted run
+
+        admission.configure(output, min_mem_mb=self.config.get("MIN_MEM_MB", 512),
+                            budget_mb=self.config.get("ADMISSION_BUDGET_MB", 0))
+        text_streamer.configure(self.config.get("TEXT_STREAM_MIN_MB", 256),
+                                workers=self.config.get("TEXT_STREAM_WORKERS", 0))
+        keyring = keyring_dir = None
+        if args.gpg_key:
+            # Outside the mirror tree, so the imported keyring is never published with the clean files
+            keyring_dir = tempfile.mkdtemp(prefix="rmeta-gpg-")
+            try:
+                keyring = SessionKeyring(keyring_dir, args.gpg_key)
+            except (GPGError, OSError) as e:
+                shutil.rmtree(keyring_dir, ignore_errors=True)
+                raise SystemExit(f"GPG key import failed: {e}")
+
+        options = {"generate_hash": args.hash, "fast_scrub": args.fast_scrub, "encrypt_file": bool(keyring),
+                   "skip_clean": self.config.get("PROBE_SKIP_CLEAN", False)}
+        manifest = Manifest(args.manifest or os.path.join(output, MANIFEST_NAME))
+        progress = _Throughput()
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+
+        logger.info(f"Scrubbing {source} -> {output} ({len(manifest.finished)} files already in the manifest)")
+        try:
+            with ThreadPoolExecutor(max_workers=COPY_WORKERS) as copier:
+                batch = []
+                for path, relpath, size in walk_files(source, skip_dirs=[output]):
+                    if self._stopping:
+                        break
+                    ext = os.path.splitext(path)[1].lower().lstrip(".")
+                    if ext not in EXTENSION_MAP:
+                        progress.add(unsupported=1)
+                        continue
+                    if manifest.should_skip(relpath, args.retry_failed):
+                        progress.add(resumed=1)
+                        continue
+                    batch.append((path, relpath, size))
+                    if len(batch) >= args.batch:
+                        self._run_batch(batch, output, staging, options, keyring, manifest, progress, copier)
+                        batch = []
+                if batch and not self._stopping:
+                    self._run_batch(batch, output, staging, options, keyring, manifest, progress, copier)
+        finally:
+            progress.stop()
+            manifest.close()
+            shutil.rmtree(staging, ignore_errors=True)
+            if keyring_dir:
+                shutil.rmtree(keyring_dir, ignore_errors=True)
+
+        if self._stopping:
+            logger.warning(f"Interrupted: {progress.line(final=True)}. Run again to resume.")
+        else:
+            logger.info(f"Finished: {progress.line(final=True)}")
+
+    def _run_batch(self, batch, output, staging, options, keyring, manifest, progress, copier):
+        """Copy a batch into staging, scrub it, publish what came out clean, and checkpoint the results."""
+        def copy(item):
+            path, relpath, _ = item
+            dest = os.path.join(staging, relpath)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copyfile(path, dest)  # Contents only; no source timestamps or modes
+            return dest
+
+        records, dests, by_dest = [], [], {}
+        for item, result in zip(batch, copier.map(lambda i: _try(copy, i), batch)):
+            if isinstance(result, Exception):
+                records.append({"path": item[1], "status": "failed", "warnings": [f"Copy failed: {result}"]})
+            else:
+                dests.append(result)
+                by_dest[result] = item
+
+        results = run_batch(dests, options, self.config) if dests else []
+        scrubbed = []
+        for dest, file_result in results:
+            _, relpath, size = by_dest[dest]
+            if file_result is None:
+                records.append({"path": relpath, "status": "failed", "warnings": ["No handler"]})
+                continue
+            file_result["filename"] = relpath
+            if file_result.get("hash_file"):
+                file_result["hash_file"] = os.path.join(os.path.dirname(relpath), file_result["hash_file"])
+            scrubbed.append((relpath, size, file_result))
+
+        if keyring and scrubbed:
+            encrypt_outputs(staging, None, [r for _, _, r in scrubbed],
+                            workers=self.config.get("GPG_WORKERS", 2), keyring=keyring)
+
+        failed = sum(1 for r in records if r["status"] == "failed")
+        done_bytes = 0
+        for relpath, size, file_result in scrubbed:
+            ok = succeeded(file_result) and not any(w.startswith("GPG encryption failed") for w in file_result["warnings"])
+            output_rel = f"{relpath}.gpg" if file_result.get("encrypted") else relpath
+            if ok:
+                try:
+                    _publish(staging, output, output_rel, file_result.get("hash_file"))
+                except OSError as e:
+                    ok = False
+                    file_result["warnings"].append(f"Error processing file: could not move output into place: {e}")
+            records.append({
+                "path": relpath,
+                "status": "done" if ok else "failed",
+                "output": output_rel if ok else None,
+                "hash_file": file_result.get("hash_file") if ok else None,
+                "warnings": file_result["warnings"],
+            })
+            if ok:
+                done_bytes += size
+            else:
+                failed += 1
+
+        for dest in dests:
+            # Whatever wasn't published: failed or unsupported copies, plaintext behind a .gpg
+            for leftover in (dest, f"{dest}.gpg", f"{dest}.sha256.txt"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+
+        manifest.record(records)
+        progress.add(done=len(records) - failed, failed=failed, nbytes=done_bytes)
+
+
+def _publish(staging, output, output_rel, hash_rel=None):
+    """Move a scrubbed output (and its hash file) from staging to its place in the mirror tree."""
+    for rel in (output_rel, hash_rel):
+        if rel:
+            dest = os.path.join(output, rel)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(os.path.join(staging, rel), dest)
+
+
+def _try(fn, arg):
+    try:
+        return fn(arg)
+    except OSError as e:
+        return e
@@ -3,9 +3,18 @@
 import os
 import secrets
 from flask import Flask, render_template, session as flask_session, get_flashed_messages
-from rmeta_core.utils.cleanup import mark_session_active
+from utils.scheduler import mark_session_active, scheduler
+from utils.jobs import collect_job
+from utils.sessions import session_path
+from utils.results import load_results
+from utils.storage import spool
+from utils.usage import usage_index
 
 class FlaskRenderer:
+    # The dev server is the only process using the upload folder, so it
+    # can safely wipe all of it on the way out.
+    single_process = True
+
     def __init__(self, config):
         if not config:
             raise ValueError("Configuration must be provided for FlaskRenderer")
@@ -32,7 +41,7 @@ class FlaskRenderer:
         # Health check for the Docker healthcheck / load balancers
         @self.app.route("/health")
         def health():
-            return {"status": "ok"}, 200
+            return {"status": "ok", **scheduler.stats(), "storage": spool.stats(), "usage": usage_index.snapshot()}, 200
 
         # Set up the index route
         @self.app.route("/")
@@ -40,15 +49,16 @@ class FlaskRenderer:
             session_id = flask_session.get("session_id", None)
             session_dir = None
             if session_id:
-                session_dir = os.path.join(config.get("SESSIONS_ROOT", "uploads"), f"session_{session_id}")
+                session_dir = session_path(config.get("SESSIONS_ROOT", "uploads"), session_id)
                 if os.path.exists(session_dir):
                     mark_session_active(session_dir)
 
-            files = flask_session.get("processing_results", [])
+            job, job_messages = collect_job(flask_session, config.get("SESSIONS_ROOT", "uploads"))
+            files = (load_results(session_dir) if session_dir else None) or []
 
-            messages = get_flashed_messages()
+            messages = get_flashed_messages() + job_messages
 
-            return render_template("index.html", session=session_id, files=files, messages=messages)
+            return render_template("index.html", session=session_id, files=files, job=job, messages=messages)
 
     def get_wsgi_app(self):
         return self.app
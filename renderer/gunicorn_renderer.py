@@ -0,0 +1,126 @@
+# renderer/gunicorn_renderer.py
+
+import os
+import logging
+from gunicorn.app.base import BaseApplication
+from rmeta_core.utils.cleanup import purge_uploads
+from rmeta_core.utils.system import get_available_memory_mb
+from .flask_renderer import FlaskRenderer
+
+logger = logging.getLogger(__name__)
+
+# Only worker classes that ship with gunicorn; the job queue and scrub pools
+# use real threads and processes, which green-thread patching would break.
+WORKER_CLASSES = ("gthread", "sync")
+
+
+def pick_gunicorn_workers(config):
+    """
+    Worker processes: GUNICORN_WORKERS if set, else one per CPU, capped so
+    each worker has MIN_MEM_MB of the memory free at startup.
+    """
+    configured = config.get("GUNICORN_WORKERS", 0)
+    if configured > 0:
+        return configured
+
+    cpus = os.cpu_count() or 1
+    min_mem_mb = max(config.get("MIN_MEM_MB", 512), 1)
+    try:
+        mem_slots = int(get_available_memory_mb() // min_mem_mb)
+    except Exception as e:
+        logger.warning(f"Could not read available memory, sizing workers by CPU only: {e}")
+        mem_slots = cpus
+    return max(1, min(cpus, mem_slots))
+
+
+def pick_gunicorn_threads(config, workers):
+    """
+    Request threads per worker: GUNICORN_THREADS if set, else enough to
+    keep roughly four per CPU across all workers (at least 2 each).
+
+    Requests only save uploads and stream downloads; scrubbing runs on the
+    job queue, so threads mostly wait on sockets and disk.
+    """
+    configured = config.get("GUNICORN_THREADS", 0)
+    if configured > 0:
+        return configured
+    return max(2, (4 * (os.cpu_count() or 1)) // workers)
+
+
+class _PreloadedApplication(BaseApplication):
+    """Serves an already-built Flask app; gunicorn forks workers from it."""
+
+    def __init__(self, app, options):
+        self.application = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+class GunicornRenderer(FlaskRenderer):
+    """
+    Production renderer (RENDERER_TYPE=gunicorn).
+
+    Same Flask app as FlaskRenderer, but run() hands it to gunicorn instead
+    of the Werkzeug dev server. The app and handler modules are loaded once
+    in the master and workers are forked from it, so a replacement worker
+    only pays for the fork. max-requests recycling is off unless
+    GUNICORN_MAX_REQUESTS is set, since it would kill in-flight jobs.
+    """
+
+    # Several processes share the upload folder, so only the master may
+    # purge it, on the way out.
+    single_process = False
+
+    def gunicorn_options(self):
+        config = self.config
+        workers = pick_gunicorn_workers(config)
+        worker_class = config.get("GUNICORN_WORKER_CLASS", "gthread")
+        if worker_class not in WORKER_CLASSES:
+            logger.warning(f"Unsupported GUNICORN_WORKER_CLASS '{worker_class}', falling back to gthread")
+            worker_class = "gthread"
+        upload_folder = config.get("UPLOAD_FOLDER", "uploads")
+
+        def on_exit(server):
+            purge_uploads(upload_folder)
+
+        return {
+            "bind": f"0.0.0.0:{self.port}",
+            "workers": workers,
+            "worker_class": worker_class,
+            "threads": pick_gunicorn_threads(config, workers) if worker_class == "gthread" else None,
+            "preload_app": True,
+            "timeout": config.get("GUNICORN_TIMEOUT", 120),
+            "graceful_timeout": config.get("GUNICORN_TIMEOUT", 120),
+            "keepalive": 5,
+            # Off by default: scrub jobs run on threads inside the request
+            # workers, and a worker recycled mid-job is killed at the timeout,
+            # failing its jobs. Status polls and chunk PUTs count as requests,
+            # so a limit would be reached during long jobs as a matter of course.
+            "max_requests": config.get("GUNICORN_MAX_REQUESTS", 0),
+            "max_requests_jitter": config.get("GUNICORN_MAX_REQUESTS_JITTER", 50),
+            "worker_tmp_dir": "/dev/shm" if os.path.isdir("/dev/shm") else None,
+            "loglevel": config.get("LOG_LEVEL", "INFO").lower(),
+            "accesslog": "-",
+            "on_exit": on_exit,
+        }
+
+    def run(self):
+        # Import every handler before forking unless a narrower preload was configured
+        if not self.config.get("HANDLER_PRELOAD", "").strip():
+            from routes import handler_registry
+            handler_registry.preload("all")
+
+        options = self.gunicorn_options()
+        logger.info(
+            f"Starting gunicorn: {options['workers']} x {options['worker_class']} workers"
+            + (f", {options['threads']} threads each" if options["threads"] else "")
+        )
+        _PreloadedApplication(self.app, options).run()
@@ -1,6 +1,5 @@
-import os
-import importlib
 import logging
+from utils.registry import HandlerRegistry
 
 logger = logging.getLogger(__name__)
 
@@ -17,16 +16,8 @@ EXTENSION_MAP = {
     "txt": "text_csv_handler",
 }
 
-def get_handler_for_extension(ext):
-    """Return the processing function for the given file extension."""
-    module_name = EXTENSION_MAP.get(ext.lower())
-    if not module_name:
-        logger.warning(f"No handler registered for .{ext}")
-        return None
+handler_registry = HandlerRegistry(EXTENSION_MAP)
 
-    try:
-        mod = importlib.import_module(f"handlers.{module_name}")
-        return getattr(mod, "process", None)
-    except Exception as e:
-        logger.error(f"Error loading handler for .{ext}: {e}")
-        return None
+def get_handler_for_extension(ext):
+    """Return the cached rmeta-core handler entry for the given file extension."""
+    return handler_registry.get(ext)
@@ -1,17 +1,42 @@
 # routes/download.py
 
-from flask import send_from_directory, Blueprint
-from werkzeug.utils import secure_filename
 import os
-from rmeta_core.utils.cleanup import mark_session_active
+from flask import send_from_directory, Blueprint, Response, abort, request, stream_with_context
+from werkzeug.utils import secure_filename
+from utils.scheduler import mark_session_active
+from utils.sessions import session_path
+from utils.bundle import bundle_members, iter_zip
+from utils.jobs import job_in_progress
 
 def register_download_routes(app, config):
     SESSIONS_ROOT = config.get("SESSIONS_ROOT", "/tmp/rMeta")
     download_bp = Blueprint("download", __name__)
 
+    @download_bp.route("/download/<session>/bundle")
+    def download_bundle(session):
+        """Stream every scrubbed output in the session as one ZIP, built on the fly."""
+        safe_dir = session_path(SESSIONS_ROOT, session)
+        if not os.path.isdir(safe_dir):
+            abort(404)
+        mark_session_active(safe_dir)
+
+        # Inputs are still unscrubbed on disk until the job is through with them
+        if job_in_progress(safe_dir, secure_filename(session)):
+            abort(409)
+
+        members = bundle_members(safe_dir)
+        store_only = request.args.get("store", "").lower() in ("1", "true", "yes")
+        return Response(
+            stream_with_context(iter_zip(members, store_only=store_only)),
+            mimetype="application/zip",
+            headers={"Content-Disposition": f"attachment; filename=session_{secure_filename(session)}.zip"}
+        )
+
     @download_bp.route("/download/<session>/<filename>")
     def download_file(session, filename):
-        safe_dir = os.path.join(SESSIONS_ROOT, f"session_{secure_filename(session)}")
+        if filename.startswith("."):
+            abort(404)  # Session bookkeeping (.results.json, .job.json, .events.jsonl, .gpg_key) isn't an output
+        safe_dir = session_path(SESSIONS_ROOT, session)
         mark_session_active(safe_dir)
         return send_from_directory(safe_dir, filename, as_attachment=True)
 
@@ -0,0 +1,77 @@
+# routes/events.py
+
+import os
+import time
+from flask import Blueprint, Response, current_app, request, stream_with_context, abort
+from utils.events import read_events, wait_for_events, format_sse
+from utils.jobs import get_job_status
+from utils.scheduler import mark_session_active
+from utils.sessions import session_path
+
+events_bp = Blueprint("events", __name__)
+
+POLL_SECONDS = 1.0
+KEEPALIVE_SECONDS = 15
+
+
+def _stream(session_dir, session_id, last_id):
+    """Replay the session's events after last_id, then follow until the job ends."""
+    yield "retry: 2000\n\n"
+    offset = 0
+    last_sent = time.monotonic()
+    while True:
+        events, offset = read_events(session_dir, offset)
+        for event in events:
+            if event["id"] <= last_id:
+                continue
+            yield format_sse(event)
+            last_sent = time.monotonic()
+            if event["event"] == "status" and event["data"]["status"] in ("done", "failed"):
+                return
+
+        if not events:
+            if not os.path.isdir(session_dir):
+                yield "event: end\ndata: {}\n\n"  # Session was cleaned up
+                return
+            status = get_job_status(session_dir, session_id)
+            if status is None or status["status"] in ("done", "failed"):
+                yield "event: end\ndata: {}\n\n"  # No job here, or it finished before last_id
+                return
+            if time.monotonic() - last_sent > KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+                mark_session_active(session_dir)
+            wait_for_events(POLL_SECONDS)
+
+
+@events_bp.route("/events/<session_id>", methods=["GET"], endpoint="job_events")
+def job_events(session_id):
+    """
+    Server-Sent Events feed of an upload job's progress.
+
+    Emits a "file" event whenever a file starts, finishes or is encrypted
+    (with its warnings, hash file and encryption state once known) and a
+    "status" event when the job starts or ends; the stream closes after the
+    final status. Reconnecting clients resume from Last-Event-ID.
+    """
+    sessions_root = current_app.config.get("SESSIONS_ROOT", "uploads")
+    session_dir = session_path(sessions_root, session_id)
+    if not os.path.isdir(session_dir):
+        abort(404)
+    mark_session_active(session_dir)
+
+    try:
+        last_id = int(request.headers.get("Last-Event-ID", 0))
+    except ValueError:
+        last_id = 0
+
+    return Response(
+        stream_with_context(_stream(session_dir, session_id, last_id)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def register_events_routes(app):
+    """Register the SSE progress endpoint"""
+    app.register_blueprint(events_bp)
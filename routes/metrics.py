@@ -0,0 +1,27 @@
+# routes/metrics.py
+
+from flask import Blueprint, Response, abort
+from utils.metrics import metrics
+from utils.usage import usage_index
+from utils.admission import admission
+
+metrics_bp = Blueprint("metrics", __name__)
+
+@metrics_bp.route("/metrics", methods=["GET"], endpoint="metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint, aggregated across gunicorn workers. 404 unless METRICS_ENABLED."""
+    if not metrics.enabled:
+        abort(404)
+
+    usage = usage_index.snapshot()
+    body = metrics.render(extra_gauges={
+        "rmeta_sessions": usage["sessions"],
+        "rmeta_session_files": usage["files"],
+        "rmeta_session_bytes": usage["bytes"],
+        "rmeta_admission_headroom_mb": round(admission.headroom_mb(), 1),
+    })
+    return Response(body, mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+def register_metrics_routes(app):
+    """Register the /metrics endpoint"""
+    app.register_blueprint(metrics_bp)
@@ -0,0 +1,149 @@
+# routes/resumable.py
+
+import os
+import logging
+from flask import Blueprint, current_app, request, jsonify, url_for, abort, session as flask_session
+from utils.resumable import ChunkError, init_upload, write_chunk, upload_status, finalize_upload
+from utils.sessions import session_path, create_session, remove_session
+from utils.scheduler import mark_session_active
+from utils.usage import usage_index
+from utils.dedup_cache import scrub_cache
+from utils.storage import spool, QuotaExceeded
+from utils.jobs import job_in_progress
+from routes.upload import queue_upload
+
+logger = logging.getLogger(__name__)
+
+resumable_bp = Blueprint("resumable", __name__)
+
+
+def _own_session_dir(session_id):
+    """The session directory, if it exists and belongs to the caller's cookie."""
+    if flask_session.get("session_id") != session_id:
+        abort(403)
+    session_dir = session_path(current_app.config.get("UPLOAD_FOLDER", "uploads"), session_id)
+    if not os.path.isdir(session_dir):
+        abort(404)
+    mark_session_active(session_dir)  # A slow upload keeps its session alive
+    return session_dir
+
+
+def _urls(session_id, manifest):
+    return {
+        "session_id": session_id,
+        "chunk_size": manifest["chunk_size"],
+        "files": [
+            dict(entry, chunk_url=url_for("resumable.put_chunk", session_id=session_id, file_id=entry["file_id"]))
+            for entry in manifest["files"]
+        ],
+        "status_url": url_for("resumable.upload_progress", session_id=session_id),
+        "finalize_url": url_for("resumable.finalize", session_id=session_id),
+    }
+
+
+@resumable_bp.route("/upload/init", methods=["POST"], endpoint="init")
+def init():
+    """
+    Start a chunked, resumable upload.
+
+    Takes JSON {"files": [{"name", "size"}]}, replaces the caller's previous
+    session like a form upload does (409 while its job is still queued or
+    running), and answers with the chunk size and a
+    chunk URL per file. Chunks are then PUT to chunk_url?offset=N in any
+    order, and POST finalize_url (with the usual form options) starts the
+    scrub job.
+    """
+    body = request.get_json(silent=True) or {}
+    upload_folder = current_app.config.get("UPLOAD_FOLDER", "uploads")
+
+    previous_session = flask_session.get("session_id")
+    if previous_session:
+        previous_dir = session_path(upload_folder, previous_session)
+        if job_in_progress(previous_dir, previous_session):
+            return jsonify({"error": "The previous upload is still being processed"}), 409
+        remove_session(previous_dir)
+
+    session_id, session_dir = create_session(upload_folder, current_app.config.get("SESSION_TIMEOUT", 600))
+    try:
+        manifest = init_upload(session_dir, body.get("files") or [],
+                               current_app.config.get("RESUMABLE_CHUNK_MB", 8) * 1024 * 1024,
+                               max_bytes=current_app.config.get("RESUMABLE_MAX_MB", 16384) * 1024 * 1024)
+        # Declared sizes bound every chunk write, so the whole upload is charged now
+        spool.reserve(session_dir, sum(entry["size"] for entry in manifest["files"]))
+    except ChunkError as e:
+        remove_session(session_dir)
+        return jsonify({"error": str(e)}), e.status
+    except QuotaExceeded as e:
+        remove_session(session_dir)
+        return jsonify({"error": str(e)}), 413
+    except Exception:
+        remove_session(session_dir)
+        raise
+
+    flask_session["session_id"] = session_id
+    flask_session.pop("job_id", None)
+    logger.info(f"Started chunked upload of {len(manifest['files'])} files in session {session_id}")
+    return jsonify(_urls(session_id, manifest)), 201
+
+
+@resumable_bp.route("/upload/<session_id>", methods=["GET"], endpoint="upload_progress")
+def upload_progress(session_id):
+    """Which chunks have arrived, so a client can resume after a failure or reload."""
+    session_dir = _own_session_dir(session_id)
+    status = upload_status(session_dir)
+    if status is None:
+        return jsonify({"error": "No upload in progress"}), 404
+    return jsonify(_urls(session_id, status))
+
+
+@resumable_bp.route("/upload/<session_id>/<file_id>", methods=["PUT"], endpoint="put_chunk")
+def put_chunk(session_id, file_id):
+    """
+    Write the request body as the chunk at ?offset=N of a file.
+
+    The body is streamed straight to its place in the file rather than
+    parsed as a form. An X-Chunk-SHA256 header, if sent, is checked against
+    the digest taken on the way.
+    """
+    session_dir = _own_session_dir(session_id)
+    try:
+        offset = int(request.args.get("offset", ""))
+    except ValueError:
+        return jsonify({"error": "offset is required"}), 400
+    if request.content_length is None:
+        return jsonify({"error": "Content-Length is required"}), 411
+
+    try:
+        chunk_sha256, is_new = write_chunk(session_dir, file_id, offset, request.stream, request.content_length,
+                                           expected_sha256=request.headers.get("X-Chunk-SHA256"))
+    except ChunkError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    if is_new:
+        usage_index.add_bytes(session_dir, request.content_length, files=0)
+    return jsonify({"offset": offset, "size": request.content_length, "sha256": chunk_sha256})
+
+
+@resumable_bp.route("/upload/<session_id>/finalize", methods=["POST"], endpoint="finalize")
+def finalize(session_id):
+    """
+    Assemble the uploaded files and queue them exactly like a form upload.
+
+    Answers 409 with the incomplete files if chunks are still missing; the
+    upload stays resumable.
+    """
+    session_dir = _own_session_dir(session_id)
+    try:
+        records = finalize_upload(session_dir, full_digest=scrub_cache.enabled)
+    except ChunkError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    usage_index.add_bytes(session_dir, 0, files=len(records))
+    for record in records:
+        logger.info(f"Uploaded: {record['path']} ({record['size']} bytes, chunked)")
+    return queue_upload(session_id, session_dir, records)
+
+
+def register_resumable_routes(app):
+    """Register the chunked upload API"""
+    app.register_blueprint(resumable_bp)
@@ -1,7 +1,9 @@
 # routes/session_clean.py
 
 from flask import Blueprint, current_app, render_template, jsonify, request, session as flask_session, redirect, url_for
-from rmeta_core.utils.cleanup import purge_uploads, check_uploads_dir
+from utils.jobs import get_job_status
+from utils.sessions import session_path, remove_session
+from utils.usage import usage_index
 import time
 
 session_clean_bp = Blueprint("session_clean", __name__)
@@ -11,15 +13,16 @@ def clean_memory():
     """Manual cleanup triggered by user button"""
     upload_folder = current_app.config.get("UPLOAD_FOLDER", "uploads")
     
-    # Purge all files from the uploads directory
-    files_removed = purge_uploads(upload_folder)
-    
-    # Update app config to reflect clean state
-    current_app.config["HAS_DIRTY_DATA"] = False
+    # Remove only this user's session; other sessions are not ours to purge
+    files_removed = False
+    session_id = flask_session.get('session_id')
+    if session_id:
+        files_removed = remove_session(session_path(upload_folder, session_id))
     
     # Clear the app-level attributes that store file results
     flask_session.pop('processing_results', None)
     flask_session.pop('session_id', None)
+    flask_session.pop('job_id', None)
     flask_session.pop('_flashes', None)
     
     # Also clear any flash messages
@@ -36,18 +39,27 @@ def clean_memory():
 
 @session_clean_bp.route("/status", methods=["GET"], endpoint="check_status")
 def check_status():
-    """AJAX endpoint to check if uploads directory has files"""
+    """AJAX endpoint to check if this user's session has files (served from the usage index)"""
     upload_folder = current_app.config.get("UPLOAD_FOLDER", "uploads")
-    has_files = check_uploads_dir(upload_folder)
-    
-    # Update the app config
-    current_app.config["HAS_DIRTY_DATA"] = has_files
+    session_id = flask_session.get('session_id')
+    has_files = bool(session_id) and usage_index.session_has_data(session_path(upload_folder, session_id))
     
     return jsonify({
         "has_dirty_data": has_files,
         "timestamp": int(time.time())
     })
 
+@session_clean_bp.route("/status/job/<job_id>", methods=["GET"], endpoint="job_status")
+def job_status(job_id):
+    """AJAX endpoint reporting per-file progress of a background upload job"""
+    sessions_root = current_app.config.get("SESSIONS_ROOT", "uploads")
+    status = get_job_status(session_path(sessions_root, job_id), job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    status["timestamp"] = int(time.time())
+    return jsonify(status)
+
 def register_session_clean_routes(app):
     """Register session cleaning routes"""
     app.register_blueprint(session_clean_bp)
\ No newline at end of file
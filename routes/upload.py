@@ -1,20 +1,21 @@
 import os
-import uuid
-import asyncio
 import logging
-from flask import Blueprint, request, redirect, url_for, flash, current_app, render_template, session as flask_session
+from contextlib import closing
+from flask import Blueprint, request, redirect, url_for, flash, current_app, render_template, jsonify, session as flask_session
 from werkzeug.utils import secure_filename
-from rmeta_core.handlers import get_handler_for_extension
-from rmeta_core.utils.cleanup import (
-    mark_session_active,
-    schedule_cleanup,
-    purge_uploads,
-    check_uploads_dir
-)
-from rmeta_core.postprocessors.hash_generator import generate_hash
-from rmeta_core.postprocessors.gpg_encryptor import encrypt_with_gpg
-from rmeta_core.utils.chunking import audit_files, chunk_files_by_size, process_chunks
-from rmeta_core.utils.system import get_available_memory_mb
+from rmeta_core.utils.chunking import process_chunks
+from utils.pipeline import run_batch, run_stream, succeeded
+from utils.ingest import ingest_upload, audit_records, chunk_records, hash_output
+from utils.archive import ArchiveExtractor, ArchiveError, ARCHIVE_EXTENSIONS
+from utils.bundle import write_zip
+from utils.jobs import Job, job_queue, collect_job, job_in_progress
+from utils.sessions import session_path, create_session, remove_session
+from utils.usage import usage_index
+from utils.storage import spool, QuotaExceeded
+from utils.results import save_results, load_results
+from utils.gpg import encrypt_outputs
+from utils.admission import admission
+from utils.stages import stage
 
 
 logger = logging.getLogger(__name__)
@@ -22,161 +23,345 @@ logger = logging.getLogger(__name__)
 upload_bp = Blueprint("upload", __name__)
 
 def uploads_are_dirty():
+    """True if the current user's own session still holds files."""
+    session_id = flask_session.get("session_id")
+    if not session_id:
+        return False
     upload_path = current_app.config.get("UPLOAD_FOLDER", "uploads")
-    try:
-        return any(os.scandir(upload_path))  # True if anything exists
-    except Exception:
-        return 
+    return usage_index.session_has_data(session_path(upload_path, session_id))
 
 def register_upload_routes(app):
     app.register_blueprint(upload_bp)
 
 @upload_bp.route("/", methods=["POST"], endpoint="upload_file")
 def upload_file():
+    upload_folder = current_app.config.get("UPLOAD_FOLDER", "uploads")
+    previous_session = flask_session.get("session_id")
+
+    # The previous session is replaced below; not while its job still reads and writes its files
+    if previous_session and job_in_progress(session_path(upload_folder, previous_session), previous_session):
+        message = "Your previous upload is still being processed. Wait for it to finish, then upload again."
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify({"error": message}), 409
+        flash(message)
+        return redirect(url_for("upload.index"))
+
+    # Turn away an oversized request on its Content-Length alone: parsing
+    # the form below already spools the body (into RAM on tmpfs).
+    try:
+        spool.check(request.content_length or 0,
+                    replacing=session_path(upload_folder, previous_session) if previous_session else None)
+    except QuotaExceeded as e:
+        logger.warning(f"Rejected upload of {request.content_length} bytes: {e}")
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify({"error": str(e)}), 413
+        flash(str(e))
+        return redirect(url_for("upload.index"))
+
     files = request.files.getlist("file")
     if not files:
         flash("No files uploaded.")
         return redirect(url_for("upload.index"))
 
-    upload_folder = current_app.config.get("UPLOAD_FOLDER", "uploads")
+    # A new batch replaces this user's previous session only; other users'
+    # sessions under the same folder are left to their own cleanup timers.
+    if previous_session:
+        remove_session(session_path(upload_folder, previous_session))
 
-    # Detect new session - purge uploads if files are being uploaded
-    if request.files:  # If files are being uploaded
-        purge_uploads(upload_folder)  # Clean slate for new session
-        current_app.config["HAS_DIRTY_DATA"] = False
+    timeout = current_app.config.get("SESSION_TIMEOUT", 600)
+    session_id, session_dir = create_session(upload_folder, timeout)
 
-    # Create new session folder
-    session_id = str(uuid.uuid4())[:8]
-    session_dir = os.path.join(upload_folder, f"session_{session_id}")
-    os.makedirs(session_dir, exist_ok=True)
+    records = []
 
-    timeout = current_app.config.get("SESSION_TIMEOUT", 600)
-    mark_session_active(session_dir)
-    schedule_cleanup(session_dir, timeout)
+    # Stream uploaded files to disk, hashing and sizing them in the same pass.
+    # The request size is charged to the storage quotas up front; without a
+    # Content-Length each file is charged once it has been read.
+    try:
+        spool.reserve(session_dir, request.content_length or 0)
+        for file in files:
+            if not file or not file.filename:
+                flash("Skipped unnamed file.")
+                continue
+
+            filename = secure_filename(file.filename)
+            if not filename.strip():
+                flash("Skipped file with invalid name.")
+                continue
+
+            filepath = os.path.join(session_dir, filename)
+            with stage("save", path=filepath):
+                record = ingest_upload(file, filepath)
+            usage_index.add_bytes(session_dir, record["size"])
+            if request.content_length is None:
+                spool.reserve(session_dir, record["size"])
+            logger.info(f"Uploaded: {filepath} ({record['size']} bytes)")
+            records.append(record)
+    except QuotaExceeded as e:
+        remove_session(session_dir)
+        flask_session.pop("session_id", None)
+        flask_session.pop("job_id", None)
+        logger.warning(f"Rejected upload for session {session_id}: {e}")
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify({"error": str(e)}), 413
+        flash(str(e))
+        return redirect(url_for("upload.index"))
 
-    processed_files = []
-    saved_paths = []
+    return queue_upload(session_id, session_dir, records)
 
-    # Save uploaded files
-    for file in files:
-        if not file or not file.filename:
-            flash("Skipped unnamed file.")
-            continue
+def queue_upload(session_id, session_dir, records):
+    """
+    Audit ingested files and hand them to the background job queue.
 
-        filename = secure_filename(file.filename)
-        if not filename.strip():
-            flash("Skipped file with invalid name.")
-            continue
+    Shared by the one-shot form POST and the chunked upload finalize
+    (routes/resumable.py); the scrub options and GPG key come from the
+    current request's form.
 
-        filepath = os.path.join(session_dir, filename)
-        file.save(filepath)
-        logger.info(f"Uploaded: {filepath}")
-        saved_paths.append(filepath)
+    Returns:
+        The response: the job id as JSON (202) when asked for, else a redirect to the index.
+    """
+    # ZIPs are expanded member by member by the job rather than scrubbed whole
+    archives = [record for record in records if record["ext"] in ARCHIVE_EXTENSIONS]
+    records = [record for record in records if record["ext"] not in ARCHIVE_EXTENSIONS]
 
-    # Audit files for memory and support
-    available_mem = get_available_memory_mb()
-    supported, too_large, skipped = audit_files(saved_paths, min_memory_mb=available_mem)
+    # Audit files for support from the ingest records; memory is handled by
+    # admission control when each file is dispatched.
+    with stage("audit"):
+        supported, skipped = audit_records(records)
 
     for f, reason in skipped:
         flash(f"Skipped {os.path.basename(f)}: {reason}")
-    for f, size in too_large:
-        flash(f"Too large to process now: {os.path.basename(f)} ({size:.1f}MB)")
 
-    # Chunk supported files
-    chunks = chunk_files_by_size(supported, chunk_mb=200)
+    # Chunk supported files, smaller when the shared memory budget is busy
+    chunks = chunk_records(supported, chunk_mb=admission.suggest_chunk_mb())
 
-    # Save GPG key file once if present (before defining process_files)
+    # Save GPG key file once if present. It's kept out of the download
+    # listing and imported into a session keyring by the GPG stage.
     gpg_key_file = request.files.get("gpg_key")
     gpg_key_path = None
     if gpg_key_file and gpg_key_file.filename:
-        gpg_key_path = os.path.join(session_dir, secure_filename(gpg_key_file.filename))
+        gpg_key_path = os.path.join(session_dir, ".gpg_key")
         gpg_key_file.save(gpg_key_path)
 
-    # Define processing logic
-    def process_files(file_list):
-        logger.info(f"Entered process_files with {len(file_list)} files")
-        for filepath in file_list:
-            logger.info(f"Processing file: {filepath}")
-            filename = os.path.basename(filepath)
-            ext = os.path.splitext(filename)[1].lower().lstrip(".")
-            handler_entry = get_handler_for_extension(ext)
-
-            if not handler_entry:
-                flash(f"Unsupported file type: {filename}")
-                continue
+    options = {
+        "generate_hash": bool(request.form.get("generate_hash")),
+        "fast_scrub": bool(request.form.get("fast_scrub")),
+        "report_only": bool(request.form.get("report_only")),
+        "skip_clean": current_app.config.get("PROBE_SKIP_CLEAN", False),
+        "encrypt_file": bool(request.form.get("encrypt_file")),
+        "encrypt_archive": bool(request.form.get("encrypt_archive")),
+        "gpg_key_path": gpg_key_path,
+    }
+
+    # Hand the batch to the background queue and return right away; the
+    # index page polls /status/job/<id> until it finishes.
+    supported_paths = [record["path"] for record in supported]
+    archive_paths = [record["path"] for record in archives]
+    job = Job(session_id, session_dir, supported_paths + archive_paths)
+    digests = {record["path"]: record["sha256"] for record in supported}
+    job_queue.submit(job, run_upload_job, chunks, options, dict(current_app.config), digests, archive_paths)
+    logger.info(f"Queued job {job.job_id} with {len(supported)} files in {len(chunks)} chunks"
+                f" and {len(archives)} archives")
 
-            file_result = {
-                "filename": filename,
-                "warnings": [],
-                "metadata_msg": f"Metadata stripped from {ext.upper()}: {filename}",
-                "hash_file": None,
-                "encrypted": False
-            }
-
-            try:
-                scrub_fn = handler_entry.get("scrub")
-                get_additional_messages_fn = handler_entry.get("get_additional_messages")
-                is_async = handler_entry.get("is_async", False)
-                msgs_is_async = handler_entry.get("msgs_is_async", False)
-
-                if scrub_fn:
-                    if is_async:
-                        asyncio.run(scrub_fn(filepath))
-                    else:
-                        scrub_fn(filepath)
-                    logger.info(f"Scrubbed metadata from: {filename}")
-
-                if get_additional_messages_fn:
-                    if msgs_is_async:
-                        additional_messages = asyncio.run(get_additional_messages_fn(filepath))
-                    else:
-                        additional_messages = get_additional_messages_fn(filepath)
-                    file_result["warnings"].extend(additional_messages)
-
-                if request.form.get("generate_hash"):
-                    try:
-                        hash_filename = generate_hash(filepath)
-                        file_result["hash_file"] = hash_filename
-                        logger.info(f"Hash generated: {hash_filename}")
-                    except Exception as e:
-                        file_result["warnings"].append(f"Hash generation failed: {str(e)}")
-
-                # Use gpg_key_path from outer scope
-                if request.form.get("encrypt_file"):
-                    if gpg_key_path:
-                        try:
-                            encrypted_filename = encrypt_with_gpg(filepath, gpg_key_path)
-                            file_result["filename"] = encrypted_filename
-                            file_result["encrypted"] = True
-                            logger.info(f"File encrypted: {encrypted_filename}")
-                        except Exception as e:
-                            file_result["warnings"].append(f"GPG encryption failed: {str(e)}")
-                    else:
-                        file_result["warnings"].append(f"GPG encryption requested but no key provided.")
-
-                logger.info(f"Appending result: {file_result}")
-                processed_files.append(file_result)
-
-            except Exception as e:
-                logger.exception(f"Failed processing {filename}: {e}")
-                file_result["warnings"].append(f"Error processing file: {str(e)}")
-                processed_files.append(file_result)
-
-    # Process chunks
-    process_chunks(chunks, min_memory_mb=500, processor=process_files)
-    logger.info(f"After chunk processing: {len(processed_files)} files")
-
-    from flask import session as flask_session
     flask_session['session_id'] = session_id  # Make sure session_id is set
-    flask_session['processing_results'] = processed_files
+    flask_session['job_id'] = job.job_id
+    flask_session.pop('processing_results', None)  # Left over from older cookies
+
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({
+            "job_id": job.job_id,
+            "status_url": url_for("session_clean.job_status", job_id=job.job_id)
+        }), 202
 
-    flash(f"Processed {len(processed_files)} files in {len(chunks)} chunks.")
+    flash(f"Processing {len(supported)} files in {len(chunks)} chunks"
+          + (f" and {len(archives)} archives." if archives else "."))
     return redirect(url_for("upload.index"))
 
+def _bytes_on_disk(paths):
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+def _output_paths(filepath, file_result):
+    """A scrubbed file and, if one was written, its hash file."""
+    if file_result and file_result.get("hash_file"):
+        return [filepath, os.path.join(os.path.dirname(filepath), file_result["hash_file"])]
+    return [filepath]
+
+def scrub_archive(job, archive_path, options, config, digests):
+    """
+    Expand an uploaded ZIP into the session and scrub its members as they land.
+
+    Members are extracted one at a time (utils/archive.py) and fed to the
+    pipeline through run_stream, so scrubbing overlaps with extraction.
+    Scrubbed members keep their own rows; at the end the ones that came
+    through cleanly are repackaged, under their original paths, as
+    <name>_clean.zip, which takes the uploaded archive's row (not for
+    report-only requests, which change nothing). The uploaded archive
+    itself is deleted.
+    """
+    name = os.path.basename(archive_path)
+    job.mark_file(archive_path, "extracting")
+    members = {}
+    sizes = {}
+    clean = []
+
+    # Extraction may only use what is left of the session's storage quota
+    max_total_bytes = config.get("ARCHIVE_MAX_TOTAL_MB", 2048) * 1024 * 1024
+    room = spool.remaining(job.session_dir)
+    if room is not None:
+        max_total_bytes = min(max_total_bytes, room)
+
+    try:
+        extractor = ArchiveExtractor(
+            archive_path,
+            job.session_dir,
+            max_members=config.get("ARCHIVE_MAX_MEMBERS", 10000),
+            max_total_bytes=max_total_bytes,
+            max_ratio=config.get("ARCHIVE_MAX_RATIO", 100),
+        )
+
+        def extracted():
+            # Closing this generator closes the extractor's, which closes the archive
+            with closing(iter(extractor)) as records:
+                for record in records:
+                    members[record["path"]] = record["member"]
+                    sizes[record["path"]] = record["size"]
+                    digests[record["path"]] = record["sha256"]
+                    usage_index.add_bytes(job.session_dir, record["size"])
+                    spool.charge(job.session_dir, record["size"])
+                    job.add_file(record["path"])
+                    yield record["path"]
+
+        def discard(filepath):
+            # Extracted but never scrubbed: don't leave the unscrubbed member in the session
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            job.mark_file(filepath, "skipped")
+
+        try:
+            for filepath, file_result in run_stream(extracted(), options, config, progress=job.mark_file,
+                                                    digests=digests, discard=discard):
+                if file_result is None:
+                    job.mark_file(filepath, "skipped")
+                    continue
+                job.add_result(filepath, file_result)
+                # Extraction charged the member; charge what the scrub and hash stage added
+                spool.charge(job.session_dir, _bytes_on_disk(_output_paths(filepath, file_result)) - sizes[filepath])
+                if succeeded(file_result):
+                    clean.append((filepath, file_result.get("hash_file")))
+        finally:
+            for member, reason in extractor.skipped:
+                job.add_message(f"Skipped {member} in {name}: {reason}")
+    except ArchiveError as e:
+        logger.warning(f"Archive {name} rejected: {e}")
+        job.add_message(f"Archive {name} rejected: {e}")
+    finally:
+        os.remove(archive_path)  # Never offer the unscrubbed original for download
+
+    if not clean:
+        job.mark_file(archive_path, "failed")
+        return
+    if options.get("report_only"):
+        job.mark_file(archive_path, "done")  # Members have their own report rows; nothing to repackage
+        return
+
+    clean_path = os.path.join(job.session_dir, f"{os.path.splitext(name)[0]}_clean.zip")
+    packed = []
+    for filepath, hash_file in clean:
+        packed.append((filepath, members[filepath]))
+        if hash_file:  # Not written if hashing failed for this member
+            packed.append((os.path.join(os.path.dirname(filepath), hash_file), f"{members[filepath]}.sha256.txt"))
+    try:
+        # Scrubbed members rarely compress much, so the zip needs about as much room again
+        spool.reserve(job.session_dir, _bytes_on_disk(path for path, _ in packed), output=True)
+    except QuotaExceeded as e:
+        job.add_message(f"Could not repackage {name}: {e}")
+        job.mark_file(archive_path, "failed")
+        return
+    with stage("repackage", path=clean_path):
+        write_zip(clean_path, packed)
+    logger.info(f"Repackaged {len(clean)} files from {name} into {os.path.basename(clean_path)}")
+
+    file_result = {
+        "filename": os.path.basename(clean_path),
+        "warnings": [f"{len(members) - len(clean)} members could not be scrubbed and were left out"]
+        if len(clean) < len(members) else [],
+        "metadata_msg": f"Metadata stripped from {len(clean)} files in {name}",
+        "hash_file": hash_output(clean_path) if options.get("generate_hash") else None,
+        "encrypted": False,
+    }
+    job.add_result(archive_path, file_result)
+
+
+def encrypt_results(job, options, config):
+    """GPG stage of an upload job, once room for the encrypted copies is reserved."""
+    plaintext = [path for r in job.results if succeeded(r)
+                 for path in _output_paths(os.path.join(job.session_dir, r["filename"]), r)]
+    try:
+        spool.reserve(job.session_dir, _bytes_on_disk(plaintext), output=True)  # gpg output is about the size of its input
+    except QuotaExceeded as e:
+        for file_result in job.results:
+            if succeeded(file_result):
+                file_result["warnings"].append(f"GPG encryption failed: {e}")
+        job.add_message(f"Files were not encrypted: {e}")
+        return
+
+    archive_name = f"session_{job.session_id}.tar.gpg" if options.get("encrypt_archive") else None
+    with stage("encrypt"):
+        archive_result = encrypt_outputs(
+            job.session_dir,
+            options.get("gpg_key_path"),
+            job.results,
+            workers=config.get("GPG_WORKERS", 2),
+            archive_name=archive_name,
+            progress=job.mark_file,
+        )
+    if archive_result:
+        job.add_result(archive_result["filename"], archive_result)
+
+def run_upload_job(job, chunks, options, config, digests=None, archives=()):
+    """Job body: scrub every chunk and archive, then run the GPG stage over the whole batch."""
+    digests = dict(digests or {})
+
+    def process_files(file_list):
+        logger.info(f"Entered process_files with {len(file_list)} files")
+        input_bytes = _bytes_on_disk(file_list)
+        outputs = []
+        for filepath, file_result in run_batch(file_list, options, config, progress=job.mark_file, digests=digests):
+            outputs.extend(_output_paths(filepath, file_result))
+            if file_result is None:
+                job.mark_file(filepath, "skipped")
+                job.add_message(f"Unsupported file type: {os.path.basename(filepath)}")
+                continue
+            job.add_result(filepath, file_result)
+        # Inputs were charged on upload; charge what the scrub and hash stage added
+        spool.charge(job.session_dir, _bytes_on_disk(outputs) - input_bytes)
+
+    try:
+        process_chunks(chunks, min_memory_mb=config.get("MIN_MEM_MB", 512), processor=process_files)
+        for archive_path in archives:
+            scrub_archive(job, archive_path, options, config, digests)
+
+        if options.get("report_only"):
+            job.add_message("Report only: no files were changed.")
+        elif options.get("encrypt_file") or options.get("encrypt_archive"):
+            encrypt_results(job, options, config)
+    finally:
+        save_results(job.session_dir, job.results)
+    usage_index.reconcile_session(job.session_dir)  # Scrub/hash/GPG changed what's on disk
+    logger.info(f"After chunk processing: {len(job.results)} files")
+    job.add_message(f"Processed {len(job.results)} files in {len(chunks)} chunks.")
+
 @upload_bp.route("/", methods=["GET"], endpoint="index")
 def index():
     session_id = flask_session.get("session_id", None)
-    files = flask_session.get("processing_results", None)
+    upload_folder = current_app.config.get("UPLOAD_FOLDER", "uploads")
+    job, job_messages = collect_job(flask_session, upload_folder)
+    files = load_results(session_path(upload_folder, session_id)) if session_id else None
     messages = list(getattr(current_app, "_flashes", []))
 
     has_dirty_data = uploads_are_dirty()
@@ -185,6 +370,7 @@ def index():
         "index.html",
         session=session_id,
         files=files,
-        messages=[msg for _, msg in messages],
+        job=job,
+        messages=[msg for _, msg in messages] + job_messages,
         has_dirty_data=has_dirty_data
     )
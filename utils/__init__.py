@@ -0,0 +1,4 @@
+# utils/__init__.py
+
+# App-side helpers for the web layer (worker pools, job tracking, etc.).
+# File handlers and the shared cleanup/chunking utilities live in rmeta-core.
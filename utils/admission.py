@@ -0,0 +1,253 @@
+# utils/admission.py
+
+import os
+import json
+import asyncio
+import time
+import uuid
+import fcntl
+import logging
+from contextlib import contextmanager
+from rmeta_core.utils.system import get_available_memory_mb
+
+logger = logging.getLogger(__name__)
+
+LEDGER_FILE = ".admission.json"
+POLL_SECONDS = 0.2
+# How often tokens of dead processes are looked for; every check reads /proc per holder
+PRUNE_SECONDS = 5.0
+
+# Rough peak-memory multiplier over on-disk size, per type. Images decode to
+# full bitmaps; office formats are zipped XML that inflates several times.
+MEMORY_FACTORS = {
+    "jpg": 10,
+    "jpeg": 10,
+    "png": 6,
+    "heic": 12,
+    "pdf": 3,
+    "docx": 8,
+    "xlsx": 8,
+    "csv": 2,
+    "txt": 2,
+}
+DEFAULT_FACTOR = 4
+BASE_OVERHEAD_MB = 16
+
+MIN_CHUNK_MB = 50
+MAX_CHUNK_MB = 1000
+
+
+def estimate_peak_mb(ext, size_bytes):
+    """Estimated peak memory (MB) to scrub a file of this type and size."""
+    size_mb = size_bytes / (1024 * 1024)
+    return BASE_OVERHEAD_MB + size_mb * MEMORY_FACTORS.get(ext.lower(), DEFAULT_FACTOR)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_boot_id = None
+
+
+def _read_boot_id():
+    """This boot's id; read once, since no process outlives a reboot."""
+    global _boot_id
+    if _boot_id is None:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            _boot_id = f.read().strip()
+    return _boot_id
+
+
+def process_identity(pid):
+    """
+    Boot id and start time of a process, or None if it isn't running.
+
+    Unlike a PID, this isn't reused: a restarted container hands out the
+    same small PIDs again, but never to a process with the same start
+    time. Falls back to the PID alone where /proc isn't available.
+    """
+    if not os.path.isdir("/proc/self"):
+        return str(pid) if pid_alive(pid) else None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+        boot_id = _read_boot_id()
+    except OSError:
+        return None
+    # Field 22 (starttime); the command name in field 2 may contain spaces
+    return f"{boot_id}:{stat[stat.rindex(')') + 2:].split()[19]}"
+
+
+class AdmissionController:
+    """
+    Memory tokens shared by every worker process on the host.
+
+    Outstanding reservations are kept in a small ledger file under the
+    upload folder, guarded by flock, so gunicorn workers see each other's
+    work instead of all reading the same free-memory figure and
+    oversubscribing together. Only the tokens live there; the capacity is
+    worked out from the config at configure(), so a new budget or a
+    resized host takes effect on the next start. Each token records its
+    holder's process identity, so tokens of a dead process are dropped
+    even when a restarted container has reused its PID; they are looked
+    for at most every PRUNE_SECONDS (the ledger records when), not on every
+    poll of every waiting file. Work that doesn't fit waits for tokens
+    rather than being rejected; a file bigger than the whole budget is
+    admitted on its own once nothing else is running.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.min_mem_mb = 512
+        self.budget_mb = 0
+        self.capacity_mb = None
+        self._own_identity = None
+        self._identity_pid = None
+
+    def configure(self, root, min_mem_mb=512, budget_mb=0):
+        """
+        Args:
+            root: Folder to keep the ledger in (the upload folder).
+            min_mem_mb: Memory always left free for the rest of the system.
+            budget_mb: Total tokens; 0 = free memory now minus min_mem_mb.
+        """
+        self.root = root
+        self.min_mem_mb = min_mem_mb
+        self.budget_mb = budget_mb
+        self.capacity_mb = self._initial_capacity()
+        logger.info(f"Admission budget: {self.capacity_mb:.0f}MB")
+
+    @property
+    def ledger_path(self):
+        return os.path.join(self.root or ".", LEDGER_FILE)
+
+    @contextmanager
+    def _ledger(self):
+        """Open, lock and yield the ledger dict; it is written back on exit."""
+        fd = os.open(self.ledger_path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(fd, "r+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                try:
+                    ledger = json.loads(f.read() or "{}")
+                except ValueError:
+                    ledger = {}
+                ledger.setdefault("tokens", {})
+                ledger.pop("capacity_mb", None)  # Persisted by older versions; always recomputed now
+                now = time.time()
+                if not 0 <= now - ledger.get("pruned_at", 0) < PRUNE_SECONDS:
+                    self._prune(ledger)
+                    ledger["pruned_at"] = now
+                yield ledger
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(ledger))
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _prune(self, ledger):
+        """
+        Drop reservations held by processes that have since died; the
+        ledger outlives container restarts, which reuse PIDs.
+        """
+        identities = {os.getpid(): self._identity()}
+        for v in ledger["tokens"].values():
+            if v["pid"] not in identities:
+                identities[v["pid"]] = process_identity(v["pid"])
+        ledger["tokens"] = {
+            k: v for k, v in ledger["tokens"].items()
+            if v.get("identity") and v["identity"] == identities[v["pid"]]
+        }
+
+    def _initial_capacity(self):
+        if self.budget_mb > 0:
+            return self.budget_mb
+        try:
+            available = get_available_memory_mb()
+        except Exception as e:
+            logger.warning(f"Could not read available memory for admission budget: {e}")
+            available = self.min_mem_mb * 2
+        return max(available - self.min_mem_mb, self.min_mem_mb)
+
+    def _identity(self):
+        if self._identity_pid != os.getpid():
+            self._own_identity = process_identity(os.getpid())
+            self._identity_pid = os.getpid()
+        return self._own_identity
+
+    @property
+    def capacity(self):
+        if self.capacity_mb is None:
+            self.capacity_mb = self._initial_capacity()
+        return self.capacity_mb
+
+    def try_acquire(self, need_mb):
+        """Reserve need_mb if it fits now. Returns a token id, or None."""
+        with self._ledger() as ledger:
+            in_use = sum(t["mb"] for t in ledger["tokens"].values())
+            if in_use and in_use + need_mb > self.capacity:
+                return None
+            token = uuid.uuid4().hex
+            ledger["tokens"][token] = {"pid": os.getpid(), "identity": self._identity(), "mb": need_mb}
+            return token
+
+    def acquire(self, need_mb):
+        """Block until need_mb fits in the shared budget. Returns a token id."""
+        waited = 0.0
+        while True:
+            token = self.try_acquire(need_mb)
+            if token:
+                if waited:
+                    logger.info(f"Admitted {need_mb:.0f}MB of work after waiting {waited:.1f}s")
+                return token
+            time.sleep(POLL_SECONDS)
+            waited += POLL_SECONDS
+
+    async def acquire_async(self, need_mb):
+        """
+        acquire() for the event loop. Waiting is an asyncio.sleep, not a
+        blocked thread, so waiters never take an executor thread that the
+        work they are waiting on needs in order to finish.
+        """
+        loop = asyncio.get_running_loop()
+        waited = 0.0
+        while True:
+            token = await loop.run_in_executor(None, self.try_acquire, need_mb)
+            if token:
+                if waited:
+                    logger.info(f"Admitted {need_mb:.0f}MB of work after waiting {waited:.1f}s")
+                return token
+            await asyncio.sleep(POLL_SECONDS)
+            waited += POLL_SECONDS
+
+    def release(self, token):
+        with self._ledger() as ledger:
+            ledger["tokens"].pop(token, None)
+
+    @contextmanager
+    def reserve(self, need_mb):
+        token = self.acquire(need_mb)
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    def headroom_mb(self):
+        """Tokens not currently handed out."""
+        with self._ledger() as ledger:
+            in_use = sum(t["mb"] for t in ledger["tokens"].values())
+            return max(self.capacity - in_use, 0)
+
+    def suggest_chunk_mb(self):
+        """Chunk size that shrinks as the shared budget fills up."""
+        return int(min(max(self.headroom_mb() / 2, MIN_CHUNK_MB), MAX_CHUNK_MB))
+
+
+admission = AdmissionController()
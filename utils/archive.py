@@ -0,0 +1,160 @@
+# utils/archive.py
+
+import os
+import stat
+import zipfile
+import logging
+from werkzeug.utils import secure_filename
+from routes import get_handler_for_extension
+from utils.ingest import ingest_stream
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_EXTENSIONS = {"zip"}
+
+# Members smaller than this may compress as well as they like (a page of
+# blank CSV rows easily deflates 1000:1); the ratio guard is for bombs.
+RATIO_EXEMPT_BYTES = 1024 * 1024
+
+
+class ArchiveError(ValueError):
+    """The archive was rejected by a guard or could not be read."""
+
+
+class _GuardedReader:
+    """
+    Read-only wrapper around a member stream that enforces the size limits
+    on the bytes actually decompressed, not just on what the header claims.
+    """
+
+    def __init__(self, stream, member, max_bytes, max_ratio, compressed_size):
+        self._stream = stream
+        self._member = member
+        self._max_bytes = max_bytes
+        self._max_ratio = max_ratio
+        self._compressed = max(compressed_size, 1)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        block = self._stream.read(size)
+        self.bytes_read += len(block)
+        if self.bytes_read > self._max_bytes:
+            raise ArchiveError(f"{self._member} expands past the archive size limit")
+        if self.bytes_read > RATIO_EXEMPT_BYTES and self.bytes_read / self._compressed > self._max_ratio:
+            raise ArchiveError(f"{self._member} expands more than {self._max_ratio}:1")
+        return block
+
+
+class ArchiveExtractor:
+    """
+    Streams the members of an uploaded ZIP into a session directory one at a
+    time, instead of extracting everything up front.
+
+    Iterating yields an ingest record (see utils/ingest.py) for each
+    supported member as soon as it is on disk, so callers can scrub it while
+    the next one is being extracted. Members are flattened into the session
+    directory under a safe name prefixed with the archive's; the original
+    path is kept on the record as "member" so the results can be repackaged
+    with the same layout.
+
+    Guards, checked against the central directory before anything is
+    written and again on the bytes actually decompressed:
+        max_members: members in the archive, directories included
+        max_total_bytes: uncompressed size of everything extracted
+        max_ratio: uncompressed / compressed size, per member and overall
+
+    Directories, symlinks, encrypted members, nested archives and types with
+    no handler are not extracted; they are listed in skipped.
+
+    Raises:
+        ArchiveError: from the constructor or mid-iteration, when the file
+        is not a readable ZIP or a guard trips. Members already yielded stay
+        on disk.
+    """
+
+    def __init__(self, zip_path, dest_dir, max_members=10000, max_total_bytes=2 << 30, max_ratio=100):
+        self.zip_path = zip_path
+        self.dest_dir = dest_dir
+        self.max_members = max_members
+        self.max_total_bytes = max_total_bytes
+        self.max_ratio = max_ratio
+        self.prefix = os.path.splitext(os.path.basename(zip_path))[0]
+        self.skipped = []
+        self.extracted_bytes = 0
+
+        try:
+            self._zf = zipfile.ZipFile(zip_path)
+        except (zipfile.BadZipFile, OSError) as e:
+            raise ArchiveError(f"Not a readable ZIP archive: {e}")
+        try:
+            self._check_directory()
+        except ArchiveError:
+            self._zf.close()
+            raise
+
+    def _check_directory(self):
+        infos = self._zf.infolist()
+        if len(infos) > self.max_members:
+            raise ArchiveError(f"Archive has {len(infos)} members, the limit is {self.max_members}")
+        total = sum(info.file_size for info in infos)
+        compressed = sum(info.compress_size for info in infos)
+        if total > self.max_total_bytes:
+            raise ArchiveError(f"Archive expands to {total} bytes, the limit is {self.max_total_bytes}")
+        if total > RATIO_EXEMPT_BYTES and total / max(compressed, 1) > self.max_ratio:
+            raise ArchiveError(f"Archive expands more than {self.max_ratio}:1")
+
+    def _skip_reason(self, info):
+        if info.is_dir():
+            return None  # Layout only; not worth reporting
+        if stat.S_ISLNK(info.external_attr >> 16):
+            return "Symlink in archive"
+        if info.flag_bits & 0x1:
+            return "Encrypted archive member"
+        ext = os.path.splitext(info.filename)[1].lower().lstrip(".")
+        if ext in ARCHIVE_EXTENSIONS:
+            return "Nested archives are not extracted"
+        if not get_handler_for_extension(ext):
+            return "Unsupported file type"
+        return ""
+
+    def _dest_name(self, member):
+        flat = secure_filename(f"{self.prefix}_{member.replace('/', '_')}")
+        stem, ext = os.path.splitext(flat)
+        name, n = flat, 1
+        while os.path.exists(os.path.join(self.dest_dir, name)):
+            name = f"{stem}_{n}{ext}"
+            n += 1
+        return name
+
+    def __iter__(self):
+        try:
+            for info in self._zf.infolist():
+                reason = self._skip_reason(info)
+                if reason is None:
+                    continue
+                if reason:
+                    self.skipped.append((info.filename, reason))
+                    continue
+                yield self._extract(info)
+        finally:
+            self._zf.close()
+
+    def _extract(self, info):
+        dest_path = os.path.join(self.dest_dir, self._dest_name(info.filename))
+        try:
+            with self._zf.open(info) as src:
+                reader = _GuardedReader(src, info.filename, self.max_total_bytes - self.extracted_bytes,
+                                        self.max_ratio, info.compress_size)
+                record = ingest_stream(reader, dest_path)
+        except (ArchiveError, zipfile.BadZipFile, OSError, EOFError) as e:
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+            if isinstance(e, ArchiveError):
+                raise
+            raise ArchiveError(f"Could not extract {info.filename}: {e}")
+
+        self.extracted_bytes += record["size"]
+        record["member"] = info.filename
+        logger.info(f"Extracted {info.filename} from {os.path.basename(self.zip_path)} ({record['size']} bytes)")
+        return record
+
@@ -0,0 +1,119 @@
+# utils/bundle.py
+
+import os
+import zipfile
+import logging
+from utils.results import load_results
+from utils.pipeline import succeeded
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_CHUNK_BYTES = 1024 * 1024
+
+# Formats that are already compressed; deflating them again just burns CPU.
+STORED_EXTENSIONS = {"jpg", "jpeg", "png", "heic", "pdf", "docx", "xlsx", "gpg", "zip"}
+
+
+class _StreamSink:
+    """
+    Write-only file object that hands bytes back to a generator.
+
+    It can tell() but not seek(), which makes zipfile fall back to its
+    streaming mode (data descriptors after each member) so the archive can
+    be produced front to back without a temp file.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def bundle_members(session_dir):
+    """
+    Scrubbed outputs of a session, from its saved results.
+
+    Only files that came through the scrub are included, with their hash
+    files (or their .gpg copies, or the encrypted archive they were packed
+    into). Failed or timed-out files and report-only results are left out,
+    since what is on disk for them is the unscrubbed original.
+    """
+    names = set()
+    for file_result in load_results(session_dir) or []:
+        if file_result.get("report_only") or file_result.get("archived") or not succeeded(file_result):
+            continue
+        for name in (file_result.get("filename"), file_result.get("hash_file")):
+            if name:
+                names.add(os.path.basename(name))
+    paths = [os.path.join(session_dir, name) for name in sorted(names)]
+    return [path for path in paths if os.path.isfile(path)]
+
+
+def _member_info(path, arcname, store_only):
+    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+    ext = os.path.splitext(arcname)[1].lower().lstrip(".")
+    if store_only or ext in STORED_EXTENSIONS:
+        zinfo.compress_type = zipfile.ZIP_STORED
+    else:
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+    return zinfo
+
+
+def iter_zip(paths, store_only=False, chunk_size=BUNDLE_CHUNK_BYTES):
+    """
+    Yield a ZIP archive of paths as it is built.
+
+    Only about one chunk of file data is held in memory at a time, however
+    large the session is. Already-compressed formats are stored rather than
+    deflated; store_only=True stores everything.
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for path in paths:
+            zinfo = _member_info(path, os.path.basename(path), store_only)
+            with open(path, "rb") as src, zf.open(zinfo, "w") as dst:
+                while True:
+                    block = src.read(chunk_size)
+                    if not block:
+                        break
+                    dst.write(block)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # Central directory, written when the ZipFile closes
+    yield sink.drain()
+
+
+def write_zip(dest_path, members, chunk_size=BUNDLE_CHUNK_BYTES):
+    """
+    Write a ZIP archive to dest_path, with the same store/deflate choice as iter_zip.
+
+    Args:
+        members (list[tuple[str, str]]): (path on disk, name inside the archive)
+    """
+    with zipfile.ZipFile(dest_path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for path, arcname in members:
+            with open(path, "rb") as src, zf.open(_member_info(path, arcname, False), "w") as dst:
+                while True:
+                    block = src.read(chunk_size)
+                    if not block:
+                        break
+                    dst.write(block)
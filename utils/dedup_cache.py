@@ -0,0 +1,129 @@
+# utils/dedup_cache.py
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from importlib import metadata
+
+logger = logging.getLogger(__name__)
+
+# Entries bigger than this fraction of the cache aren't worth evicting everything else for.
+MAX_ENTRY_FRACTION = 4
+
+
+def _core_version():
+    try:
+        return metadata.version("rmeta-core")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+class ScrubCache:
+    """
+    Optional in-memory cache of scrubbed outputs, keyed by content.
+
+    The key is the uploaded file's SHA-256 plus the handler module and the
+    rmeta-core version, so a handler upgrade never serves stale output.
+    Entries live only in this process's memory (never on disk), expire
+    after a TTL tied to SESSION_TIMEOUT, are evicted least-recently-used
+    once the byte budget is full, and are dropped when the session that
+    produced them is cleaned or expires. With shared set
+    (SCRUB_CACHE_SHARED), entries instead outlive their session, so a
+    re-upload that replaces the previous session can still hit them.
+    """
+
+    def __init__(self):
+        self.max_bytes = 0
+        self.ttl = 600
+        self.shared = False
+        self.core_version = _core_version()
+        self._entries = OrderedDict()
+        self._owners = {}  # session dir -> keys of the entries it produced
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def configure(self, max_mb, ttl, shared=False):
+        self.max_bytes = max(0, max_mb) * 1024 * 1024
+        self.ttl = ttl
+        self.shared = shared
+        if not self.enabled:
+            self.clear()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def key(self, input_sha256, handler_name):
+        return hashlib.sha256(f"{input_sha256}:{handler_name}:{self.core_version}".encode()).hexdigest()
+
+    def get(self, key):
+        """Cached entry for key, or None. Hits are moved to the LRU tail."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires"] < time.monotonic():
+                self._evict(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, output_path, file_result):
+        """Cache the scrubbed file at output_path along with its warnings."""
+        if not self.enabled:
+            return
+        try:
+            size = os.path.getsize(output_path)
+            if size > self.max_bytes // MAX_ENTRY_FRACTION:
+                return
+            with open(output_path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            logger.debug(f"Not caching {output_path}: {e}")
+            return
+
+        entry = {
+            "data": data,
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "warnings": list(file_result.get("warnings", [])),
+            "session_dir": os.path.dirname(os.path.abspath(output_path)),
+            "expires": time.monotonic() + self.ttl,
+        }
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = entry
+            self._owners.setdefault(entry["session_dir"], set()).add(key)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and self._entries:
+                self._evict(next(iter(self._entries)))
+
+    def forget_session(self, session_dir):
+        """Drop entries produced by a session that is being cleaned, unless the cache is shared."""
+        if self.shared:
+            return
+        with self._lock:
+            for key in self._owners.pop(os.path.abspath(session_dir), ()):
+                self._evict(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._owners.clear()
+            self._bytes = 0
+
+    def _evict(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= len(entry["data"])
+            keys = self._owners.get(entry["session_dir"])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._owners[entry["session_dir"]]
+
+
+scrub_cache = ScrubCache()
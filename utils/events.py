@@ -0,0 +1,71 @@
+# utils/events.py
+
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+EVENTS_FILE = ".events.jsonl"
+
+# Wakes SSE streams in this process as soon as a local job emits; streams
+# served by other gunicorn workers notice new lines on their next poll.
+_new_events = threading.Condition()
+
+
+def append_event(session_dir, seq, kind, data):
+    """
+    Append one progress event to the session's event log.
+
+    The log is a JSONL file inside the session directory, so whichever
+    worker serves the SSE stream can tail it, and it expires with the
+    session. Each line is written with a single O_APPEND write.
+    """
+    line = json.dumps({"id": seq, "event": kind, "data": data}) + "\n"
+    try:
+        fd = os.open(os.path.join(session_dir, EVENTS_FILE), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+    except OSError as e:
+        logger.debug(f"Could not append event to {session_dir}: {e}")
+        return
+    with _new_events:
+        _new_events.notify_all()
+
+
+def read_events(session_dir, offset=0):
+    """
+    Complete events appended since byte offset.
+
+    Returns:
+        tuple[list[dict], int]: (events, offset to resume from)
+    """
+    try:
+        with open(os.path.join(session_dir, EVENTS_FILE), "rb") as f:
+            f.seek(offset)
+            chunk = f.read()
+    except OSError:
+        return [], offset
+
+    end = chunk.rfind(b"\n") + 1  # Leave a half-written last line for next time
+    events = []
+    for line in chunk[:end].splitlines():
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            continue
+    return events, offset + end
+
+
+def wait_for_events(timeout):
+    """Block until a job in this process emits, or timeout seconds pass."""
+    with _new_events:
+        _new_events.wait(timeout)
+
+
+def format_sse(event):
+    """Render an event dict as a text/event-stream message."""
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
@@ -0,0 +1,249 @@
+# utils/fastscrub.py
+
+import os
+import re
+import mmap
+import logging
+
+logger = logging.getLogger(__name__)
+
+FAST_SCRUB_EXTENSIONS = {"jpg", "jpeg", "png"}
+
+# Largest slice copied from the mapped input in one write
+COPY_BYTES = 1024 * 1024
+
+JPEG_SOI = b"\xff\xd8"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# In entropy-coded data, 0xFF is followed by 0x00 (stuffing) or RST0-7;
+# anything else is the next marker.
+_JPEG_NEXT_MARKER = re.compile(rb"\xff[^\x00\xd0-\xd7]")
+
+# APPn segments kept because decoders need them, keyed by marker and
+# identified by the start of their payload. Every other APPn (EXIF and XMP
+# in APP1, MPF in APP2, IPTC in APP13, JFXX thumbnails, vendor blocks ...)
+# and every COM segment is dropped.
+_JPEG_KEEP_APP = {
+    0xE0: (b"JFIF\x00",),       # Density / version
+    0xE2: (b"ICC_PROFILE\x00",),  # Colour profile
+    0xEE: (b"Adobe",),          # Colour transform (CMYK/YCCK)
+}
+
+# PNG chunks kept: the critical chunks and the ancillary chunks that change
+# how the image renders. Every other chunk, including private and unknown
+# ones (C2PA caBX, vendor blocks ...), is dropped.
+_PNG_KEEP_CHUNKS = {
+    b"IHDR", b"PLTE", b"IDAT", b"IEND",
+    b"tRNS", b"gAMA", b"cHRM", b"sRGB", b"iCCP", b"sBIT", b"pHYs", b"bKGD",
+}
+# Dropped chunks known to hold only metadata; see utils/probe.py
+PNG_METADATA_CHUNKS = {"tEXt", "zTXt", "iTXt", "eXIf", "tIME"}
+
+# Kept blocks that still say something about the device or software that
+# made the image; reported by scan() so the probe never calls them clean
+ICC_LABEL = "ICC profile"
+
+
+class FastScrubError(ValueError):
+    """The file isn't laid out the way the fast path expects; use the full handler."""
+
+
+class _Discard:
+    """Output for a dry run: the walkers run unchanged but nothing is written."""
+
+    def write(self, data):
+        return len(data)
+
+
+def supports(filepath):
+    return os.path.splitext(filepath)[1].lower().lstrip(".") in FAST_SCRUB_EXTENSIONS
+
+
+def _copy(out, view, start, end):
+    while start < end:
+        stop = min(start + COPY_BYTES, end)
+        out.write(view[start:stop])
+        start = stop
+
+
+def _jpeg_label(marker, payload_head):
+    if marker == 0xFE:
+        return "COM"
+    if marker == 0xE1:
+        return "XMP" if payload_head.startswith(b"http://ns.adobe.com/") else "EXIF"
+    if marker == 0xED:
+        return "IPTC"
+    return f"APP{marker - 0xE0}"
+
+
+def _scrub_jpeg(mm, out, headers_only=False, kept=None):
+    view = memoryview(mm)
+    try:
+        size = len(mm)
+        if mm[:2] != JPEG_SOI:
+            raise FastScrubError("missing JPEG start-of-image marker")
+        out.write(JPEG_SOI)
+        removed = []
+        pos = 2
+        while True:
+            if pos + 2 > size or mm[pos] != 0xFF:
+                raise FastScrubError(f"expected a marker at byte {pos}")
+            while pos + 1 < size and mm[pos + 1] == 0xFF:
+                pos += 1  # Fill bytes
+            if pos + 1 >= size:
+                raise FastScrubError(f"file ends in fill bytes at byte {pos}")
+            marker = mm[pos + 1]
+
+            if marker == 0xD9:  # EOI; anything after it (trailers, appended images) is dropped
+                out.write(b"\xff\xd9")
+                if pos + 2 < size:
+                    removed.append("trailing data")
+                return removed
+            if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+                out.write(view[pos:pos + 2])
+                pos += 2
+                continue
+
+            if pos + 4 > size:
+                raise FastScrubError(f"truncated segment at byte {pos}")
+            end = pos + 2 + int.from_bytes(mm[pos + 2:pos + 4], "big")
+            if end > size or end < pos + 4:
+                raise FastScrubError(f"segment at byte {pos} runs past the end of the file")
+
+            if marker == 0xFE or 0xE0 <= marker <= 0xEF:
+                head = mm[pos + 4:min(pos + 36, end)]
+                if not any(head.startswith(sig) for sig in _JPEG_KEEP_APP.get(marker, ())):
+                    removed.append(_jpeg_label(marker, head))
+                    pos = end
+                    continue
+                if marker == 0xE2 and kept is not None and ICC_LABEL not in kept:
+                    kept.append(ICC_LABEL)
+
+            _copy(out, view, pos, end)
+            pos = end
+
+            if marker == 0xDA and headers_only:
+                # Metadata lives ahead of the first scan; past it, only a trailer is likely
+                if mm[size - 2:] != b"\xff\xd9":
+                    removed.append("trailing data")
+                return removed
+            if marker == 0xDA:  # SOS: entropy-coded data runs until the next real marker
+                match = _JPEG_NEXT_MARKER.search(mm, pos)
+                if not match:
+                    raise FastScrubError("scan data has no end marker")
+                _copy(out, view, pos, match.start())
+                pos = match.start()
+    finally:
+        view.release()
+
+
+def _scrub_png(mm, out, headers_only=False, kept=None):
+    view = memoryview(mm)
+    try:
+        size = len(mm)
+        if mm[:8] != PNG_SIGNATURE:
+            raise FastScrubError("missing PNG signature")
+        out.write(PNG_SIGNATURE)
+        removed = []
+        pos = 8
+        while pos + 8 <= size:
+            length = int.from_bytes(mm[pos:pos + 4], "big")
+            kind = mm[pos + 4:pos + 8]
+            end = pos + 12 + length  # length, type, data, CRC
+            if end > size:
+                raise FastScrubError(f"{kind!r} chunk at byte {pos} runs past the end of the file")
+            if kind not in _PNG_KEEP_CHUNKS:
+                removed.append(kind.decode("ascii", errors="replace"))
+            else:
+                _copy(out, view, pos, end)  # CRC covers type + data, so it is copied as is
+                if kind == b"iCCP" and kept is not None:
+                    kept.append(ICC_LABEL)
+            pos = end
+            if kind == b"IEND":
+                if pos < size:
+                    removed.append("trailing data")
+                return removed
+        raise FastScrubError("no IEND chunk")
+    finally:
+        view.release()
+
+
+def _walker(filepath):
+    ext = os.path.splitext(filepath)[1].lower().lstrip(".")
+    return _scrub_png if ext == "png" else _scrub_jpeg
+
+
+def scan(filepath):
+    """
+    Labels of the metadata blocks fast_scrub would remove, without writing,
+    followed by ICC_LABEL if the file carries a colour profile (which
+    fast_scrub keeps, but the full handler may not).
+
+    JPEGs are only walked up to the first scan, plus a check for data after
+    the end-of-image marker, so the compressed pixel data is never read.
+    PNG chunks are labelled by their type, so unknown ones can be told
+    apart from PNG_METADATA_CHUNKS.
+
+    Raises:
+        FastScrubError: As fast_scrub.
+    """
+    with open(filepath, "rb") as src:
+        try:
+            mm = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise FastScrubError("empty file")
+        try:
+            kept = []
+            removed = _walker(filepath)(mm, _Discard(), headers_only=True, kept=kept)
+            return removed + kept
+        finally:
+            mm.close()
+
+
+def fast_scrub(filepath):
+    """
+    Strip metadata from a JPEG or PNG without decoding it.
+
+    The file is memory-mapped and rewritten by walking its segments
+    (JPEG) or chunks (PNG): metadata blocks are dropped and everything
+    else, including the compressed pixel data, is copied byte for byte in
+    bounded slices, so there is no re-encode and no quality loss. The
+    result replaces the file only once it is complete.
+
+    Dropped: JPEG APP1 (EXIF, XMP), APP13 (IPTC), COM, other vendor APPn
+    blocks and data after EOI; every PNG chunk other than IHDR, PLTE,
+    IDAT, IEND and the rendering chunks tRNS, gAMA, cHRM, sRGB, iCCP, sBIT,
+    pHYs and bKGD (so tEXt, zTXt, iTXt, eXIf, tIME, private and unknown
+    chunks all go), and data after IEND.
+    Kept: JFIF, ICC profiles and Adobe colour transforms, which decoders
+    need.
+
+    Returns:
+        list[str]: Labels of the blocks that were removed.
+
+    Raises:
+        FastScrubError: The file is malformed or not the type its
+        extension says; the caller should fall back to the full handler.
+    """
+    scrub = _walker(filepath)
+    directory, filename = os.path.split(filepath)
+    tmp_path = os.path.join(directory, f".{filename}.fast.tmp")
+
+    try:
+        with open(filepath, "rb") as src:
+            try:
+                mm = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise FastScrubError("empty file")
+            try:
+                with open(tmp_path, "wb") as out:
+                    removed = scrub(mm, out)
+            finally:
+                mm.close()
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    logger.info(f"Fast-scrubbed {filename}: removed {', '.join(removed) or 'nothing'}")
+    return removed
@@ -0,0 +1,247 @@
+# utils/gpg.py
+
+import os
+import time
+import shutil
+import tarfile
+import tempfile
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from utils.pipeline import succeeded
+
+logger = logging.getLogger(__name__)
+
+GPG_HOME_DIRNAME = ".gnupg"
+
+
+class GPGError(RuntimeError):
+    pass
+
+
+class SessionKeyring:
+    """
+    A throwaway GnuPG home inside one session directory.
+
+    The uploaded public key is imported exactly once; every file in the
+    batch is then encrypted against that keyring, and the keyring is
+    deleted along with the session.
+    """
+
+    def __init__(self, session_dir, key_path):
+        self.gpg = shutil.which("gpg")
+        if not self.gpg:
+            raise GPGError("gpg is not installed")
+
+        self.homedir = os.path.join(session_dir, GPG_HOME_DIRNAME)
+        os.makedirs(self.homedir, mode=0o700, exist_ok=True)
+        self._run("--import", key_path)
+        self.fingerprints = self._fingerprints()
+        if not self.fingerprints:
+            raise GPGError("No usable public key found in the uploaded key file")
+
+    def _run(self, *args, **kwargs):
+        cmd = [self.gpg, "--homedir", self.homedir, "--batch", "--yes", "--no-tty", *args]
+        result = subprocess.run(cmd, capture_output=True, **kwargs)
+        if result.returncode != 0:
+            raise GPGError(result.stderr.decode(errors="replace").strip() or f"gpg exited with {result.returncode}")
+        return result
+
+    def _fingerprints(self):
+        out = self._run("--with-colons", "--list-keys").stdout.decode(errors="replace")
+        fingerprints, in_pub = [], False
+        for line in out.splitlines():
+            fields = line.split(":")
+            if fields[0] == "pub":
+                in_pub = True
+            elif fields[0] == "fpr" and in_pub:
+                fingerprints.append(fields[9])
+                in_pub = False
+        return fingerprints
+
+    def _recipient_args(self):
+        args = ["--trust-model", "always"]
+        for fpr in self.fingerprints:
+            args += ["--recipient", fpr]
+        return args
+
+    def encrypt_files(self, filepaths, progress=None):
+        """
+        Encrypt each file to <file>.gpg next to it, all in one gpg process.
+
+        gpg's --encrypt-files (multifile mode) works through the list in
+        order and reports FILE_START / END_ENCRYPTION / FILE_DONE for each
+        file on its status fd, which gives per-file timing and success
+        without a process per file. A file that fails doesn't stop the rest.
+
+        Args:
+            progress: Called as progress(filepath, state) when a file starts
+                ("encrypting") and finishes ("done").
+
+        Returns:
+            tuple[list[float | None], str]: Elapsed milliseconds per file, in
+            order (None where it failed), and gpg's error output.
+        """
+        cmd = [self.gpg, "--homedir", self.homedir, "--batch", "--yes", "--no-tty", "--status-fd", "1",
+               *self._recipient_args(), "--encrypt-files", "--", *filepaths]
+        elapsed = [None] * len(filepaths)
+        index, started, encrypted = -1, 0.0, False
+        with tempfile.TemporaryFile() as stderr:
+            proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr)
+            for line in proc.stdout:
+                fields = line.split()
+                if len(fields) < 2 or fields[0] != b"[GNUPG:]":
+                    continue
+                if fields[1] == b"FILE_START" and index + 1 < len(filepaths):
+                    index, started, encrypted = index + 1, time.perf_counter(), False
+                    if progress:
+                        progress(filepaths[index], "encrypting")
+                elif fields[1] == b"END_ENCRYPTION":
+                    encrypted = True
+                elif fields[1] == b"FILE_DONE" and index >= 0:
+                    if encrypted and os.path.exists(f"{filepaths[index]}.gpg"):
+                        elapsed[index] = (time.perf_counter() - started) * 1000
+                    if progress:
+                        progress(filepaths[index], "done")
+            proc.wait()
+            stderr.seek(0)
+            errors = stderr.read().decode(errors="replace").strip()
+        if proc.returncode != 0 and not errors:
+            errors = f"gpg exited with {proc.returncode}"
+        return elapsed, errors
+
+    def encrypt_archive(self, filepaths, output):
+        """
+        Stream a tar of filepaths straight into a single gpg process.
+
+        No plaintext archive is ever written to disk.
+
+        Returns:
+            float: Elapsed milliseconds.
+        """
+        start = time.perf_counter()
+        cmd = [self.gpg, "--homedir", self.homedir, "--batch", "--yes", "--no-tty",
+               *self._recipient_args(), "--output", output, "--encrypt"]
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            with tarfile.open(fileobj=proc.stdin, mode="w|") as tar:
+                for path in filepaths:
+                    tar.add(path, arcname=os.path.basename(path))
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass  # gpg died; its stderr says why
+        stderr = proc.stderr.read()
+        if proc.wait() != 0:
+            raise GPGError(stderr.decode(errors="replace").strip() or f"gpg exited with {proc.returncode}")
+        return (time.perf_counter() - start) * 1000
+
+
+def _remove_plaintext(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not remove plaintext {os.path.basename(path)} after encrypting it: {e}")
+
+
+def encrypt_outputs(session_dir, key_path, file_results, workers=2, archive_name=None, progress=None, keyring=None):
+    """
+    GPG postprocessing stage for a finished batch.
+
+    Imports the session's key once, then either splits the outputs into
+    `workers` slices, each encrypted by one long-lived gpg --encrypt-files
+    process sharing that keyring, or (with archive_name) streams all outputs
+    and hash files into one encrypted tar. Per-file timing, read from gpg's
+    status output, is recorded in file_result["gpg_ms"].
+
+    Plaintext is deleted once it is safely encrypted, so only the .gpg
+    copies can be downloaded. In archive mode the packed outputs and hash
+    files go, and each file_result is flagged "archived" with no hash file
+    of its own; a file left unencrypted by a failure keeps its plaintext.
+
+    file_result["filename"] is resolved relative to session_dir. Callers
+    that run many batches against one key (the CLI renderer) can pass an
+    already imported keyring instead of key_path.
+
+    Only files that came through the scrub (succeeded()) are encrypted or
+    packed; failed and timed-out files are left alone with a warning, so an
+    unscrubbed original never goes out under an encrypted "clean" label.
+
+    Returns:
+        dict | None: A file_result for the archive, if one was made.
+    """
+    for file_result in file_results:
+        if not succeeded(file_result):
+            file_result["warnings"].append("Not encrypted: the file could not be scrubbed")
+    file_results = [file_result for file_result in file_results if succeeded(file_result)]
+    if not file_results:
+        return None
+
+    if keyring is None:
+        if not key_path:
+            for file_result in file_results:
+                file_result["warnings"].append("GPG encryption requested but no key provided.")
+            return None
+
+        try:
+            keyring = SessionKeyring(session_dir, key_path)
+        except (GPGError, OSError) as e:
+            logger.error(f"GPG key import failed for {session_dir}: {e}")
+            for file_result in file_results:
+                file_result["warnings"].append(f"GPG encryption failed: {str(e)}")
+            return None
+
+    if archive_name:
+        paths = []
+        for file_result in file_results:
+            paths.append(os.path.join(session_dir, file_result["filename"]))
+            if file_result.get("hash_file"):
+                paths.append(os.path.join(session_dir, file_result["hash_file"]))
+        try:
+            elapsed = keyring.encrypt_archive(paths, os.path.join(session_dir, archive_name))
+        except (GPGError, OSError) as e:
+            logger.error(f"GPG archive encryption failed: {e}")
+            for file_result in file_results:
+                file_result["warnings"].append(f"GPG encryption failed: {str(e)}")
+            return None
+        logger.info(f"Encrypted {len(paths)} files into {archive_name} in {elapsed:.0f}ms")
+        for path in paths:
+            _remove_plaintext(path)
+        for file_result in file_results:
+            file_result["archived"] = True
+            file_result["hash_file"] = None
+        return {
+            "filename": archive_name,
+            "warnings": [],
+            "metadata_msg": f"Metadata stripped from {len(file_results)} files, packed into an encrypted archive",
+            "hash_file": None,
+            "encrypted": True,
+            "gpg_ms": round(elapsed, 1),
+        }
+
+    def encrypt_slice(slice_results):
+        filepaths = [os.path.join(session_dir, r["filename"]) for r in slice_results]
+        start = time.perf_counter()
+        try:
+            elapsed, errors = keyring.encrypt_files(filepaths, progress=progress)
+        except OSError as e:
+            elapsed, errors = [None] * len(filepaths), str(e)
+        for filepath, file_result, ms in zip(filepaths, slice_results, elapsed):
+            if ms is None:
+                if os.path.exists(f"{filepath}.gpg"):
+                    os.remove(f"{filepath}.gpg")  # Partial output of a failed file
+                own = "\n".join(line for line in errors.splitlines() if filepath in line)  # Just this file's errors
+                file_result["warnings"].append(f"GPG encryption failed: {own or errors or 'no output written'}")
+                continue
+            _remove_plaintext(filepath)
+            file_result["filename"] = f"{file_result['filename']}.gpg"
+            file_result["encrypted"] = True
+            file_result["gpg_ms"] = round(ms, 1)
+        logger.info(f"Encrypted {sum(ms is not None for ms in elapsed)}/{len(filepaths)} files in one gpg process"
+                    f" ({(time.perf_counter() - start) * 1000:.0f}ms)")
+
+    # One long-lived gpg per slice instead of one process per file
+    workers = max(1, min(workers, len(file_results)))
+    slices = [file_results[i::workers] for i in range(workers)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(encrypt_slice, slices))
+    return None
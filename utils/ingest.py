@@ -0,0 +1,162 @@
+# utils/ingest.py
+
+import os
+import hashlib
+import logging
+from routes import get_handler_for_extension
+
+logger = logging.getLogger(__name__)
+
+# Large blocks keep syscall and hashing overhead down on multi-GB uploads.
+INGEST_CHUNK_BYTES = 4 * 1024 * 1024
+
+# Leading bytes -> sniffed type. HEIC is matched separately (ftyp box at offset 4).
+MAGIC_NUMBERS = [
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"%PDF-", "pdf"),
+    (b"PK\x03\x04", "zip"),
+]
+HEIC_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"mif1", b"msf1"}
+
+# What each extension is expected to sniff as (None = no reliable signature).
+EXPECTED_TYPES = {
+    "jpg": "jpg",
+    "jpeg": "jpg",
+    "png": "png",
+    "pdf": "pdf",
+    "heic": "heic",
+    "docx": "zip",
+    "xlsx": "zip",
+}
+
+
+def sniff_type(head):
+    """Guess a file's type from its first few bytes, or None if unknown."""
+    for magic, kind in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return kind
+    if len(head) >= 12 and head[4:8] == b"ftyp" and head[8:12] in HEIC_BRANDS:
+        return "heic"
+    return None
+
+
+def ingest_upload(file_storage, dest_path, chunk_size=INGEST_CHUNK_BYTES):
+    """
+    Stream one uploaded file to disk, sizing, hashing and sniffing it on the way.
+
+    This replaces file.save() followed by separate stat/hash passes: the
+    body is read exactly once and everything later stages need is captured
+    in the returned record.
+
+    Returns:
+        dict: Ingest record with path, filename, ext, size, sha256 and sniffed_type.
+    """
+    return ingest_stream(file_storage.stream, dest_path, chunk_size)
+
+
+def ingest_stream(stream, dest_path, chunk_size=INGEST_CHUNK_BYTES):
+    """ingest_upload for any readable stream, e.g. a member of an uploaded archive."""
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+
+    with open(dest_path, "wb") as out:
+        while True:
+            block = stream.read(chunk_size)
+            if not block:
+                break
+            if len(head) < 16:
+                head += block[:16 - len(head)]
+            digest.update(block)
+            out.write(block)
+            size += len(block)
+
+    return make_record(dest_path, size, digest.hexdigest(), head)
+
+
+def make_record(dest_path, size, sha256, head):
+    """Build an ingest record, sniffing head and warning if it contradicts the extension."""
+    filename = os.path.basename(dest_path)
+    ext = os.path.splitext(filename)[1].lower().lstrip(".")
+    sniffed = sniff_type(head)
+
+    expected = EXPECTED_TYPES.get(ext)
+    if expected and sniffed and sniffed != expected:
+        logger.warning(f"{filename}: content looks like {sniffed}, not {ext}")
+
+    return {
+        "path": dest_path,
+        "filename": filename,
+        "ext": ext,
+        "size": size,
+        "sha256": sha256,
+        "sniffed_type": sniffed,
+    }
+
+
+def audit_records(records):
+    """
+    Split ingest records into supported and skipped.
+
+    Memory is no longer checked here: the admission controller queues
+    files that don't fit yet instead of turning them away.
+
+    Returns:
+        tuple: (supported records, [(path, reason)] skipped)
+    """
+    supported, skipped = [], []
+    for record in records:
+        if not get_handler_for_extension(record["ext"]):
+            skipped.append((record["path"], "Unsupported file type"))
+            continue
+        supported.append(record)
+    return supported, skipped
+
+
+def chunk_records(records, chunk_mb):
+    """Group records into lists of paths of roughly chunk_mb each, keeping order."""
+    chunks, current, current_bytes = [], [], 0
+    limit = chunk_mb * 1024 * 1024
+    for record in records:
+        if current and current_bytes + record["size"] > limit:
+            chunks.append(current)
+            current, current_bytes = [], 0
+        current.append(record["path"])
+        current_bytes += record["size"]
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def file_sha256(filepath, chunk_size=INGEST_CHUNK_BYTES):
+    """SHA-256 of a file on disk, read once through a reused buffer."""
+    digest = hashlib.sha256()
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(filepath, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def hash_output(filepath, known_digest=None, chunk_size=INGEST_CHUNK_BYTES):
+    """
+    Write <file>.sha256.txt next to a processed file in a single read pass.
+
+    Pass known_digest when the caller already knows the file is unchanged
+    since ingest (e.g. the scrub was skipped) to avoid reading it at all.
+
+    Returns:
+        str: The hash file's name (relative to the file's directory).
+    """
+    hex_digest = known_digest or file_sha256(filepath, chunk_size)
+
+    filename = os.path.basename(filepath)
+    hash_filename = f"{filename}.sha256.txt"
+    with open(os.path.join(os.path.dirname(filepath), hash_filename), "w") as f:
+        f.write(f"{hex_digest}  {filename}\n")
+    return hash_filename
@@ -0,0 +1,303 @@
+# utils/jobs.py
+
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from utils.sessions import session_path
+from utils.events import append_event
+from utils.admission import process_identity
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUS_FILE = ".job.json"
+IDLE_EXIT_SECONDS = 5
+# Per-file state changes rewrite the snapshot at most this often; the event log has every one
+SAVE_INTERVAL_SECONDS = 1.0
+
+
+class Job:
+    """
+    One upload batch being scrubbed in the background.
+
+    Jobs are keyed by session_id: a session holds at most one batch, so the
+    job id handed back to the client is the session id itself. State is
+    also written to <session_dir>/.job.json so any worker process can
+    answer a status request, not just the one running the job: at once for
+    status and message changes, and at most every SAVE_INTERVAL_SECONDS
+    for per-file states, so a 10,000-member archive doesn't rewrite a
+    10,000-entry snapshot per file. Every change is appended to the
+    session's event log (utils/events.py) for SSE streams.
+    The snapshot names the owning process, so a job whose worker was killed
+    or recycled mid-run is reported failed instead of running forever.
+    """
+
+    def __init__(self, session_id, session_dir, filepaths):
+        self.job_id = session_id
+        self.session_id = session_id
+        self.session_dir = session_dir
+        self.status = "queued"
+        self.files = [{"filename": os.path.basename(p), "state": "queued"} for p in filepaths]
+        self.results = []
+        self.messages = []
+        self.created = time.time()
+        self.finished = None
+        self._index = {os.path.basename(p): i for i, p in enumerate(filepaths)}
+        self._file_results = {}
+        self._seq = 0
+        self._saved_at = 0.0
+        self._owner = {"pid": os.getpid(), "identity": process_identity(os.getpid())}
+        self._lock = threading.Lock()
+
+    def add_file(self, filepath):
+        """Track a file that only turned up mid-job, such as a member extracted from an archive."""
+        with self._lock:
+            i = len(self.files)
+            self.files.append({"filename": os.path.basename(filepath), "state": "queued"})
+            self._index[self.files[i]["filename"]] = i
+            self._emit_file(i, self.files[i]["filename"], "queued", None)
+            self._save(throttle=True)
+
+    def mark_file(self, filepath, state):
+        """Record a per-file state change (queued, processing, done, failed, skipped, extracting)."""
+        with self._lock:
+            i = self._index.get(os.path.basename(filepath))
+            if i is not None:
+                self.files[i]["state"] = state
+                self._emit_file(i, self.files[i]["filename"], state, self._file_results.get(i))
+            self._save(throttle=True)
+
+    def add_result(self, filepath, file_result):
+        """Store a finished file_result (in upload order) and mark the file done."""
+        with self._lock:
+            self.results.append(file_result)
+            i = self._index.get(os.path.basename(filepath))
+            if i is not None:
+                self.files[i]["state"] = "done"
+                self._file_results[i] = file_result
+            self._emit_file(i, file_result["filename"], "done", file_result)
+            self._save(throttle=True)
+
+    def add_message(self, message):
+        with self._lock:
+            self.messages.append(message)
+            self._save()
+
+    def set_status(self, status):
+        with self._lock:
+            self.status = status
+            if status in ("done", "failed"):
+                self.finished = time.time()
+            self._save()
+            status_dict = self.to_dict()
+            self._emit("status", {k: status_dict[k] for k in ("status", "completed", "total", "messages")})
+
+    def _emit_file(self, index, filename, state, file_result):
+        """Caller holds the lock. index is None for extra outputs such as a GPG archive."""
+        data = {"index": index, "filename": filename, "state": state}
+        if file_result is not None:
+            data["result"] = {
+                key: file_result.get(key)
+                for key in ("filename", "warnings", "metadata_msg", "hash_file", "encrypted", "archived",
+                            "already_clean", "report_only", "metadata_found")
+            }
+        self._emit("file", data)
+
+    def _emit(self, kind, data):
+        self._seq += 1
+        append_event(self.session_dir, self._seq, kind, data)
+
+    def to_dict(self):
+        done = sum(1 for f in self.files if f["state"] in ("done", "failed", "skipped"))
+        return {
+            "job_id": self.job_id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "total": len(self.files),
+            "completed": done,
+            "files": [dict(f) for f in self.files],
+            "messages": list(self.messages),
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+    def _save(self, throttle=False):
+        """Write the snapshot; with throttle set, skip it if one was written in the last SAVE_INTERVAL_SECONDS."""
+        now = time.monotonic()
+        if throttle and now - self._saved_at < SAVE_INTERVAL_SECONDS:
+            return
+        self._saved_at = now
+        if not os.path.isdir(self.session_dir):
+            return  # Session was cleaned up underneath us
+        path = os.path.join(self.session_dir, JOB_STATUS_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(dict(self.to_dict(), owner=self._owner), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write job status for {self.job_id}: {e}")
+
+
+def _orphaned(status):
+    """True if an unfinished snapshot's owning process is gone (or the snapshot names none)."""
+    if status.get("status") not in ("queued", "running"):
+        return False
+    owner = status.get("owner") or {}
+    return not owner.get("identity") or owner["identity"] != process_identity(owner["pid"])
+
+
+def load_job_status(session_dir):
+    """
+    Read the last status snapshot written for a session, or None.
+
+    A queued or running job whose worker process has died is marked failed
+    here, and the snapshot rewritten, so pages and SSE streams stop waiting
+    for it.
+    """
+    path = os.path.join(session_dir, JOB_STATUS_FILE)
+    try:
+        with open(path) as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not _orphaned(status):
+        return status
+
+    logger.warning(f"Job {status.get('job_id')} lost its worker process; marking it failed")
+    status["status"] = "failed"
+    status["finished"] = time.time()
+    status["messages"].append("Processing was interrupted before it finished; please upload the files again.")
+    for f in status["files"]:
+        if f["state"] not in ("done", "failed", "skipped"):
+            f["state"] = "failed"
+    status["completed"] = len(status["files"])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(status, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write job status for {status.get('job_id')}: {e}")
+    return status
+
+
+class JobQueue:
+    """
+    In-process FIFO of scrub jobs served by a few background threads.
+
+    Threads are started on demand and exit after sitting idle, so a
+    gunicorn worker that is being recycled isn't held up waiting on them,
+    and a forked child never inherits a dead thread from its parent.
+    """
+
+    def __init__(self, workers=1):
+        self.workers = max(1, workers)
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._threads = []
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def configure(self, workers):
+        self.workers = max(1, workers)
+
+    def submit(self, job, fn, *args):
+        """Queue fn(job, *args) to run in the background and return the job."""
+        job._save()  # Before queueing, so it can't race the worker's first update
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked since the last submit: parent's threads and jobs aren't ours.
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                self._jobs = {}
+                self._threads = []
+            self._jobs[job.job_id] = job
+            self._queue.put((job, fn, args))
+            self._threads = [t for t in self._threads if t.is_alive()]
+            if len(self._threads) < self.workers:
+                t = threading.Thread(target=self._worker, name="rmeta-job", daemon=False)
+                t.start()
+                self._threads.append(t)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def depth(self):
+        """Number of jobs waiting to start."""
+        return self._queue.qsize()
+
+    def _worker(self):
+        while True:
+            try:
+                job, fn, args = self._queue.get(timeout=IDLE_EXIT_SECONDS)
+            except queue.Empty:
+                # Re-check under the lock so submit() can't queue a job
+                # just as the last thread decides to exit.
+                with self._lock:
+                    if self._queue.empty():
+                        if threading.current_thread() in self._threads:
+                            self._threads.remove(threading.current_thread())
+                        return
+                continue
+            job.set_status("running")
+            try:
+                fn(job, *args)
+                job.set_status("done")
+            except Exception as e:
+                logger.exception(f"Job {job.job_id} failed: {e}")
+                job.add_message(f"Processing failed: {str(e)}")
+                job.set_status("failed")
+            finally:
+                self._queue.task_done()
+                # Drop finished jobs; the status file keeps the final snapshot.
+                with self._lock:
+                    self._jobs.pop(job.job_id, None)
+
+
+job_queue = JobQueue()
+
+
+def get_job_status(session_dir, job_id):
+    """Status for a job, preferring the live in-memory copy over the snapshot."""
+    job = job_queue.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    return load_job_status(session_dir)
+
+
+def job_in_progress(session_dir, job_id):
+    """True while the session's job is queued or running, so its files are still in use."""
+    status = get_job_status(session_dir, job_id)
+    return bool(status) and status["status"] in ("queued", "running")
+
+
+def collect_job(session_store, sessions_root):
+    """
+    Check on the job recorded in the user's Flask session.
+
+    Once the job has finished it is dropped from the session and its
+    messages are returned so the page can show them once; the results
+    themselves are in the session's result store. While it is still running
+    the live status is returned instead so the page can render progress.
+
+    Returns:
+        tuple[dict | None, list[str]]: (running job status, finished job messages)
+    """
+    job_id = session_store.get("job_id")
+    if not job_id:
+        return None, []
+
+    status = get_job_status(session_path(sessions_root, job_id), job_id)
+    if status is None:
+        session_store.pop("job_id", None)
+        return None, []
+
+    if status["status"] in ("done", "failed"):
+        session_store.pop("job_id", None)
+        return None, status["messages"]
+
+    return status, []
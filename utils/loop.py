@@ -0,0 +1,81 @@
+# utils/loop.py
+
+import os
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class LoopRunner:
+    """
+    One long-lived asyncio event loop per process, run on a daemon thread.
+
+    SCRUB_EXECUTOR=async batches run on this loop. Handler calls made from
+    pool threads use run_on_thread_loop instead, so they aren't serialized
+    behind each other here.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def loop(self):
+        with self._lock:
+            # A forked child inherits the loop object but not its thread.
+            if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="rmeta-loop", daemon=True)
+                self._thread.start()
+                logger.debug(f"Started event loop thread in process {self._pid}")
+            return self._loop
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the shared loop from any thread and wait for its result."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop())
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            future.cancel()
+            raise
+
+
+class _ThreadLoop:
+    """An event loop owned by one thread, closed when that thread goes away."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.loop = asyncio.new_event_loop()
+
+    def __del__(self):
+        # A forked child must not close the parent's selector
+        if self.pid == os.getpid() and not self.loop.is_closed():
+            self.loop.close()
+
+
+_thread_loops = threading.local()
+
+
+def run_on_thread_loop(coro):
+    """
+    Run a coroutine to completion on the calling thread's own event loop.
+
+    For async handlers called from scrub pool threads: each thread keeps
+    one loop for all its files, so CPU-bound async scrubs run in parallel
+    across the pool instead of queuing on the shared loop.
+    """
+    holder = getattr(_thread_loops, "holder", None)
+    if holder is None or holder.pid != os.getpid() or holder.loop.is_closed():
+        holder = _thread_loops.holder = _ThreadLoop()
+    return holder.loop.run_until_complete(coro)
+
+
+loop_runner = LoopRunner()
+
+
+def run_async(coro, timeout=None):
+    return loop_runner.run(coro, timeout)
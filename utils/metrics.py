@@ -0,0 +1,268 @@
+# utils/metrics.py
+
+import os
+import json
+import time
+import uuid
+import atexit
+import fcntl
+import bisect
+import logging
+import threading
+from multiprocessing import util as mp_util
+from utils.stages import add_observer, remove_observer
+from utils.admission import process_identity
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIRNAME = ".metrics"
+ARCHIVE_FILE = "archive.json"
+LOCK_FILE = ".lock"
+FLUSH_INTERVAL = 5
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS_MB = ((1, "lt_1mb"), (10, "1_10mb"), (100, "10_100mb"))
+PER_FILE_STAGES = ("save", "scrub", "hash")
+
+HELP = {
+    "rmeta_stage_seconds": ("histogram", "Time spent in each pipeline stage."),
+    "rmeta_file_stage_seconds": ("histogram", "Per-file stage time by file type and size bucket."),
+    "rmeta_job_queue_depth": ("gauge", "Upload jobs waiting to start, summed over workers."),
+    "rmeta_workers": ("gauge", "Worker processes currently reporting metrics."),
+    "rmeta_sessions": ("gauge", "Live upload sessions."),
+    "rmeta_session_files": ("gauge", "Files held across live sessions."),
+    "rmeta_session_bytes": ("gauge", "Bytes held across live sessions."),
+    "rmeta_admission_headroom_mb": ("gauge", "Unreserved memory tokens in the shared admission budget."),
+}
+
+
+def size_bucket(nbytes):
+    size_mb = nbytes / (1024 * 1024)
+    for limit, label in SIZE_BUCKETS_MB:
+        if size_mb < limit:
+            return label
+    return f"gt_{SIZE_BUCKETS_MB[-1][0]}mb"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _label_str(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _merge(into, histograms):
+    for metric, labels, counts, total, count in histograms:
+        key = (metric, tuple(tuple(pair) for pair in labels))
+        entry = into.setdefault(key, [[0] * len(counts), 0.0, 0])
+        entry[0] = [a + b for a, b in zip(entry[0], counts)]
+        entry[1] += total
+        entry[2] += count
+
+
+class MetricsCollector:
+    """
+    Prometheus metrics for the pipeline, aggregated across worker processes.
+
+    Off unless METRICS_ENABLED is set; when off nothing is registered with
+    utils/stages.py, so the hot path pays a single empty-list check. When
+    on, each process keeps its own histograms and a background thread
+    writes them to <upload folder>/.metrics/<pid>-<id>.json every few
+    seconds (and at exit). /metrics, served by whichever worker gets the
+    scrape, sums the files of live processes; files left by dead workers
+    are folded into an archive so counters don't go backwards when a
+    worker is recycled.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._identity = None
+        self._token = None
+
+    def configure(self, enabled, root):
+        self.enabled = bool(enabled)
+        self.directory = os.path.join(os.path.abspath(root), METRICS_DIRNAME)
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            add_observer(self)
+        else:
+            remove_observer(self)
+
+    # utils.stages observer interface
+
+    def stage_started(self, name):
+        pass
+
+    def stage_finished(self, name, elapsed, labels):
+        self._ensure_started()
+        self._observe("rmeta_stage_seconds", (("stage", name),), elapsed)
+        path = labels.get("path")
+        if name in PER_FILE_STAGES and path:
+            ext = os.path.splitext(path)[1].lower().lstrip(".") or "none"
+            try:
+                bucket = size_bucket(os.path.getsize(path))
+            except OSError:
+                bucket = "unknown"
+            self._observe("rmeta_file_stage_seconds", (("stage", name), ("type", ext), ("size", bucket)), elapsed)
+
+    def _observe(self, metric, labels, value):
+        index = bisect.bisect_left(SECONDS_BUCKETS, value)
+        with self._lock:
+            entry = self._histograms.get((metric, labels))
+            if entry is None:
+                entry = self._histograms[(metric, labels)] = [[0] * (len(SECONDS_BUCKETS) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    # Per-process snapshots
+
+    def _ensure_started(self):
+        # Forked children (gunicorn workers, process-pool scrubbers) start
+        # with the parent's counts; they report only their own.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._histograms = {}
+            self._pid = os.getpid()
+            self._identity = process_identity(self._pid)
+            self._token = uuid.uuid4().hex[:8]
+            self._thread = threading.Thread(target=self._run, name="rmeta-metrics", daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+        # Process-pool workers skip atexit but do run multiprocessing finalizers
+        mp_util.Finalize(None, self.flush, exitpriority=10)
+
+    @property
+    def _snapshot_path(self):
+        return os.path.join(self.directory, f"{self._pid}-{self._token}.json")
+
+    def flush(self):
+        """Write this process's histograms and gauges for other workers to read."""
+        if not self.enabled or self._pid != os.getpid():
+            return
+        from utils.jobs import job_queue
+        with self._lock:
+            histograms = [[m, list(labels), list(e[0]), e[1], e[2]] for (m, labels), e in self._histograms.items()]
+        snapshot = {
+            "pid": self._pid,
+            "identity": self._identity,
+            "written": time.time(),
+            "histograms": histograms,
+            "gauges": {"rmeta_job_queue_depth": job_queue.depth()},
+        }
+        tmp_path = f"{self._snapshot_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self._snapshot_path)
+        except OSError as e:
+            logger.debug(f"Could not write metrics snapshot: {e}")
+
+    def _run(self):
+        while self._pid == os.getpid():
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    # Scrape
+
+    def collect(self):
+        """
+        Merge every process's snapshot.
+
+        Returns:
+            tuple[dict, dict]: (histograms keyed by (metric, labels), summed gauges)
+        """
+        self._ensure_started()
+        self.flush()
+
+        histograms, gauges, live = {}, {}, 0
+        lock_fd = os.open(os.path.join(self.directory, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+            archive = self._read(archive_path) or {"histograms": []}
+            archived = {}
+            _merge(archived, archive["histograms"])
+
+            dead = []
+            for name in os.listdir(self.directory):
+                if name in (ARCHIVE_FILE, LOCK_FILE) or not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.directory, name)
+                snapshot = self._read(path)
+                if snapshot is None:
+                    continue
+                # Snapshots survive restarts on the bind mount, and a restarted
+                # container reuses PIDs, so a PID alone doesn't prove liveness
+                if snapshot.get("identity") and snapshot["identity"] == process_identity(snapshot["pid"]):
+                    live += 1
+                    _merge(histograms, snapshot["histograms"])
+                    for gauge, value in snapshot["gauges"].items():
+                        gauges[gauge] = gauges.get(gauge, 0) + value
+                else:
+                    _merge(archived, snapshot["histograms"])
+                    dead.append(path)
+
+            if dead:
+                archive["histograms"] = [[m, list(labels), *e] for (m, labels), e in archived.items()]
+                with open(f"{archive_path}.tmp", "w") as f:
+                    json.dump(archive, f)
+                os.replace(f"{archive_path}.tmp", archive_path)
+                for path in dead:
+                    os.remove(path)
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+
+        for key, (counts, total, count) in archived.items():
+            _merge(histograms, [[key[0], key[1], counts, total, count]])
+        gauges["rmeta_workers"] = live
+        return histograms, gauges
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def render(self, extra_gauges=None):
+        """All metrics in Prometheus text exposition format (0.0.4)."""
+        histograms, gauges = self.collect()
+        gauges.update(extra_gauges or {})
+
+        lines = []
+        by_metric = {}
+        for (metric, labels), entry in sorted(histograms.items()):
+            by_metric.setdefault(metric, []).append((labels, entry))
+        for metric, series in by_metric.items():
+            kind, help_text = HELP[metric]
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            for labels, (counts, total, count) in series:
+                cumulative = 0
+                for bound, n in zip(SECONDS_BUCKETS + ("+Inf",), counts):
+                    cumulative += n
+                    lines.append(f"{metric}_bucket{_label_str(labels, ('le', bound))} {cumulative}")
+                lines.append(f"{metric}_sum{_label_str(labels)} {total:.6f}")
+                lines.append(f"{metric}_count{_label_str(labels)} {count}")
+
+        for metric, value in sorted(gauges.items()):
+            kind, help_text = HELP[metric]
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsCollector()
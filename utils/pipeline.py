@@ -0,0 +1,590 @@
+# utils/pipeline.py
+
+import os
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from routes import EXTENSION_MAP, get_handler_for_extension
+from rmeta_core.utils.system import get_available_memory_mb
+from utils.ingest import hash_output
+from utils.loop import run_async, run_on_thread_loop
+from utils.admission import admission, estimate_peak_mb
+from utils.dedup_cache import scrub_cache
+from utils.stages import stage
+from utils.fastscrub import fast_scrub, supports as fast_scrub_supports, FastScrubError
+from utils.probe import probe_metadata
+from utils.textstream import text_streamer, TextStreamError
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_TYPES = ("thread", "process", "async", "serial")
+
+
+def _new_result(filepath):
+    filename = os.path.basename(filepath)
+    ext = os.path.splitext(filename)[1].lower().lstrip(".")
+    return {
+        "filename": filename,
+        "warnings": [],
+        "metadata_msg": f"Metadata stripped from {ext.upper()}: {filename}",
+        "hash_file": None,
+        "encrypted": False
+    }
+
+
+def _lookup_handler(filepath):
+    ext = os.path.splitext(filepath)[1].lower().lstrip(".")
+    return get_handler_for_extension(ext)
+
+
+def _postprocess(filepath, options, file_result, known_digest=None):
+    """
+    Hash a scrubbed file if requested, recording the outcome on file_result.
+
+    GPG encryption is a separate batch-level stage (utils/gpg.py) so the
+    session key is imported once rather than per file.
+    """
+    if options.get("generate_hash"):
+        try:
+            with stage("hash", path=filepath):
+                hash_filename = hash_output(filepath, known_digest=known_digest)
+            file_result["hash_file"] = hash_filename
+            logger.info(f"Hash generated: {hash_filename}")
+        except Exception as e:
+            file_result["warnings"].append(f"Hash generation failed: {str(e)}")
+
+
+def _probe_first(filepath, options, file_result):
+    """
+    Run the read-only metadata probe (utils/probe.py) when the request wants
+    a report only or lets clean files through untouched.
+
+    Returns:
+        bool: True if the file must not be rewritten, either because this is
+        a report-only request or because the probe found it already clean.
+    """
+    report_only = options.get("report_only")
+    if not report_only and not options.get("skip_clean"):
+        return False
+
+    with stage("probe", path=filepath):
+        found = probe_metadata(filepath)
+    filename = os.path.basename(filepath)
+    ext = os.path.splitext(filename)[1].lower().lstrip(".").upper()
+    if found is not None:
+        file_result["metadata_found"] = found
+
+    if report_only:
+        file_result["report_only"] = True
+        if found is None:
+            file_result["metadata_msg"] = f"Metadata not checked in {ext}: {filename} (no probe could read it)"
+        elif found:
+            file_result["metadata_msg"] = f"Metadata found in {ext}: {filename} ({', '.join(found)})"
+        else:
+            file_result["metadata_msg"] = f"No metadata found in {ext}: {filename}"
+        return True
+
+    if found == []:
+        file_result["already_clean"] = True
+        file_result["metadata_msg"] = f"Already clean, left as is: {filename}"
+        return True
+    return False
+
+
+def _try_fast_scrub(filepath, options, file_result):
+    """
+    Scrub with the zero-decode JPEG/PNG path (utils/fastscrub.py) when the
+    request asked for it. Returns False if the handler's scrub should run
+    instead, recording why when the fast path gave up on the file.
+    """
+    if not options.get("fast_scrub") or not fast_scrub_supports(filepath):
+        return False
+    try:
+        fast_scrub(filepath)
+    except FastScrubError as e:
+        file_result["warnings"].append(f"Fast scrub not possible ({e}); used the full scrub")
+        return False
+    file_result["fast_scrub"] = True
+    return True
+
+
+def _try_stream_text(filepath, file_result):
+    """
+    Run the content checks on a very large TXT/CSV file with the line-range
+    streamer (utils/textstream.py) instead of the handler, which reads it
+    whole. Text has no embedded metadata, so the file is left as it is.
+    Returns False if the handler should run instead.
+    """
+    if not text_streamer.applies(filepath):
+        return False
+    try:
+        stats = text_streamer.scan(filepath)
+    except TextStreamError as e:
+        logger.info(f"Not streaming {os.path.basename(filepath)} ({e}); using the handler")
+        return False
+    file_result["streamed"] = True
+    file_result["warnings"].extend(stats["messages"])
+    return True
+
+
+def process_file(filepath, options, known_digest=None):
+    """
+    Scrub and (optionally) hash a single file.
+
+    Async handlers run on the calling thread's long-lived event loop
+    (utils/loop.py) rather than a fresh asyncio.run() per call. With skip_clean set, files
+    the probe finds free of metadata are not rewritten (their hash reuses
+    known_digest, the upload's SHA-256, if given); with report_only set,
+    nothing is rewritten and the result lists what was found.
+
+    Args:
+        filepath (str): Path of the uploaded file inside the session directory.
+        options (dict): Per-request flags, e.g. generate_hash.
+        known_digest (str | None): SHA-256 of the file as uploaded.
+
+    Returns:
+        dict | None: The file_result dict for the summary table, or None if
+        there is no handler for the file type.
+    """
+    handler_entry = _lookup_handler(filepath)
+    if not handler_entry:
+        return None
+
+    filename = os.path.basename(filepath)
+    file_result = _new_result(filepath)
+
+    try:
+        scrub_fn = handler_entry.get("scrub")
+        get_additional_messages_fn = handler_entry.get("get_additional_messages")
+        is_async = handler_entry.get("is_async", False)
+        msgs_is_async = handler_entry.get("msgs_is_async", False)
+
+        unchanged = _probe_first(filepath, options, file_result)
+        if options.get("report_only"):
+            return file_result
+
+        with stage("scrub", path=filepath):
+            if unchanged:
+                logger.info(f"Already clean, not rewritten: {filename}")
+            elif _try_fast_scrub(filepath, options, file_result):
+                logger.info(f"Scrubbed metadata from: {filename} (fast)")
+            elif _try_stream_text(filepath, file_result):
+                logger.info(f"Scrubbed metadata from: {filename} (streamed)")
+            elif scrub_fn:
+                if is_async:
+                    run_on_thread_loop(scrub_fn(filepath))
+                else:
+                    scrub_fn(filepath)
+                logger.info(f"Scrubbed metadata from: {filename}")
+
+            # The handler's message scan reads the whole file; the streamer ran it per range
+            if get_additional_messages_fn and not file_result.get("streamed"):
+                if msgs_is_async:
+                    additional_messages = run_on_thread_loop(get_additional_messages_fn(filepath))
+                else:
+                    additional_messages = get_additional_messages_fn(filepath)
+                file_result["warnings"].extend(additional_messages)
+
+        _postprocess(filepath, options, file_result, known_digest=known_digest if unchanged else None)
+
+    except Exception as e:
+        logger.exception(f"Failed processing {filename}: {e}")
+        file_result["warnings"].append(f"Error processing file: {str(e)}")
+
+    return file_result
+
+
+async def process_file_async(filepath, options, executor, known_digest=None):
+    """
+    Async-native counterpart of process_file.
+
+    Async scrubs and message lookups are awaited directly on the running
+    loop; sync handlers and the hash postprocessor are pushed onto
+    executor so they don't block it.
+    """
+    handler_entry = _lookup_handler(filepath)
+    if not handler_entry:
+        return None
+
+    loop = asyncio.get_running_loop()
+    filename = os.path.basename(filepath)
+    file_result = _new_result(filepath)
+
+    try:
+        scrub_fn = handler_entry.get("scrub")
+        get_additional_messages_fn = handler_entry.get("get_additional_messages")
+
+        unchanged = await loop.run_in_executor(executor, _probe_first, filepath, options, file_result)
+        if options.get("report_only"):
+            return file_result
+
+        with stage("scrub", path=filepath):
+            if unchanged:
+                logger.info(f"Already clean, not rewritten: {filename}")
+            elif await loop.run_in_executor(executor, _try_fast_scrub, filepath, options, file_result):
+                logger.info(f"Scrubbed metadata from: {filename} (fast)")
+            elif await loop.run_in_executor(executor, _try_stream_text, filepath, file_result):
+                logger.info(f"Scrubbed metadata from: {filename} (streamed)")
+            elif scrub_fn:
+                if handler_entry.get("is_async", False):
+                    await scrub_fn(filepath)
+                else:
+                    await loop.run_in_executor(executor, scrub_fn, filepath)
+                logger.info(f"Scrubbed metadata from: {filename}")
+
+            if get_additional_messages_fn and not file_result.get("streamed"):
+                if handler_entry.get("msgs_is_async", False):
+                    additional_messages = await get_additional_messages_fn(filepath)
+                else:
+                    additional_messages = await loop.run_in_executor(executor, get_additional_messages_fn, filepath)
+                file_result["warnings"].extend(additional_messages)
+
+        await loop.run_in_executor(executor, _postprocess, filepath, options, file_result,
+                                   known_digest if unchanged else None)
+
+    except Exception as e:
+        logger.exception(f"Failed processing {filename}: {e}")
+        file_result["warnings"].append(f"Error processing file: {str(e)}")
+
+    return file_result
+
+
+def pick_worker_count(config, file_count):
+    """
+    Size the worker pool from SCRUB_WORKERS, the CPU count and free memory.
+
+    Each worker is budgeted MIN_MEM_MB, so a box that is short on memory
+    falls back to fewer workers (down to one) rather than oversubscribing.
+    """
+    if file_count <= 1:
+        return 1
+
+    configured = config.get("SCRUB_WORKERS", 0)
+    limit = configured if configured > 0 else (os.cpu_count() or 1)
+
+    min_mem_mb = max(config.get("MIN_MEM_MB", 512), 1)
+    try:
+        mem_slots = int(get_available_memory_mb() // min_mem_mb)
+    except Exception as e:
+        logger.warning(f"Could not read available memory, using one worker: {e}")
+        mem_slots = 1
+
+    return max(1, min(limit, mem_slots, file_count))
+
+
+def _estimate_mb(filepath):
+    ext = os.path.splitext(filepath)[1].lower().lstrip(".")
+    try:
+        size = os.path.getsize(filepath)
+    except OSError:
+        size = 0
+    if text_streamer.applies(filepath, size):
+        return text_streamer.estimate_mb()  # Bounded by ranges in flight, not file size
+    return estimate_peak_mb(ext, size)
+
+
+def _timeout_for(filepath, timeout):
+    """MAX_HANDLER_TIMEOUT, granted once per started GiB for streamed text files."""
+    try:
+        size = os.path.getsize(filepath)
+    except OSError:
+        return timeout
+    if text_streamer.applies(filepath, size):
+        return timeout * (size // (1 << 30) + 1)
+    return timeout
+
+
+def _process_started(started, filepath, options, known_digest=None):
+    """process_file on a pool thread, reported as processing only once the thread picks it up."""
+    return process_file(started(filepath), options, known_digest)
+
+
+def _process_admitted(filepath, options, known_digest=None):
+    """process_file, once the shared admission budget has room for it."""
+    with admission.reserve(_estimate_mb(filepath)):
+        return process_file(filepath, options, known_digest)
+
+
+def _failed_result(filepath, warning):
+    file_result = _new_result(filepath)
+    file_result["warnings"].append(warning)
+    file_result["metadata_msg"] = file_result["metadata_msg"].replace("Metadata stripped", "Metadata not stripped")
+    return file_result
+
+
+async def _run_batch_async(file_list, options, workers, timeout, started, digests):
+    """Process a chunk concurrently on the shared loop, at most `workers` files at a time."""
+    semaphore = asyncio.Semaphore(workers)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    tasks = []
+
+    async def run_one(filepath):
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            # Never on `executor`: a timed-out file still needs it to finish and hand its tokens back
+            token = await admission.acquire_async(_estimate_mb(filepath))
+            started(filepath)
+            file_timeout = _timeout_for(filepath, timeout)
+            task = asyncio.ensure_future(process_file_async(filepath, options, executor, digests.get(filepath)))
+            tasks.append(task)
+            try:
+                done, _ = await asyncio.wait({task}, timeout=file_timeout)
+            finally:
+                # Not cancelled on timeout: a cancelled coroutine would hand its
+                # tokens back while its executor thread is still scrubbing. The
+                # tokens return once the work has really stopped, as in run_batch.
+                task.add_done_callback(lambda _: loop.run_in_executor(None, admission.release, token))
+            if task in done:
+                return task.result()
+            logger.error(f"Timed out processing {filepath} after {file_timeout}s")
+            return _failed_result(filepath, f"Processing timed out after {file_timeout}s")
+
+    try:
+        results = await asyncio.gather(*(run_one(filepath) for filepath in file_list))
+    finally:
+        lingering = [task for task in tasks if not task.done()]
+        if lingering:
+            # Timed-out files still need the executor to wind down
+            asyncio.gather(*lingering).add_done_callback(lambda _: executor.shutdown(wait=False))
+        else:
+            executor.shutdown(wait=False, cancel_futures=True)
+    return list(zip(file_list, results))
+
+
+def _cache_key(filepath, digests, options):
+    digest = digests.get(filepath) if digests else None
+    if not digest:
+        return None
+    ext = os.path.splitext(filepath)[1].lower().lstrip(".")
+    handler_name = EXTENSION_MAP.get(ext)
+    if not handler_name:
+        return None
+    if options.get("fast_scrub") and fast_scrub_supports(filepath):
+        handler_name = f"{handler_name}+fast"  # Different output bytes from the same input
+    elif text_streamer.applies(filepath):
+        handler_name = f"{handler_name}+stream"
+    return scrub_cache.key(digest, handler_name)
+
+
+def _restore_cached(filepath, entry, options):
+    """Build a file_result from a cache hit, writing the cached output in place."""
+    with open(filepath, "wb") as f:
+        f.write(entry["data"])
+    file_result = _new_result(filepath)
+    file_result["warnings"].extend(entry["warnings"])
+    file_result["cache_hit"] = True
+    _postprocess(filepath, options, file_result, known_digest=entry["sha256"])
+    logger.info(f"Served {os.path.basename(filepath)} from the scrub cache")
+    return file_result
+
+
+def succeeded(file_result):
+    """True if a file made it through the scrub: it had a handler, which neither failed nor timed out."""
+    return file_result is not None and not any(
+        w.startswith(("Error processing file", "Processing timed out")) for w in file_result["warnings"]
+    )
+
+
+def _cacheable(file_result):
+    # Untouched files aren't worth the memory: probing them again is cheap
+    if file_result is None or file_result.get("already_clean") or file_result.get("report_only"):
+        return False
+    return succeeded(file_result)
+
+
+def run_batch(file_list, options, config, progress=None, digests=None):
+    """
+    Run process_file over a chunk of files on a bounded worker pool.
+
+    When the scrub cache is enabled and digests (path -> input SHA-256 from
+    ingest) are given, files seen before are restored from the cache and
+    skip the handler entirely; fresh results are added to it. Report-only
+    requests bypass the cache.
+
+    Every file first takes memory tokens from the shared admission
+    controller (utils/admission.py), sized from its type and size, so files
+    that don't fit yet wait for running work to finish.
+
+    The pool type comes from SCRUB_EXECUTOR ("thread", "process", "async" or
+    "serial"). In thread/process mode each file is given MAX_HANDLER_TIMEOUT
+    seconds once the files ahead of it have been collected; in async mode
+    the whole chunk runs on the shared event loop and each file gets
+    MAX_HANDLER_TIMEOUT from when it starts. A file that runs over is
+    reported with a warning.
+
+    If given, progress(filepath, "processing") is called as each file is
+    started (in process mode, as it is handed to the pool).
+
+    Returns:
+        list[tuple[str, dict | None]]: (filepath, file_result) pairs in the
+        same order as file_list. file_result is None for unsupported types.
+    """
+    def started(filepath):
+        if progress:
+            progress(filepath, "processing")
+        return filepath
+
+    if not scrub_cache.enabled or not digests or options.get("report_only"):
+        return _dispatch(file_list, options, config, started, digests)
+
+    keys = {filepath: _cache_key(filepath, digests, options) for filepath in file_list}
+    hits = {}
+    for filepath, key in keys.items():
+        entry = scrub_cache.get(key) if key else None
+        if entry:
+            started(filepath)
+            hits[filepath] = _restore_cached(filepath, entry, options)
+
+    pending = [filepath for filepath in file_list if filepath not in hits]
+    fresh = dict(_dispatch(pending, options, config, started, digests)) if pending else {}
+    for filepath, file_result in fresh.items():
+        if keys[filepath] and _cacheable(file_result):
+            scrub_cache.put(keys[filepath], filepath, file_result)
+
+    return [(filepath, hits[filepath] if filepath in hits else fresh[filepath]) for filepath in file_list]
+
+
+def run_stream(paths, options, config, progress=None, digests=None, discard=None):
+    """
+    run_batch over files that are still being produced, e.g. extracted from an archive.
+
+    The paths iterator is drained on its own thread, so producing the next
+    files overlaps with scrubbing the ones already on disk. Each round takes
+    whatever is ready (at least one file, at most two per worker) through
+    run_batch, so the cache, admission control and timeouts all apply. The
+    producer runs at most two rounds ahead.
+
+    If the consumer stops early (an exception, or the generator is closed),
+    the producer stops too and closes the paths iterator, so an extractor
+    behind it releases its archive. Files it had produced that were never
+    scrubbed are handed to discard, if given, once the producer has
+    finished.
+
+    Yields:
+        tuple[str, dict | None]: (filepath, file_result) in production order.
+
+    Raises:
+        Whatever the paths iterator raised, once every file it produced
+        before failing has been scrubbed.
+    """
+    round_size = max(2, 2 * pick_worker_count(config, 2 ** 31))
+    ready = queue.Queue(maxsize=2 * round_size)
+    stop = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    unscrubbed = []
+
+    def produce():
+        try:
+            for filepath in paths:
+                if not put(filepath):
+                    unscrubbed.append(filepath)
+                    return  # Consumer gave up
+            put(end)
+        except Exception as e:
+            put(e)
+        finally:
+            close = getattr(paths, "close", None)
+            if close:
+                close()
+
+    producer = threading.Thread(target=produce, name="rmeta-stream", daemon=True)
+    producer.start()
+
+    error, finished = None, False
+    try:
+        while not finished:
+            items = [ready.get()]
+            while len(items) < round_size:
+                try:
+                    items.append(ready.get_nowait())
+                except queue.Empty:
+                    break
+            file_list = []
+            for item in items:
+                if item is end:
+                    finished = True
+                elif isinstance(item, Exception):
+                    error, finished = item, True
+                else:
+                    file_list.append(item)
+            if file_list:
+                yield from run_batch(file_list, options, config, progress, digests)
+    finally:
+        stop.set()
+        producer.join()
+        while True:
+            try:
+                item = ready.get_nowait()
+            except queue.Empty:
+                break
+            if item is not end and not isinstance(item, Exception):
+                unscrubbed.append(item)
+        if discard:
+            for filepath in unscrubbed:
+                discard(filepath)
+    if error is not None:
+        raise error
+
+
+def _dispatch(file_list, options, config, started, digests=None):
+    """Send file_list through the configured executor; see run_batch."""
+    digests = digests or {}
+    executor_type = str(config.get("SCRUB_EXECUTOR", "thread")).lower()
+    if executor_type not in EXECUTOR_TYPES:
+        logger.warning(f"Unknown SCRUB_EXECUTOR '{executor_type}', falling back to thread")
+        executor_type = "thread"
+
+    workers = pick_worker_count(config, len(file_list))
+    if executor_type == "serial" or workers == 1:
+        return [(filepath, _process_admitted(started(filepath), options, digests.get(filepath))) for filepath in file_list]
+
+    timeout = config.get("MAX_HANDLER_TIMEOUT", 30)
+    if executor_type == "async":
+        logger.info(f"Processing {len(file_list)} files on the event loop, {workers} at a time")
+        return run_async(_run_batch_async(file_list, options, workers, timeout, started, digests))
+
+    pool_cls = ProcessPoolExecutor if executor_type == "process" else ThreadPoolExecutor
+    logger.info(f"Processing {len(file_list)} files on {workers} {executor_type} workers")
+
+    results = []
+    pool = pool_cls(max_workers=workers)
+    try:
+        futures = []
+        for filepath in file_list:
+            # Dispatch in upload order, each file only once its tokens are granted.
+            token = admission.acquire(_estimate_mb(filepath))
+            if executor_type == "process":
+                # The progress callback can't cross into a worker process
+                future = pool.submit(process_file, started(filepath), options, digests.get(filepath))
+            else:
+                future = pool.submit(_process_started, started, filepath, options, digests.get(filepath))
+            future.add_done_callback(lambda _, token=token: admission.release(token))
+            futures.append(future)
+        for filepath, future in zip(file_list, futures):
+            file_timeout = _timeout_for(filepath, timeout)
+            try:
+                results.append((filepath, future.result(timeout=file_timeout)))
+            except FutureTimeout:
+                future.cancel()
+                logger.error(f"Timed out processing {filepath} after {file_timeout}s")
+                results.append((filepath, _failed_result(filepath, f"Processing timed out after {file_timeout}s")))
+            except Exception as e:
+                logger.exception(f"Worker failed on {filepath}: {e}")
+                results.append((filepath, _failed_result(filepath, f"Error processing file: {str(e)}")))
+    finally:
+        # Don't block the request on a runaway handler; it finishes in the background.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return results
@@ -0,0 +1,143 @@
+# utils/probe.py
+
+import os
+import re
+import zipfile
+import logging
+from utils.fastscrub import scan as scan_image, PNG_METADATA_CHUNKS, ICC_LABEL
+from utils.ingest import INGEST_CHUNK_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Control bytes other than tab, LF and CR
+_TEXT_CONTROL = bytes(b for b in range(32) if b not in (9, 10, 13)) + b"\x7f"
+
+# Office document parts that hold metadata, other than core.xml
+OFFICE_METADATA_PARTS = {
+    "docProps/custom.xml": "custom properties",
+    "word/comments.xml": "comments",
+    "word/commentsExtended.xml": "comments",
+    "word/commentsExtensible.xml": "comments",
+    "word/commentsIds.xml": "comments",
+    "word/people.xml": "reviewers",
+    "xl/persons/person.xml": "reviewers",
+    "xl/revisions/revisionHeaders.xml": "tracked changes",
+}
+OFFICE_APP_FIELDS = ("Application", "Company", "HyperlinkBase", "Manager", "Template")
+
+# Word story parts whose tracked changes and comment ranges carry w:author
+_WORD_STORY = re.compile(r"word/(?:document|header\d*|footer\d*|footnotes|endnotes)\.xml")
+
+# <prefix:Name ...>text</prefix:Name> with non-blank text
+_XML_FIELD = re.compile(rb"<(?:\w+:)?(\w+)(?:\s[^>]*)?>\s*([^<\s][^<]*)</")
+
+
+def _probe_text(filepath):
+    # Text has no metadata container, and printable ASCII has no room for
+    # hidden payloads (BOMs, zero-width or bidi characters, binary data).
+    # Anything else is left to the handler to judge.
+    with open(filepath, "rb") as f:
+        while True:
+            block = f.read(INGEST_CHUNK_BYTES)
+            if not block:
+                return []
+            if not block.isascii() or len(block.translate(None, _TEXT_CONTROL)) != len(block):
+                return None
+
+
+def _probe_png(filepath):
+    # The walker drops every chunk outside its allowlist; only the ones known
+    # to be plain metadata can be named. A private or unknown chunk (C2PA
+    # caBX, vendor blocks) could hold anything, so that's "can't tell".
+    found = scan_image(filepath)
+    if any(label not in PNG_METADATA_CHUNKS and label not in (ICC_LABEL, "trailing data") for label in found):
+        return None
+    return found
+
+
+def _probe_pdf(filepath):
+    from pypdf import PdfReader
+    reader = PdfReader(filepath, strict=False)
+    found = []
+    info = reader.trailer.get("/Info")
+    if info is not None and any(str(value).strip() for value in info.get_object().values()):
+        found.append("document info")
+    if "/Metadata" in reader.trailer["/Root"].get_object():
+        found.append("XMP")
+    if "/PieceInfo" in reader.trailer["/Root"].get_object():
+        found.append("application data")
+    if "/Prev" in reader.trailer:
+        found.append("earlier revisions")  # Incremental updates keep the old objects
+    for page in reader.pages:
+        if "/Metadata" in page and "XMP" not in found:
+            found.append("XMP")
+        if "/PieceInfo" in page and "application data" not in found:
+            found.append("application data")
+        annots = page.get("/Annots")
+        for annot in (annots.get_object() if annots is not None else []):
+            if str(annot.get_object().get("/T") or "").strip():
+                if "annotation authors" not in found:
+                    found.append("annotation authors")
+                break
+    return found
+
+
+def _probe_office(filepath):
+    found = []
+    with zipfile.ZipFile(filepath) as zf:
+        names = set(zf.namelist())
+        if "docProps/core.xml" in names:
+            fields = sorted({m.group(1).decode() for m in _XML_FIELD.finditer(zf.read("docProps/core.xml"))})
+            found.extend(fields)
+        if "docProps/app.xml" in names:
+            app = zf.read("docProps/app.xml")
+            found.extend(m.group(1).decode() for m in _XML_FIELD.finditer(app)
+                         if m.group(1).decode() in OFFICE_APP_FIELDS)
+        found.extend(label for part, label in OFFICE_METADATA_PARTS.items() if part in names)
+        if any(name.startswith("xl/comments") for name in names) and "comments" not in found:
+            found.append("comments")
+        if any(_WORD_STORY.fullmatch(name) and b"w:author=" in zf.read(name) for name in names):
+            found.append("tracked changes")
+    return found
+
+
+PROBES = {
+    "jpg": scan_image,
+    "jpeg": scan_image,
+    "png": _probe_png,
+    "pdf": _probe_pdf,
+    "docx": _probe_office,
+    "xlsx": _probe_office,
+    "txt": _probe_text,
+    "csv": _probe_text,
+}
+
+
+def probe_metadata(filepath):
+    """
+    Read-only check for metadata a scrub would remove.
+
+    Only headers, trailers and catalog data are read: JPEG segments ahead
+    of the first scan and PNG chunk headers, the PDF trailer, info
+    dictionary, catalog and page dictionaries with their annotations, and
+    the property, comment and revision parts of DOCX/XLSX packages, plus a
+    byte search of Word's story parts for tracked-change authors. Text
+    files are read once, without decoding, to check they are plain
+    printable ASCII. Probes err towards "found" or "can't tell", so a file
+    is only ever left alone when it is certainly clean.
+
+    Returns:
+        list[str] | None: Labels of what was found ([] = already clean), or
+        None when the type has no probe (e.g. HEIC, which is always
+        converted) or the probe can't tell (damaged file, non-ASCII text,
+        a PNG chunk it doesn't recognise).
+    """
+    ext = os.path.splitext(filepath)[1].lower().lstrip(".")
+    probe = PROBES.get(ext)
+    if not probe:
+        return None
+    try:
+        return probe(filepath)
+    except Exception as e:  # Damaged files raise whatever their parser raises
+        logger.debug(f"Could not probe {os.path.basename(filepath)}: {e}")
+        return None
@@ -0,0 +1,89 @@
+# utils/registry.py
+
+import time
+import importlib
+import logging
+import threading
+from rmeta_core import handlers as core_handlers
+
+logger = logging.getLogger(__name__)
+
+
+class HandlerRegistry:
+    """
+    Per-process cache of rmeta-core handler entries, keyed by extension.
+
+    Each mapped extension is resolved at most once: hits and misses are
+    both cached, so the hot path in process_files is a dict lookup and a
+    handler rmeta-core lacks only logs its warning the first time. Only
+    extensions in the map are cached; anything else comes from the upload
+    and returns None without being stored, so the cache stays bounded.
+    """
+
+    def __init__(self, extension_map):
+        # ext -> handler module name, used for the support check and warm-up
+        self._modules = {ext.lower(): module for ext, module in extension_map.items()}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, ext):
+        """Handler entry for an extension, or None if it isn't supported."""
+        ext = ext.lower()
+        try:
+            return self._entries[ext]
+        except KeyError:
+            if ext not in self._modules:
+                logger.debug(f"No handler registered for .{ext}")
+                return None
+            return self._resolve(ext)
+
+    def supports(self, ext):
+        return ext.lower() in self._modules
+
+    def _resolve(self, ext):
+        with self._lock:
+            if ext in self._entries:
+                return self._entries[ext]
+
+            entry = None
+            try:
+                entry = core_handlers.get_handler_for_extension(ext)
+            except Exception as e:
+                logger.error(f"Error loading handler for .{ext}: {e}")
+            if not entry:
+                logger.warning(f"rmeta-core has no handler for .{ext}")
+                entry = None
+
+            self._entries[ext] = entry
+            return entry
+
+    def preload(self, extensions):
+        """
+        Import and resolve handlers up front, e.g. in create_app before
+        gunicorn forks, so the first upload after a worker recycle doesn't
+        pay for loading PIL/pypdf/openpyxl.
+
+        Args:
+            extensions: Iterable of extensions, or "all" for every mapped type.
+        """
+        if extensions == "all":
+            extensions = list(self._modules)
+
+        start = time.perf_counter()
+        loaded = []
+        for ext in extensions:
+            ext = ext.strip().lower().lstrip(".")
+            module = self._modules.get(ext)
+            if not module:
+                logger.warning(f"Cannot preload unknown handler type .{ext}")
+                continue
+            try:
+                importlib.import_module(f"{core_handlers.__name__}.{module}")
+            except ImportError as e:
+                logger.warning(f"Could not import {module} for .{ext}: {e}")
+            if self.get(ext):
+                loaded.append(ext)
+
+        if loaded:
+            logger.info(f"Preloaded handlers for {', '.join(loaded)} in {time.perf_counter() - start:.2f}s")
+        return loaded
@@ -0,0 +1,37 @@
+# utils/results.py
+
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+RESULTS_FILE = ".results.json"
+
+
+def save_results(session_dir, results):
+    """
+    Persist a batch's file_result dicts inside its session directory.
+
+    Results live next to the files they describe, so they expire with the
+    session and the Flask cookie only needs to carry the session id.
+    """
+    if not os.path.isdir(session_dir):
+        return
+    path = os.path.join(session_dir, RESULTS_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(results, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not save results for {session_dir}: {e}")
+
+
+def load_results(session_dir):
+    """Results saved for a session, or None if there are none (yet)."""
+    try:
+        with open(os.path.join(session_dir, RESULTS_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
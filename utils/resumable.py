@@ -0,0 +1,245 @@
+# utils/resumable.py
+
+import os
+import json
+import errno
+import shutil
+import hashlib
+import logging
+from werkzeug.utils import secure_filename
+from utils.ingest import make_record, file_sha256, INGEST_CHUNK_BYTES
+
+logger = logging.getLogger(__name__)
+
+UPLOADS_DIR = ".uploads"
+MANIFEST_FILE = "manifest.json"
+FINALIZING_FILE = "manifest.finalizing"
+
+
+class ChunkError(ValueError):
+    """A chunked upload request that can't be applied; status is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _uploads_dir(session_dir):
+    return os.path.join(session_dir, UPLOADS_DIR)
+
+
+def _part_path(session_dir, file_id):
+    return os.path.join(_uploads_dir(session_dir), f"{file_id}.part")
+
+
+def _chunks_dir(session_dir, file_id):
+    return os.path.join(_uploads_dir(session_dir), file_id)
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def init_upload(session_dir, files, chunk_bytes, max_bytes=0):
+    """
+    Start a chunked upload of files (dicts with name and size) into a session.
+
+    Each file gets a sparse .part file of its final size under
+    <session>/.uploads, so chunks can be written at their offsets in any
+    order and by any worker process. All state lives in that directory,
+    none in memory, and it expires with the session.
+
+    Args:
+        max_bytes: Largest total of the declared sizes; 0 = unlimited.
+
+    Returns:
+        dict: The manifest: chunk_size and files with file_id, name and size.
+
+    Raises:
+        ChunkError: A bad file entry (400), or sizes over max_bytes or
+        more than the filesystem can hold (413).
+    """
+    entries = []
+    for i, f in enumerate(files):
+        name = secure_filename(str(f.get("name", "")))
+        try:
+            size = int(f.get("size"))
+        except (TypeError, ValueError):
+            size = -1
+        if not name.strip() or size < 0:
+            raise ChunkError(f"Invalid file entry: {f.get('name')!r}")
+        entries.append({"file_id": str(i), "name": name, "size": size})
+    if not entries:
+        raise ChunkError("No files to upload")
+    if max_bytes and sum(entry["size"] for entry in entries) > max_bytes:
+        raise ChunkError(f"Upload exceeds the {max_bytes // (1024 * 1024)}MB limit", status=413)
+
+    try:
+        os.makedirs(_uploads_dir(session_dir), exist_ok=True)
+        for entry in entries:
+            os.makedirs(_chunks_dir(session_dir, entry["file_id"]), exist_ok=True)
+            with open(_part_path(session_dir, entry["file_id"]), "wb") as part:
+                part.truncate(entry["size"])
+    except (OverflowError, OSError) as e:
+        if isinstance(e, OSError) and e.errno not in (errno.EFBIG, errno.ENOSPC, errno.EDQUOT):
+            raise
+        raise ChunkError(f"Upload is too large for this server: {e}", status=413)
+
+    manifest = {"chunk_size": chunk_bytes, "files": entries}
+    _write_json(os.path.join(_uploads_dir(session_dir), MANIFEST_FILE), manifest)
+    return manifest
+
+
+def load_manifest(session_dir):
+    """The session's pending chunked upload, or None."""
+    try:
+        with open(os.path.join(_uploads_dir(session_dir), MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _file_entry(manifest, file_id):
+    for entry in manifest["files"]:
+        if entry["file_id"] == file_id:
+            return entry
+    raise ChunkError(f"Unknown file {file_id!r}", status=404)
+
+
+def received_offsets(session_dir, file_id):
+    """Offsets of the chunks of a file that have been written and checked."""
+    try:
+        names = os.listdir(_chunks_dir(session_dir, file_id))
+    except OSError:
+        return []
+    return sorted(int(name[:-5]) for name in names if name.endswith(".json") and name[:-5].isdigit())
+
+
+def missing_offsets(manifest, entry, received):
+    """Chunk offsets of entry not yet in received, in file order."""
+    have = set(received)
+    return [offset for offset in range(0, entry["size"], manifest["chunk_size"]) if offset not in have]
+
+
+def upload_status(session_dir):
+    """Per-file received chunk offsets for a pending upload, or None if there isn't one."""
+    manifest = load_manifest(session_dir)
+    if manifest is None:
+        return None
+    return {
+        "chunk_size": manifest["chunk_size"],
+        "files": [dict(entry, received=received_offsets(session_dir, entry["file_id"])) for entry in manifest["files"]],
+    }
+
+
+def write_chunk(session_dir, file_id, offset, stream, length, expected_sha256=None, block_size=INGEST_CHUNK_BYTES):
+    """
+    Write one chunk of a file at its offset, digesting it on the way.
+
+    Every chunk except a file's last must be exactly chunk_size bytes and
+    start on a chunk boundary. The chunk only counts as received once its
+    SHA-256 is recorded, after the bytes are on disk, and when the client
+    sent expected_sha256 only if it matches. Re-sending a chunk (a retry
+    after a dropped response) just overwrites it.
+
+    Returns:
+        tuple[str, bool]: (chunk SHA-256, True if the chunk was new)
+    """
+    manifest = load_manifest(session_dir)
+    if manifest is None:
+        raise ChunkError("No upload in progress for this session", status=404)
+    entry = _file_entry(manifest, file_id)
+    chunk_size = manifest["chunk_size"]
+
+    if offset < 0 or offset % chunk_size or (offset >= entry["size"] and entry["size"]):
+        raise ChunkError(f"Bad chunk offset {offset}")
+    expected_length = min(chunk_size, entry["size"] - offset)
+    if length != expected_length:
+        raise ChunkError(f"Chunk at {offset} must be {expected_length} bytes, got {length}")
+
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        fd = os.open(_part_path(session_dir, file_id), os.O_WRONLY)
+    except FileNotFoundError:
+        raise ChunkError("Upload already finalized", status=409)  # Finalize moved the file since the manifest was read
+    try:
+        while written < length:
+            block = stream.read(min(block_size, length - written))
+            if not block:
+                break
+            os.pwrite(fd, block, offset + written)
+            digest.update(block)
+            written += len(block)
+    finally:
+        os.close(fd)
+
+    if written != length:
+        raise ChunkError(f"Chunk at {offset} was cut short after {written} of {length} bytes")
+    chunk_sha256 = digest.hexdigest()
+    if expected_sha256 and expected_sha256.lower() != chunk_sha256:
+        raise ChunkError(f"Chunk at {offset} failed its SHA-256 check", status=422)
+
+    marker = os.path.join(_chunks_dir(session_dir, file_id), f"{offset}.json")
+    is_new = not os.path.exists(marker)
+    try:
+        _write_json(marker, {"size": written, "sha256": chunk_sha256})
+    except FileNotFoundError:
+        raise ChunkError("Upload already finalized", status=409)
+    return chunk_sha256, is_new
+
+
+def finalize_upload(session_dir, full_digest=False):
+    """
+    Move every completed file into the session and return its ingest records.
+
+    The manifest is renamed away first, so a second finalize (or a late
+    chunk) can't race this one. If any file is still missing chunks,
+    nothing is moved, the upload stays resumable and ChunkError (409)
+    lists the gaps.
+
+    The whole-file SHA-256 costs another read of each file, so it is only
+    computed when full_digest is set (the scrub cache is its only
+    consumer); otherwise the record's sha256 is None.
+
+    Returns:
+        list[dict]: Ingest records like utils.ingest.ingest_upload's.
+    """
+    uploads_dir = _uploads_dir(session_dir)
+    manifest_path = os.path.join(uploads_dir, MANIFEST_FILE)
+    finalizing_path = os.path.join(uploads_dir, FINALIZING_FILE)
+    manifest = load_manifest(session_dir)
+    try:
+        os.rename(manifest_path, finalizing_path)
+    except OSError:
+        raise ChunkError("No upload in progress for this session", status=404)
+
+    missing = {}
+    for entry in manifest["files"]:
+        gaps = missing_offsets(manifest, entry, received_offsets(session_dir, entry["file_id"]))
+        if gaps:
+            missing[entry["name"]] = gaps
+    if missing:
+        os.rename(finalizing_path, manifest_path)
+        summary = ", ".join(f"{name} ({len(gaps)} chunks)" for name, gaps in missing.items())
+        raise ChunkError(f"Upload incomplete: {summary}", status=409)
+
+    records = []
+    for entry in manifest["files"]:
+        dest_path = os.path.join(session_dir, entry["name"])
+        stem, ext = os.path.splitext(entry["name"])
+        n = 1
+        while os.path.exists(dest_path):
+            dest_path = os.path.join(session_dir, f"{stem}_{n}{ext}")
+            n += 1
+        os.replace(_part_path(session_dir, entry["file_id"]), dest_path)
+
+        with open(dest_path, "rb") as f:
+            head = f.read(16)
+        records.append(make_record(dest_path, entry["size"], file_sha256(dest_path) if full_digest else None, head))
+
+    shutil.rmtree(uploads_dir, ignore_errors=True)
+    return records
@@ -0,0 +1,207 @@
+# utils/scheduler.py
+
+import os
+import time
+import heapq
+import shutil
+import logging
+import threading
+from utils.usage import usage_index
+from utils.dedup_cache import scrub_cache
+
+logger = logging.getLogger(__name__)
+
+REAP_BATCH_SIZE = 64
+RECONCILE_INTERVAL = 60
+
+
+class CleanupScheduler:
+    """
+    One background thread per process that expires sessions by deadline.
+
+    Deadlines live in a min-heap. Pushing a deadline forward just pushes a
+    new heap entry (O(log n)); the old one is recognised as stale and
+    dropped when it reaches the top. The thread sleeps until the earliest
+    deadline and reaps whatever has expired in batches, so the cost doesn't
+    depend on how many sessions are live or how big the upload folder is.
+    """
+
+    def __init__(self, timeout=600):
+        self.timeout = timeout
+        self.root = None
+        self._heap = []
+        self._deadlines = {}
+        self._timeouts = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._stopped = False
+
+    def configure(self, timeout, root=None):
+        """Set the default timeout, and the folder to reconcile usage against."""
+        self.timeout = timeout
+        self.root = root
+        if root:
+            with self._cond:
+                self._ensure_started()
+
+    def schedule(self, session_dir, timeout=None):
+        """Start tracking a session that should expire timeout seconds from now."""
+        with self._cond:
+            self._ensure_started()
+            self._timeouts[session_dir] = timeout or self.timeout
+            self._push(session_dir)
+
+    def touch(self, session_dir):
+        """
+        Push a session's deadline forward after activity.
+
+        The directory's mtime is bumped too, so other worker processes that
+        track the same session can see it is still in use. Sessions this
+        process hasn't seen yet (e.g. created by another gunicorn worker)
+        are adopted with the default timeout.
+        """
+        try:
+            os.utime(session_dir)
+        except OSError:
+            pass
+        with self._cond:
+            if session_dir not in self._deadlines:
+                if not os.path.isdir(session_dir):
+                    return
+                self._ensure_started()
+                self._timeouts[session_dir] = self.timeout
+            self._push(session_dir)
+
+    def forget(self, session_dir):
+        """Stop tracking a session that was removed by other means."""
+        with self._cond:
+            self._drop(session_dir)
+
+    def stats(self):
+        """Counters for live sessions and bytes held."""
+        with self._cond:
+            live = len(self._deadlines)
+        return {
+            "live_sessions": live,
+            "bytes_held": usage_index.snapshot()["bytes"],
+        }
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _push(self, session_dir, delay=None):
+        deadline = time.monotonic() + (self._timeouts[session_dir] if delay is None else delay)
+        self._deadlines[session_dir] = deadline
+        heapq.heappush(self._heap, (deadline, session_dir))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            # Mostly superseded entries from frequent touches; rebuild.
+            self._heap = [(d, s) for s, d in self._deadlines.items()]
+            heapq.heapify(self._heap)
+        # Only wake the thread if this is now the earliest deadline.
+        if self._heap[0][1] == session_dir:
+            self._cond.notify()
+
+    def _drop(self, session_dir):
+        self._deadlines.pop(session_dir, None)
+        self._timeouts.pop(session_dir, None)
+
+    def _ensure_started(self):
+        # Threads don't survive fork, so a preloaded parent's thread is no
+        # use to a gunicorn worker; each process starts its own.
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        if self._pid != os.getpid():
+            self._heap, self._deadlines, self._timeouts = [], {}, {}
+        self._pid = os.getpid()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="rmeta-cleanup", daemon=True)
+        self._thread.start()
+
+    def _pop_expired(self):
+        """Pop up to REAP_BATCH_SIZE expired sessions. Caller holds the lock."""
+        now = time.monotonic()
+        expired = []
+        while self._heap and len(expired) < REAP_BATCH_SIZE:
+            deadline, session_dir = self._heap[0]
+            if self._deadlines.get(session_dir) != deadline:
+                heapq.heappop(self._heap)  # Superseded by a later touch, or forgotten
+                continue
+            if deadline > now:
+                break
+            heapq.heappop(self._heap)
+            expired.append((session_dir, self._timeouts[session_dir]))
+        return expired
+
+    def _reap(self, expired):
+        """Remove expired sessions, unless another worker touched them meanwhile."""
+        now = time.time()
+        reaped = 0
+        for session_dir, timeout in expired:
+            try:
+                idle = now - os.stat(session_dir).st_mtime
+            except OSError:
+                idle = timeout  # Already gone
+            with self._cond:
+                if session_dir not in self._deadlines:
+                    continue  # Forgotten (removed by hand) since it was popped
+                if idle < timeout:
+                    self._push(session_dir, delay=timeout - idle)
+                    continue
+                self._drop(session_dir)
+            shutil.rmtree(session_dir, ignore_errors=True)
+            usage_index.remove_session(session_dir)
+            scrub_cache.forget_session(session_dir)
+            reaped += 1
+        if reaped:
+            logger.info(f"Cleanup reaped {reaped} expired sessions")
+
+    def _reconcile(self):
+        """
+        Refresh the usage index from disk and adopt sessions nobody here
+        tracks (e.g. left behind by a worker that was recycled).
+        """
+        usage_index.reconcile(self.root)
+        with self._cond:
+            orphans = [s for s in usage_index.sessions() if s not in self._deadlines]
+            for session_dir in orphans:
+                self._timeouts[session_dir] = self.timeout
+                self._push(session_dir, delay=0)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                expired = self._pop_expired()
+                while not expired and not self._stopped:
+                    wait = self._heap[0][0] - time.monotonic() if self._heap else None
+                    if self.root:
+                        due = usage_index.last_reconcile + RECONCILE_INTERVAL - time.monotonic()
+                        if due <= 0:
+                            break
+                        wait = due if wait is None else min(wait, due)
+                    self._cond.wait(timeout=wait)
+                    expired = self._pop_expired()
+                if self._stopped:
+                    return
+
+            if expired:
+                self._reap(expired)
+            elif self.root:
+                self._reconcile()
+
+
+scheduler = CleanupScheduler()
+
+
+def schedule_cleanup(session_dir, timeout=None):
+    scheduler.schedule(session_dir, timeout)
+
+
+def mark_session_active(session_dir):
+    scheduler.touch(session_dir)
+
+
+def stop_all_cleanup():
+    scheduler.stop()
@@ -0,0 +1,87 @@
+# utils/sessions.py
+
+import os
+import time
+import uuid
+import shutil
+import logging
+from werkzeug.utils import secure_filename
+from utils.scheduler import scheduler, schedule_cleanup
+from utils.usage import usage_index
+from utils.dedup_cache import scrub_cache
+from utils.storage import spool
+
+logger = logging.getLogger(__name__)
+
+
+def session_path(root, session_id):
+    """
+    Directory for a session id, safe to build from untrusted input.
+
+    Always absolute, so UPLOAD_FOLDER and SESSIONS_ROOT spelled differently
+    (relative vs absolute) still map a session to the same key.
+    """
+    return os.path.join(os.path.abspath(root), f"session_{secure_filename(session_id)}")
+
+
+def create_session(root, timeout):
+    """
+    Create a fresh session directory and hand it to the cleanup machinery.
+
+    Only this session is touched: other users' in-flight sessions under the
+    same root are left alone and expire on their own schedule.
+
+    Returns:
+        tuple[str, str]: (session_id, session_dir)
+    """
+    session_id = str(uuid.uuid4())[:8]
+    session_dir = session_path(root, session_id)
+    os.makedirs(session_dir, exist_ok=True)
+
+    usage_index.add_session(session_dir)
+    schedule_cleanup(session_dir, timeout)
+    return session_id, session_dir
+
+
+def remove_session(session_dir):
+    """Delete one session directory. Returns True if there was anything to remove."""
+    scheduler.forget(session_dir)
+    usage_index.remove_session(session_dir)
+    scrub_cache.forget_session(session_dir)
+    if not os.path.isdir(session_dir):
+        spool.release(session_dir)
+        return False
+    shutil.rmtree(session_dir, ignore_errors=True)
+    spool.release(session_dir)
+    logger.info(f"Removed session: {session_dir}")
+    return True
+
+
+def purge_stale_sessions(root, max_age):
+    """
+    Remove session directories not modified in the last max_age seconds.
+
+    Used at worker startup instead of wiping the whole folder, so a worker
+    being recycled doesn't take other workers' live sessions with it.
+
+    Returns:
+        int: Number of sessions removed.
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        with os.scandir(root) as entries:
+            stale = [
+                entry.path for entry in entries
+                if entry.name.startswith("session_")
+                and entry.is_dir(follow_symlinks=False)
+                and entry.stat(follow_symlinks=False).st_mtime < cutoff
+            ]
+    except OSError as e:
+        logger.warning(f"Could not scan {root} for stale sessions: {e}")
+        return 0
+
+    for path in stale:
+        if remove_session(path):
+            removed += 1
+    return removed
@@ -0,0 +1,164 @@
+# utils/stages.py
+
+import os
+import time
+import resource
+import threading
+from contextlib import contextmanager
+
+SAMPLE_INTERVAL = 0.01
+
+
+def current_rss_mb():
+    """Resident set size of this process right now, in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # No procfs (e.g. macOS); fall back to the high-water mark.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+_observers = []
+
+
+def add_observer(observer):
+    """
+    Start feeding stage timings to observer.
+
+    Observers implement stage_started(name) and
+    stage_finished(name, elapsed_seconds, labels).
+    """
+    if observer not in _observers:
+        _observers.append(observer)
+
+
+def remove_observer(observer):
+    if observer in _observers:
+        _observers.remove(observer)
+
+
+@contextmanager
+def stage(name, **labels):
+    """
+    Time one pipeline stage (save, audit, probe, scrub, hash, repackage, encrypt).
+
+    With no observers registered, which is the default, this costs one
+    list check. labels (e.g. path=...) are passed through to observers
+    untouched, so any work derived from them is only done when someone
+    is listening.
+    """
+    if not _observers:
+        yield
+        return
+    observers = list(_observers)
+    for observer in observers:
+        observer.stage_started(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for observer in observers:
+            observer.stage_finished(name, elapsed, labels)
+
+
+class StageRecorder:
+    """
+    In-process stage timings for benchmarks (dev/bench.py).
+
+    While enabled, each stage records its wall time per call, and a sampler
+    thread reads RSS every few milliseconds and charges it to whichever
+    stages are running, giving a per-stage peak, as well as to the peak
+    for the whole time the recorder has been enabled. Only stages that run in
+    this process are seen, so benchmarks should use a thread, async or
+    serial SCRUB_EXECUTOR.
+    """
+
+    def __init__(self):
+        self._samples = {}
+        self._peak_rss = {}
+        self._run_peak_rss = 0.0
+        self._active = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._stop = threading.Event()
+
+    def enable(self):
+        self.reset()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample_rss, name="rmeta-stage-rss", daemon=True)
+        self._sampler.start()
+        add_observer(self)
+
+    def disable(self):
+        remove_observer(self)
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+            self._sampler = None
+
+    def reset(self):
+        with self._lock:
+            self._samples, self._peak_rss = {}, {}
+            self._run_peak_rss = current_rss_mb()
+
+    def snapshot(self):
+        """Per-stage call count, total seconds, latency percentiles (ms) and peak RSS (MB)."""
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+            peaks = dict(self._peak_rss)
+        report = {}
+        for name, values in samples.items():
+            report[name] = {
+                "calls": len(values),
+                "total_s": round(sum(values), 4),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "peak_rss_mb": round(peaks.get(name, 0.0), 1),
+            }
+        return report
+
+    def run_peak_rss_mb(self):
+        """Highest RSS seen since the recorder was enabled, in MB."""
+        with self._lock:
+            return self._run_peak_rss
+
+    def stage_started(self, name):
+        rss = current_rss_mb()
+        with self._lock:
+            self._active[name] = self._active.get(name, 0) + 1
+            self._peak_rss[name] = max(self._peak_rss.get(name, 0.0), rss)
+            self._run_peak_rss = max(self._run_peak_rss, rss)
+
+    def stage_finished(self, name, elapsed, labels):
+        rss = current_rss_mb()
+        with self._lock:
+            self._samples.setdefault(name, []).append(elapsed)
+            self._peak_rss[name] = max(self._peak_rss.get(name, 0.0), rss)
+            self._run_peak_rss = max(self._run_peak_rss, rss)
+            self._active[name] -= 1
+            if not self._active[name]:
+                del self._active[name]
+
+    def _sample_rss(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            rss = current_rss_mb()
+            with self._lock:
+                self._run_peak_rss = max(self._run_peak_rss, rss)
+                for name in self._active:
+                    self._peak_rss[name] = max(self._peak_rss.get(name, 0.0), rss)
+
+
+stage_recorder = StageRecorder()
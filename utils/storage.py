@@ -0,0 +1,269 @@
+# utils/storage.py
+
+import os
+import re
+import json
+import fcntl
+import logging
+import tempfile
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+QUOTA_LEDGER_FILE = ".quota.json"
+TEMP_DIRNAME = ".tmp"
+
+# Filesystem types whose pages live in memory only
+RAM_FILESYSTEMS = {"tmpfs", "ramfs"}
+
+
+class StorageError(RuntimeError):
+    """The configured spool can't be used (wrong filesystem, unknown backend)."""
+
+
+class QuotaExceeded(ValueError):
+    """Accepting these bytes would put a session, or the whole spool, over quota."""
+
+
+def filesystem_type(path):
+    """Type of the filesystem holding path (e.g. "ext4", "tmpfs"), from /proc/self/mounts, or None."""
+    path = os.path.realpath(path)
+    best, best_type = "", None
+    try:
+        with open("/proc/self/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # Spaces and tabs in mount points are octal-escaped
+                mount = re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), fields[1])
+                if (path == mount or path.startswith(mount.rstrip("/") + "/")) and len(mount) >= len(best):
+                    best, best_type = mount, fields[2]
+    except OSError:
+        return None
+    return best_type
+
+
+class DiskStorage:
+    """Sessions in a plain directory, UPLOAD_FOLDER (a bind mount in compose)."""
+
+    name = "disk"
+    persistent = True
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    @property
+    def temp_dir(self):
+        """Where temporary files should go instead of the system default, or None to leave it."""
+        return None
+
+    def prepare(self):
+        os.makedirs(self.root, exist_ok=True)
+
+    def capacity_bytes(self):
+        """Hard size of the spool, or None if only the quotas bound it."""
+        return None
+
+
+class TmpfsStorage(DiskStorage):
+    """
+    Sessions on a RAM-backed filesystem (/dev/shm by default).
+
+    Handlers, gpg and the hash stage still get ordinary paths, but no byte
+    of an upload reaches persistent storage: prepare() refuses a root that
+    isn't tmpfs/ramfs, and request spooling and temporary files are moved
+    under the same root. Expired or crashed sessions vanish with the
+    container instead of lingering on the host.
+    """
+
+    name = "tmpfs"
+    persistent = False
+
+    @property
+    def temp_dir(self):
+        return os.path.join(self.root, TEMP_DIRNAME)
+
+    def prepare(self):
+        os.makedirs(self.root, mode=0o700, exist_ok=True)
+        fstype = filesystem_type(self.root)
+        if fstype not in RAM_FILESYSTEMS:
+            raise StorageError(f"{self.root} is on {fstype or 'an unknown filesystem'}, not tmpfs; "
+                               f"mount a tmpfs there or set STORAGE_TMPFS_PATH")
+        os.makedirs(self.temp_dir, mode=0o700, exist_ok=True)
+
+    def capacity_bytes(self):
+        stats = os.statvfs(self.root)
+        return stats.f_blocks * stats.f_frsize
+
+
+STORAGE_BACKENDS = {
+    "disk": DiskStorage,
+    "tmpfs": TmpfsStorage,
+    "memory": TmpfsStorage,
+}
+
+
+def storage_backend(config):
+    """Build the backend named by STORAGE_BACKEND (not yet prepared)."""
+    name = config.get("STORAGE_BACKEND", "disk")
+    backend = STORAGE_BACKENDS.get(name)
+    if backend is None:
+        raise StorageError(f"Unknown STORAGE_BACKEND '{name}' (expected one of {', '.join(STORAGE_BACKENDS)})")
+    if backend is TmpfsStorage:
+        return backend(config.get("STORAGE_TMPFS_PATH", "/dev/shm/rmeta"))
+    return backend(config.get("UPLOAD_FOLDER", "uploads"))
+
+
+class SpoolStorage:
+    """
+    The configured backend plus byte quotas shared by every worker process.
+
+    Bytes accepted into each session are charged to a small ledger file in
+    the spool root, guarded by flock like the admission ledger, so a quota
+    holds across gunicorn workers. Charges are incremental: uploads reserve
+    what they are about to write, archive extraction what it unpacked and
+    the upload job what its scrub, hash, repackage and GPG stages add, and
+    a session's charge is dropped with the session. Entries for session
+    directories that no longer exist are pruned whenever the ledger is
+    opened, so sessions removed by another worker can't leak quota.
+    """
+
+    def __init__(self):
+        self.backend = DiskStorage("uploads")
+        self.session_quota = 0
+        self.total_quota = 0
+
+    def configure(self, backend, session_quota_mb=0, total_quota_mb=0):
+        """
+        Args:
+            backend: A prepared DiskStorage or TmpfsStorage.
+            session_quota_mb: Bytes one session may hold; 0 = unlimited.
+            total_quota_mb: Bytes all sessions together may hold; 0 = the
+                backend's capacity (tmpfs size), else unlimited.
+        """
+        self.backend = backend
+        self.session_quota = session_quota_mb * 1024 * 1024
+        self.total_quota = total_quota_mb * 1024 * 1024 or backend.capacity_bytes() or 0
+        if backend.temp_dir:
+            # Werkzeug's spooled form parts, gpg and handler scratch files
+            # go through tempfile/TMPDIR; keep them in RAM too.
+            tempfile.tempdir = backend.temp_dir
+            os.environ["TMPDIR"] = backend.temp_dir
+        logger.info(f"Spool storage: {backend.name} at {backend.root}"
+                    f" (session quota {session_quota_mb or 'unlimited'}MB,"
+                    f" total {self.total_quota // (1024 * 1024) if self.total_quota else 'unlimited'}MB)")
+
+    @property
+    def root(self):
+        return self.backend.root
+
+    @property
+    def ledger_path(self):
+        return os.path.join(self.root, QUOTA_LEDGER_FILE)
+
+    @contextmanager
+    def _ledger(self):
+        """Open, lock and yield {session_dir: bytes}; it is written back on exit."""
+        fd = os.open(self.ledger_path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(fd, "r+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                try:
+                    ledger = json.loads(f.read() or "{}")
+                except ValueError:
+                    ledger = {}
+                ledger = {k: v for k, v in ledger.items() if os.path.isdir(k)}
+                yield ledger
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(ledger))
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def check(self, nbytes, replacing=None):
+        """
+        Raise QuotaExceeded if a new session of nbytes couldn't fit; nothing is charged.
+
+        For rejecting a request on its Content-Length before the body is
+        read. replacing is a session that will be removed to make room
+        (the uploader's previous one).
+        """
+        if nbytes <= 0 or not (self.session_quota or self.total_quota):
+            return
+        if self.session_quota and nbytes > self.session_quota:
+            raise QuotaExceeded(f"Upload exceeds the {self.session_quota // (1024 * 1024)}MB per-session limit")
+        if self.total_quota:
+            with self._ledger() as ledger:
+                held = sum(ledger.values()) - ledger.get(replacing, 0)
+            if held + nbytes > self.total_quota:
+                raise QuotaExceeded("Server storage is full; try again once other uploads have finished")
+
+    def reserve(self, session_dir, nbytes, output=False):
+        """
+        Charge nbytes to a session before writing them.
+
+        Args:
+            output: The bytes are the job's own output (a repackaged
+                archive, encrypted copies) rather than uploaded data, so
+                only the spool-wide quota applies.
+
+        Raises:
+            QuotaExceeded: The session or the spool as a whole has no room;
+            nothing is charged.
+        """
+        if nbytes <= 0 or not (self.session_quota or self.total_quota):
+            return
+        with self._ledger() as ledger:
+            held = ledger.get(session_dir, 0)
+            if self.session_quota and not output and held + nbytes > self.session_quota:
+                raise QuotaExceeded(f"Upload exceeds the {self.session_quota // (1024 * 1024)}MB per-session limit")
+            if self.total_quota and sum(ledger.values()) + nbytes > self.total_quota:
+                raise QuotaExceeded("Server storage is full; try again once other uploads have finished")
+            ledger[session_dir] = held + nbytes
+
+    def charge(self, session_dir, nbytes):
+        """Record bytes already written (e.g. by archive extraction), without a quota check."""
+        if nbytes <= 0 or not (self.session_quota or self.total_quota):
+            return
+        with self._ledger() as ledger:
+            ledger[session_dir] = ledger.get(session_dir, 0) + nbytes
+
+    def refund(self, session_dir, nbytes):
+        """Return bytes reserved for scratch data that has since been deleted."""
+        if nbytes <= 0 or not (self.session_quota or self.total_quota):
+            return
+        with self._ledger() as ledger:
+            if session_dir in ledger:
+                ledger[session_dir] = max(ledger[session_dir] - nbytes, 0)
+
+    def remaining(self, session_dir):
+        """Bytes the session may still take, or None if no quota applies."""
+        if not (self.session_quota or self.total_quota):
+            return None
+        with self._ledger() as ledger:
+            room = []
+            if self.session_quota:
+                room.append(self.session_quota - ledger.get(session_dir, 0))
+            if self.total_quota:
+                room.append(self.total_quota - sum(ledger.values()))
+            return max(min(room), 0)
+
+    def release(self, session_dir):
+        """Drop a session's charge once its directory is gone."""
+        if not (self.session_quota or self.total_quota) or not os.path.exists(self.ledger_path):
+            return
+        with self._ledger() as ledger:
+            ledger.pop(session_dir, None)
+
+    def stats(self):
+        """Backend and quota figures for /health."""
+        stats = {"backend": self.backend.name, "session_quota_bytes": self.session_quota,
+                 "total_quota_bytes": self.total_quota}
+        if self.session_quota or self.total_quota:
+            with self._ledger() as ledger:
+                stats["reserved_bytes"] = sum(ledger.values())
+        return stats
+
+
+spool = SpoolStorage()
@@ -0,0 +1,269 @@
+# utils/textstream.py
+
+import os
+import re
+import mmap
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from utils.loop import run_on_thread_loop
+from utils.storage import spool, QuotaExceeded
+
+logger = logging.getLogger(__name__)
+
+STREAM_EXTENSIONS = {"txt", "csv"}
+
+# Bytes handed to one worker at a time; ranges end on a line boundary
+RANGE_BYTES = 8 * 1024 * 1024
+# A range with no line end this far past its target size is cut anyway
+MAX_RANGE_FACTOR = 4
+# Ranges in flight per worker, so the next one is ready when a worker frees up
+RANGES_PER_WORKER = 2
+BASE_OVERHEAD_MB = 16
+
+# Any byte that isn't a UTF-8 continuation byte starts a character
+_CHAR_START = re.compile(rb"[^\x80-\xbf]")
+
+# Byte-order marks of encodings whose characters contain NUL or newline bytes
+_WIDE_BOMS = (b"\xff\xfe", b"\xfe\xff")
+
+# "line 12", "row 12" or "lines 12-14" in a handler message; numbered from the range's start
+_POSITION = re.compile(r"\b(lines?|rows?)(\s+)(\d+)(?:(\s*[-\u2013]\s*)(\d+))?", re.IGNORECASE)
+
+# Largest range line_ranges() produces, and so the largest scan scratch file
+MAX_RANGE_BYTES = RANGE_BYTES * MAX_RANGE_FACTOR + 4
+
+
+class TextStreamError(ValueError):
+    """The file isn't line-oriented UTF-8/ASCII text; use the full handler."""
+
+
+def _scan_range(filepath, start, end):
+    """
+    Worker: run the handler's message scan over bytes [start, end) of filepath.
+
+    The handler only takes a path, so the range is copied unchanged to a
+    scratch file next to the input, with the same extension, for the scan.
+    The file is named after the worker process and deleted once the scan
+    is done; a worker runs one range at a time, so no more than one
+    scratch file per worker exists at once.
+
+    Returns:
+        tuple: (lines scanned, handler messages)
+    """
+    from routes import get_handler_for_extension  # Already loaded in the forked parent
+    directory, filename = os.path.split(filepath)
+    ext = os.path.splitext(filename)[1].lower().lstrip(".")
+    handler = get_handler_for_extension(ext)
+    scan = handler.get("get_additional_messages") if handler else None
+    with open(filepath, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            data = mm[start:end]
+        finally:
+            mm.close()
+    if not scan:
+        return data.count(b"\n"), []
+    scratch = os.path.join(directory, f".{filename}.scan{os.getpid()}.{ext}")
+    try:
+        with open(scratch, "wb") as f:
+            f.write(data)
+        if handler.get("msgs_is_async"):
+            return data.count(b"\n"), list(run_on_thread_loop(scan(scratch)))
+        return data.count(b"\n"), list(scan(scratch))
+    finally:
+        if os.path.exists(scratch):
+            os.remove(scratch)
+
+
+def rebase_message(message, line_offset):
+    """Shift line and row numbers in a message scanned from a range by the lines before that range."""
+    if not line_offset or not isinstance(message, str):
+        return message
+
+    def shift(match):
+        word, gap, first, dash, last = match.groups()
+        text = f"{word}{gap}{int(first) + line_offset}"
+        if last:
+            text += f"{dash}{int(last) + line_offset}"
+        return text
+
+    return _POSITION.sub(shift, message)
+
+
+def line_ranges(mm, range_bytes=RANGE_BYTES):
+    """
+    Yield (start, end) slices of about range_bytes, each ending just after
+    a newline or at EOF. A line longer than MAX_RANGE_FACTOR ranges is cut
+    at the next character start instead (at most 3 bytes further), which
+    never splits a UTF-8 character, so no range is ever much bigger than
+    MAX_RANGE_FACTOR * range_bytes.
+    """
+    size, start = len(mm), 0
+    while start < size:
+        target = min(start + range_bytes, size)
+        limit = start + range_bytes * MAX_RANGE_FACTOR
+        newline = mm.find(b"\n", target - 1, limit)
+        if newline >= 0:
+            end = newline + 1
+        elif limit >= size:
+            end = size
+        else:
+            # A UTF-8 character is at most 4 bytes; past that it isn't UTF-8, cut anywhere
+            cut = _CHAR_START.search(mm, limit, min(limit + 4, size))
+            end = cut.start() if cut else min(limit + 4, size)
+        yield start, end
+        start = end
+
+
+def _release_pages(mm, start, end):
+    """Drop already-scanned pages of the input mapping so RSS doesn't grow with the file."""
+    start -= start % mmap.PAGESIZE
+    if end > start:
+        mm.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+class TextStreamer:
+    """
+    Line-range parallel content scan for large TXT/CSV files.
+
+    Plain text carries no embedded metadata, so the handler's scrub leaves
+    its bytes alone; what it can't do is read a multi-GiB file whole for
+    its message scan. The streamer leaves the file untouched and runs that
+    scan instead: the file is memory-mapped and cut into line-aligned
+    ranges of RANGE_BYTES, and worker processes scan ranges in parallel
+    while the results are merged strictly in order. At most
+    RANGES_PER_WORKER ranges per worker are in flight, and pages already
+    merged are released from the mapping, so memory use depends on the
+    worker count, not the file size.
+
+    The worker pool is started lazily, shared by every file in the process
+    and rebuilt after a fork. Workers only run _scan_range, which takes no
+    locks, so forking them from a threaded server is as safe as the
+    process scrub executor.
+    """
+
+    def __init__(self):
+        self.min_bytes = 256 * 1024 * 1024
+        self.workers = 0
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def configure(self, min_mb=256, workers=0):
+        """
+        Args:
+            min_mb: Files at least this big are streamed; 0 = never stream.
+            workers: Worker processes; 0 = one per CPU.
+        """
+        self.min_bytes = min_mb * 1024 * 1024
+        self.workers = workers
+
+    @property
+    def worker_count(self):
+        return self.workers if self.workers > 0 else (os.cpu_count() or 1)
+
+    def applies(self, filepath, size=None):
+        """True if filepath is TXT/CSV and big enough to be streamed."""
+        if not self.min_bytes:
+            return False
+        if os.path.splitext(filepath)[1].lower().lstrip(".") not in STREAM_EXTENSIONS:
+            return False
+        if size is None:
+            try:
+                size = os.path.getsize(filepath)
+            except OSError:
+                return False
+        return size >= self.min_bytes
+
+    def estimate_mb(self):
+        """Peak memory of one streamed file: a copy of every range in flight."""
+        in_flight = self.worker_count * RANGES_PER_WORKER
+        return BASE_OVERHEAD_MB + in_flight * RANGE_BYTES / (1024 * 1024)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.worker_count)
+                self._pid = os.getpid()
+            return self._pool
+
+    def scan(self, filepath):
+        """
+        Run the handler's message scan over a large text file, range by range.
+
+        The file itself is never rewritten, so the streamed path gives the
+        same bytes as the handler's scrub. Line and row numbers in the
+        messages are rebased onto the whole file, and identical messages
+        are reported once. The scratch files (at most one range per
+        worker) are charged to the session's spool quota while the file is
+        scanned; if there is no room, the scan is skipped with a message.
+
+        Returns:
+            dict: {"lines": lines scanned, "ranges": ranges scanned,
+            "messages": handler messages}
+
+        Raises:
+            TextStreamError: The file looks like UTF-16 or binary data.
+        """
+        directory, filename = os.path.split(filepath)
+        window = self.worker_count * RANGES_PER_WORKER
+        stats = {"lines": 0, "ranges": 0, "messages": []}
+
+        with open(filepath, "rb") as src:
+            try:
+                mm = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise TextStreamError("empty file")
+            try:
+                if mm[:2] in _WIDE_BOMS or mm.find(b"\x00", 0, RANGE_BYTES) >= 0:
+                    raise TextStreamError("not UTF-8 or ASCII text")
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+                scratch_bytes = self._reserve_scratch(filepath, stats)
+                if not scratch_bytes:
+                    return stats
+                try:
+                    pool = self._get_pool()
+                    pending = deque()
+                    for start, end in line_ranges(mm):
+                        pending.append((start, end, pool.submit(_scan_range, filepath, start, end)))
+                        if len(pending) >= window:
+                            self._merge_next(mm, pending, stats)
+                    while pending:
+                        self._merge_next(mm, pending, stats)
+                finally:
+                    spool.refund(directory, scratch_bytes)
+            finally:
+                mm.close()
+
+        logger.info(f"Scanned {filename} in {stats['ranges']} ranges: {stats['lines']} lines")
+        return stats
+
+    def _reserve_scratch(self, filepath, stats):
+        """
+        Charge the scan's scratch files to the session before streaming.
+
+        Returns:
+            int: Bytes reserved, or 0 (with a message in stats) if there is no room.
+        """
+        try:
+            nbytes = min(self.worker_count * MAX_RANGE_BYTES, os.path.getsize(filepath))
+            spool.reserve(os.path.dirname(filepath), nbytes, output=True)
+        except (OSError, QuotaExceeded) as e:
+            stats["messages"].append(f"Content checks skipped: no room for their scratch files ({e})")
+            return 0
+        return nbytes
+
+    @staticmethod
+    def _merge_next(mm, pending, stats):
+        start, end, future = pending.popleft()
+        lines, messages = future.result()
+        messages = [rebase_message(m, stats["lines"]) for m in messages]
+        _release_pages(mm, start, end)
+        stats["lines"] += lines
+        stats["ranges"] += 1
+        stats["messages"].extend(m for m in messages if m not in stats["messages"])
+
+
+text_streamer = TextStreamer()
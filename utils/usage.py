@@ -0,0 +1,115 @@
+# utils/usage.py
+
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def _dir_usage(path):
+    """(bytes, files) directly inside a session directory, or None if it's gone."""
+    total = files = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+                    files += 1
+    except OSError:
+        return None
+    return total, files
+
+
+class UsageIndex:
+    """
+    In-memory view of what the upload folder holds, per session.
+
+    Upload, scrub and cleanup code update it as they go so the dirty-state
+    checks on every page render and /status poll are dictionary lookups
+    instead of directory scans. A periodic reconcile against disk corrects
+    any drift, including sessions written by other gunicorn workers.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.last_reconcile = 0.0
+
+    def add_session(self, session_dir):
+        with self._lock:
+            self._sessions.setdefault(session_dir, {"bytes": 0, "files": 0})
+
+    def add_bytes(self, session_dir, nbytes, files=1):
+        with self._lock:
+            entry = self._sessions.setdefault(session_dir, {"bytes": 0, "files": 0})
+            entry["bytes"] += nbytes
+            entry["files"] += files
+
+    def remove_session(self, session_dir):
+        with self._lock:
+            self._sessions.pop(session_dir, None)
+
+    def reconcile_session(self, session_dir):
+        """Re-read one session's usage from disk (e.g. after a scrub rewrote it)."""
+        usage = _dir_usage(session_dir)
+        with self._lock:
+            if usage is None:
+                self._sessions.pop(session_dir, None)
+            else:
+                self._sessions[session_dir] = {"bytes": usage[0], "files": usage[1]}
+        return usage
+
+    def session_has_data(self, session_dir):
+        """
+        True if the session holds files.
+
+        Sessions this process hasn't seen yet are read from disk once and
+        then served from the index.
+        """
+        with self._lock:
+            entry = self._sessions.get(session_dir)
+        if entry is None:
+            usage = self.reconcile_session(session_dir)
+            return bool(usage and usage[1])
+        return entry["files"] > 0
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions)
+
+    def snapshot(self):
+        """Totals across every known session."""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": sum(e["bytes"] for e in self._sessions.values()),
+                "files": sum(e["files"] for e in self._sessions.values()),
+            }
+
+    def reconcile(self, root):
+        """Rebuild the index from the session directories under root."""
+        self.last_reconcile = time.monotonic()
+        fresh = {}
+        try:
+            with os.scandir(os.path.abspath(root)) as entries:
+                session_dirs = [
+                    entry.path for entry in entries
+                    if entry.name.startswith("session_") and entry.is_dir(follow_symlinks=False)
+                ]
+        except OSError as e:
+            logger.warning(f"Usage reconcile could not scan {root}: {e}")
+            return self.snapshot()
+
+        for path in session_dirs:
+            usage = _dir_usage(path)
+            if usage is not None:
+                fresh[path] = {"bytes": usage[0], "files": usage[1]}
+
+        with self._lock:
+            self._sessions = fresh
+        return self.snapshot()
+
+
+usage_index = UsageIndex()